@@ -0,0 +1,75 @@
+"""
+判定服务
+基于 aiohttp 的轻量判定站点，回显请求来源IP和请求头，供验证器判断代理匿名度
+"""
+from aiohttp import web
+from loguru import logger
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from setting import JUDGE_HOST, JUDGE_PORT
+from utils.logger import setup_logger
+
+# /bytes 接口单次返回的最大字节数
+BYTES_MAX = 100 * 1024 * 1024
+# 不可压缩的内容块，避免代理压缩后测得的带宽偏高
+_CHUNK = os.urandom(64 * 1024)
+
+
+async def judge(request):
+    """回显来源IP和请求头 (与 httpbin.org/get 格式兼容)"""
+    return web.json_response({
+        "origin": request.remote,
+        "method": request.method,
+        "headers": dict(request.headers)
+    })
+
+
+async def send_bytes(request):
+    """返回指定字节数的随机内容，供带宽探测下载"""
+    try:
+        size = int(request.match_info['size'])
+    except ValueError:
+        raise web.HTTPBadRequest(text="size must be an integer\n")
+    if not 0 <= size <= BYTES_MAX:
+        raise web.HTTPBadRequest(text=f"size must be between 0 and {BYTES_MAX}\n")
+
+    response = web.StreamResponse(headers={"Content-Type": "application/octet-stream"})
+    response.content_length = size
+    await response.prepare(request)
+    while size > 0:
+        chunk = _CHUNK[:size]
+        await response.write(chunk)
+        size -= len(chunk)
+    await response.write_eof()
+    return response
+
+
+async def health(request):
+    """健康检查"""
+    return web.Response(text="ok\n")
+
+
+def create_app():
+    """创建判定服务应用"""
+    app = web.Application()
+    app.router.add_get('/judge', judge)
+    app.router.add_get('/get', judge)
+    app.router.add_get('/bytes/{size}', send_bytes)
+    app.router.add_get('/health', health)
+    return app
+
+
+def run_judge_server(host=None, port=None):
+    """运行判定服务"""
+    server_host = host or JUDGE_HOST
+    server_port = port or JUDGE_PORT
+
+    logger.info(f"Starting judge server on {server_host}:{server_port}")
+    web.run_app(create_app(), host=server_host, port=server_port, print=None, access_log=None)
+
+
+if __name__ == '__main__':
+    setup_logger('judge')
+    run_judge_server()
@@ -9,10 +9,12 @@ import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from setting import API_HOST, API_PORT
+from setting import API_HOST, API_PORT, VALIDATE_PROFILES
 from db.redis_client import RedisClient
 from utils.logger import setup_logger
 from utils.tools import parse_proxy_string
+from utils.judge import ANONYMITY_LEVELS
+from utils.history import RANK_MODES
 
 # 设置日志
 logger = setup_logger('api')
@@ -39,7 +41,7 @@ def index():
             "/get": {
                 "method": "GET", 
                 "description": "随机获取一个代理 (返回格式: ip:port)",
-                "params": "type (可选): 过滤协议类型 (http, https, socks4, socks5)"
+                "params": "type (可选): 过滤协议类型 (http, https, socks4, socks5); anonymity (可选): 最低匿名度 (transparent, anonymous, elite); rank (可选): 排序方式 (score, success_rate, latency); min_bandwidth (可选): 最低带宽 KB/s; profile (可选): 验证配置档名称"
             },
             "/pop": {
                 "method": "GET",
@@ -60,19 +62,48 @@ def index():
                 "method": "GET",
                 "description": "删除代理 (返回格式: ip:port)",
                 "params": "proxy: 代理地址 (host:port)"
+            },
+            "/status": {
+                "method": "GET",
+                "description": "系统状态 (Redis健康、代理统计、运行指标)",
+                "params": "None"
             }
         },
         "note": "所有代理接口返回格式均为 ip:port，无其他信息"
     })
 
+def bad_request(message, simple):
+    """参数错误响应"""
+    if simple:
+        return Response(f"{message}\n", mimetype='text/plain', status=400)
+    return jsonify({"code": 400, "message": message}), 400
+
 @app.route('/get')
 def get_proxy():
     """随机获取一个代理，只返回 ip:port"""
     proxy_type = request.args.get('type', 'http')
+    anonymity = request.args.get('anonymity')
+    rank = request.args.get('rank', 'score')
+    min_bandwidth = request.args.get('min_bandwidth')
+    profile = request.args.get('profile')
     simple = request.args.get('simple', 'true').lower() == 'true'  # 默认简单模式
     
+    if anonymity and anonymity not in ANONYMITY_LEVELS:
+        return bad_request(f"Invalid anonymity: {anonymity}, expected one of {', '.join(ANONYMITY_LEVELS)}", simple)
+    if rank not in RANK_MODES:
+        return bad_request(f"Invalid rank: {rank}, expected one of {', '.join(RANK_MODES)}", simple)
+    if min_bandwidth is not None:
+        try:
+            min_bandwidth = float(min_bandwidth)
+        except ValueError:
+            return bad_request(f"Invalid min_bandwidth: {min_bandwidth}, expected KB/s as a number", simple)
+    if profile and profile not in VALIDATE_PROFILES:
+        return bad_request(f"Unknown profile: {profile}", simple)
+    
     try:
-        proxy = redis_client.get_random_proxy(proxy_type)
+        proxy = redis_client.get_random_proxy(
+            proxy_type, anonymity=anonymity, rank=rank, min_bandwidth=min_bandwidth, profile=profile
+        )
         if proxy:
             if simple:
                 # 简单模式：直接返回 ip:port
@@ -83,7 +114,10 @@ def get_proxy():
                     "code": 200,
                     "message": "success",
                     "proxy": proxy,
-                    "type": proxy_type
+                    "type": proxy_type,
+                    "anonymity": redis_client.get_proxy_meta(proxy, proxy_type, 'anonymity'),
+                    "quality": redis_client.get_proxy_quality(proxy, proxy_type),
+                    "bandwidth": redis_client.get_proxy_meta(proxy, proxy_type, 'bandwidth')
                 })
         else:
             if simple:
@@ -215,6 +249,24 @@ def get_proxy_count():
             "message": f"Internal server error: {str(e)}"
         }), 500
 
+@app.route('/status')
+def get_status():
+    """系统状态"""
+    try:
+        return jsonify({
+            "code": 200,
+            "message": "success",
+            "redis": redis_client.health_check(),
+            "stats": redis_client.get_stats(),
+            "metrics": redis_client.get_metrics()
+        })
+    except Exception as e:
+        logger.error(f"Error getting status: {e}")
+        return jsonify({
+            "code": 500,
+            "message": f"Internal server error: {str(e)}"
+        }), 500
+
 @app.route('/delete')
 def delete_proxy():
     """删除代理，返回被删除的 ip:port"""
@@ -9,7 +9,8 @@ import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from setting import PROXY_SOURCES
+from setting import PROXY_SOURCES, FETCH_CHUNK_SIZE
+from utils.parser import ProxyListParser, format_ip
 from .proxy import Proxy
 
 
@@ -27,18 +28,16 @@ class ProxyFetcher:
         proxies = []
         try:
             logger.info(f"Fetching proxies from {source['name']}")
-            response = self.session.get(source['url'], timeout=10)
-            response.raise_for_status()
+            with self.session.get(source['url'], timeout=10, stream=True) as response:
+                response.raise_for_status()
+                # 行内的协议前缀优先于源的类型
+                parser = ProxyListParser(source.get('type', 'http'), honor_scheme=True)
+                for chunk in response.iter_content(FETCH_CHUNK_SIZE):
+                    parser.feed(chunk)
+                parser.close()
             
-            for line in response.text.strip().split('\n'):
-                line = line.strip()
-                if line and ':' in line and not line.startswith('#'):
-                    try:
-                        proxy = Proxy.from_string(line, source.get('type', 'http'))
-                        proxies.append(proxy)
-                    except Exception as e:
-                        logger.debug(f"Invalid proxy format: {line}, error: {e}")
-                        continue
+            for ip, port, protocol in parser.entries():
+                proxies.append(Proxy(format_ip(ip), port, protocol))
             
             logger.info(f"Fetched {len(proxies)} proxies from {source['name']}")
             return proxies
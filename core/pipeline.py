@@ -0,0 +1,274 @@
+"""
+代理摄取管道
+新获取的代理先进入隔离区，验证通过后才进入代理池；stream 模式下通过 Redis Stream 消费组传递候选代理和验证结果
+"""
+import asyncio
+import time
+from loguru import logger
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from setting import (
+    INGEST_WORKERS, INGEST_QUEUE_SIZE, INGEST_DRAIN_BATCH, INGEST_PROMOTE_BATCH, VALIDATE_INTERVAL, HTTPS_DETECT,
+    INGEST_MODE, CLUSTER_NODE_ID, JUDGE_EJECT_TIME
+)
+from db.redis_client import RedisClient, make_member, parse_member
+from utils.probe import AUTO_PROTOCOL
+from .proxy import Proxy
+from .validator import ProxyValidator
+
+
+class IngestPipeline:
+    """
+    流式摄取管道
+
+    drain: 从隔离区领取代理放入验证队列，队列满时暂停，积压留在Redis隔离区
+    validate: 多个协程用 ProxyValidator 并发验证，实际并发由验证器的自适应窗口决定
+    promote: 通过验证的代理分批写入代理池，同时结束这批候选代理的租约，异常退出时未写入的候选代理租约到期后重新验证；
+             判定站点故障时无法验证的候选代理放回隔离区，JUDGE_EJECT_TIME 秒后重新验证
+    两个阶段之间是有界队列，下游变慢时上游自动减速。
+
+    stream 模式: drain 通过 ingest 消费组读取候选流，promote 把每个候选代理的验证结果写入结果流并确认候选条目，
+    update 通过 updater 消费组读取结果流分批写入代理池。各节点的管道是同一消费组的不同消费者，
+    节点退出后它未确认的条目超时后由其他节点接管。
+    """
+
+    def __init__(self, redis_client=None, validator=None):
+        self.redis_client = redis_client or RedisClient()
+        self.validator = validator or ProxyValidator()
+        self.running = False
+        self.stream = INGEST_MODE == 'stream'
+        self.consumer = CLUSTER_NODE_ID
+        self.counters = {
+            "drained": 0,
+            "validated": 0,
+            "passed": 0,
+            "failed": 0,
+            "judge_fault": 0,
+            "promoted": 0,
+            "published": 0,
+            "detected": 0,
+            "undetected": 0,
+            "tunnel_capable": 0
+        }
+        self.started_at = time.time()
+        self._validate_queue = None
+        self._promote_queue = None
+
+    async def drain_stage(self):
+        """从隔离区领取代理，验证队列中的每一项带上隔离区成员名，写入结果时结束租约"""
+        while self.running:
+            free = self._validate_queue.maxsize - self._validate_queue.qsize()
+            if free <= 0:
+                await asyncio.sleep(0.1)
+                continue
+
+            proxies = self.redis_client.lease_pending(min(free, INGEST_DRAIN_BATCH))
+            if not proxies:
+                await asyncio.sleep(1)
+                continue
+
+            invalid = []
+            for proxy, protocol in proxies:
+                member = make_member(proxy, protocol)
+                try:
+                    self._validate_queue.put_nowait((Proxy.from_string(proxy, protocol), member))
+                except ValueError as e:
+                    logger.debug(f"Invalid pending proxy {proxy}: {e}")
+                    invalid.append(member)
+            # 无法解析的成员直接结束租约，避免被反复领取
+            self.redis_client.promote_proxies([], leased=invalid)
+            self.counters["drained"] += len(proxies)
+
+    async def stream_drain_stage(self):
+        """stream 模式: 通过消费组读取候选流，阻塞读取在线程中进行，不阻塞事件循环"""
+        stream = self.redis_client.candidates_stream
+        while self.running:
+            free = self._validate_queue.maxsize - self._validate_queue.qsize()
+            if free <= 0:
+                await asyncio.sleep(0.1)
+                continue
+
+            entries = await asyncio.to_thread(
+                self.redis_client.read_stream, stream, 'ingest', self.consumer, min(free, INGEST_DRAIN_BATCH)
+            )
+            invalid = []
+            for entry_id, fields in entries:
+                member = fields.get('member', '')
+                try:
+                    proxy, protocol = parse_member(member)
+                    self._validate_queue.put_nowait((Proxy.from_string(proxy, protocol), (entry_id, member)))
+                except ValueError as e:
+                    logger.debug(f"Invalid candidate {member}: {e}")
+                    invalid.append((entry_id, member, []))
+            # 无法解析的条目直接确认，避免被反复接管
+            self.redis_client.publish_results(invalid)
+            self.counters["drained"] += len(entries)
+
+    async def _validate(self, proxy, precheck=True):
+        """完整验证一个代理，返回通过验证的代理，判定站点故障时返回 None；通过验证的HTTP代理再检测CONNECT隧道"""
+        is_valid, response_time = await self.validator.check(proxy, precheck=precheck)
+        if is_valid is None:
+            self.counters["judge_fault"] += 1
+            return None
+        self.counters["validated"] += 1
+        if not is_valid:
+            self.counters["failed"] += 1
+            return []
+        proxy.response_time = response_time
+        self.counters["passed"] += 1
+        passed = [proxy]
+        
+        if HTTPS_DETECT and proxy.protocol == 'http':
+            tunnel = Proxy(proxy.ip, proxy.port, 'https')
+            is_valid, response_time = await self.validator.check(tunnel, precheck=False)
+            if is_valid:
+                tunnel.response_time = response_time
+                self.counters["tunnel_capable"] += 1
+                passed.append(tunnel)
+        return passed
+    
+    async def _check(self, proxy):
+        """验证一个候选代理，协议未知的先探测协议，再按每个实际协议验证；任一协议遇到判定站点故障时返回 None"""
+        if proxy.protocol != AUTO_PROTOCOL:
+            return await self._validate(proxy)
+        
+        protocols = await self.validator.detect(proxy)
+        if not protocols:
+            self.counters["undetected"] += 1
+            return []
+        self.counters["detected"] += 1
+        passed = []
+        for protocol in protocols:
+            result = await self._validate(Proxy(proxy.ip, proxy.port, protocol), precheck=False)
+            if result is None:
+                return None
+            passed += result
+        return passed
+    
+    async def validate_stage(self):
+        """验证代理，每个候选代理放入写入队列一项 (隔离区成员名或候选条目, 通过验证的代理或 None)"""
+        while True:
+            proxy, entry = await self._validate_queue.get()
+            passed = []
+            try:
+                passed = await self._check(proxy)
+            except Exception as e:
+                logger.error(f"Error validating pending proxy {proxy}: {e}")
+            finally:
+                # 放入下一阶段后才标记完成，保证退出时不丢失已通过的代理
+                await self._promote_queue.put((entry, passed))
+                self._validate_queue.task_done()
+
+    async def promote_stage(self):
+        """
+        分批写入代理池；stream 模式下分批写入结果流并确认候选条目
+
+        判定站点故障的候选代理不写入结果: 普通模式放回隔离区，stream 模式不确认，超时后重新领取
+        """
+        while True:
+            items = [await self._promote_queue.get()]
+            while len(items) < INGEST_PROMOTE_BATCH and not self._promote_queue.empty():
+                items.append(self._promote_queue.get_nowait())
+            batch = [(entry, passed) for entry, passed in items if passed is not None]
+            faulted = [entry for entry, passed in items if passed is None]
+
+            if self.stream:
+                self.counters["published"] += self.redis_client.publish_results([
+                    (entry_id, member, [
+                        {'proxy': proxy.address, 'protocol': proxy.protocol, 'anonymity': proxy.anonymity}
+                        for proxy in passed
+                    ])
+                    for (entry_id, member), passed in batch
+                ])
+            else:
+                self.counters["promoted"] += self.redis_client.promote_proxies([
+                    {'proxy': proxy.address, 'protocol': proxy.protocol, 'anonymity': proxy.anonymity}
+                    for _, passed in batch for proxy in passed
+                ], leased=[member for member, _ in batch])
+                self.redis_client.requeue_pending(faulted, JUDGE_EJECT_TIME)
+            for _ in items:
+                self._promote_queue.task_done()
+
+    async def update_stage(self):
+        """stream 模式: 通过 updater 消费组读取结果流，分批写入代理池，写入和确认在同一事务中"""
+        stream = self.redis_client.results_stream
+        while self.running:
+            entries = await asyncio.to_thread(
+                self.redis_client.read_stream, stream, 'updater', self.consumer, INGEST_PROMOTE_BATCH
+            )
+            if not entries:
+                continue
+            self.counters["promoted"] += self.redis_client.promote_proxies(
+                [fields for _, fields in entries], ack=[entry_id for entry_id, _ in entries]
+            )
+
+    def stats(self):
+        """各阶段吞吐和队列深度"""
+        elapsed = max(time.time() - self.started_at, 1)
+        stats = {f"{name}_per_min": round(count * 60 / elapsed, 1) for name, count in self.counters.items()}
+        stats.update(self.counters)
+        stats["pending"] = self.redis_client.get_pending_count()
+        stats["validate_queue"] = self._validate_queue.qsize() if self._validate_queue else 0
+        stats["promote_queue"] = self._promote_queue.qsize() if self._promote_queue else 0
+        stats["window"] = self.validator.concurrency.window
+        if self.stream:
+            stats.update(self.redis_client.get_stream_stats())
+        return stats
+
+    async def run(self):
+        """运行摄取管道直到停止"""
+        if not self.redis_client.redis:
+            logger.error("Redis not connected, cannot run ingest pipeline")
+            return
+
+        self.redis_client.migrate_mixed_pool()
+        if self.stream:
+            self.redis_client.ensure_stream_groups()
+        self.running = True
+        self._validate_queue = asyncio.Queue(maxsize=INGEST_QUEUE_SIZE)
+        self._promote_queue = asyncio.Queue(maxsize=INGEST_QUEUE_SIZE)
+        await self.validator.discover_real_ip()
+
+        workers = [asyncio.create_task(self.validate_stage()) for _ in range(INGEST_WORKERS)]
+        promoter = asyncio.create_task(self.promote_stage())
+        logger.info(f"Ingest pipeline started ({INGEST_MODE} mode)")
+
+        drainer = asyncio.create_task(self.stream_drain_stage() if self.stream else self.drain_stage())
+        updater = asyncio.create_task(self.update_stage()) if self.stream else None
+        last_report = time.time()
+        try:
+            while self.running:
+                await asyncio.sleep(1)
+                if time.time() - last_report < VALIDATE_INTERVAL:
+                    continue
+                last_report = time.time()
+                stats = self.stats()
+                self.redis_client.set_metrics('ingest', stats)
+                logger.info(
+                    f"Ingest: {stats['passed']}/{stats['validated']} passed, "
+                    f"{stats['promoted']} promoted, {stats['pending']} pending"
+                )
+        finally:
+            self.running = False
+            await drainer
+            # 处理完已取出的代理再退出
+            await self._validate_queue.join()
+            await self._promote_queue.join()
+            if updater:
+                await updater
+            for task in workers + [promoter]:
+                task.cancel()
+            await asyncio.gather(*workers, promoter, return_exceptions=True)
+            await self.validator.close()
+            self.redis_client.set_metrics('ingest', self.stats())
+            logger.info("Ingest pipeline stopped")
+
+    def run_forever(self):
+        """在新事件循环中运行摄取管道"""
+        asyncio.run(self.run())
+
+    def stop(self):
+        """停止摄取管道"""
+        self.running = False
@@ -19,6 +19,7 @@ class Proxy:
         self.response_time: Optional[float] = None
         self.country: Optional[str] = None
         self.anonymous: bool = False
+        self.anonymity: Optional[str] = None  # transparent, anonymous, elite
     
     @property
     def address(self) -> str:
@@ -60,7 +61,8 @@ class Proxy:
             "last_checked": self.last_checked.isoformat() if self.last_checked else None,
             "response_time": self.response_time,
             "country": self.country,
-            "anonymous": self.anonymous
+            "anonymous": self.anonymous,
+            "anonymity": self.anonymity
         }
     
     def __str__(self) -> str:
@@ -3,13 +3,20 @@
 """
 import aiohttp
 import asyncio
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 from loguru import logger
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from setting import VALIDATE_TIMEOUT, VALIDATE_URLS
+from setting import (
+    VALIDATE_TIMEOUT, PRECHECK_ENABLED, PRECHECK_CONCURRENCY, HTTPS_JUDGE_URL
+)
+from utils.concurrency import AdaptiveConcurrency, fd_limited_window
+from utils.probe import tcp_precheck, detect_protocols
+from utils.transport import ValidationTransport, request_ssl
+from utils.judge import classify_anonymity
+from utils.judge_pool import JudgePool
 from .proxy import Proxy
 
 
@@ -18,72 +25,135 @@ class ProxyValidator:
     
     def __init__(self):
         self.timeout = aiohttp.ClientTimeout(total=VALIDATE_TIMEOUT)
-        self.test_urls = VALIDATE_URLS
+        # 验证请求按权重分散到判定站点池
+        self.judges = JudgePool.from_settings()
+        self.real_ip = None
+        self.concurrency = AdaptiveConcurrency()
+        self.transport = ValidationTransport()
+        self._precheck_semaphore = None
+        self._precheck_loop = None
     
-    async def validate_single(self, proxy: Proxy, test_url: str) -> Tuple[bool, float]:
+    async def discover_real_ip(self):
+        """直连回显站点获取本机公网IP"""
+        if not self.real_ip:
+            self.real_ip = await self.judges.discover_real_ip(self.transport.session)
+        return self.real_ip
+    
+    async def validate_single(self, proxy: Proxy, test_url: str, session=None, proxy_url=None) -> Tuple[bool, float]:
         """验证单个代理"""
         try:
-            connector = aiohttp.TCPConnector(ssl=False)
+            if session is None:
+                async with self.transport.open(proxy.address, proxy.protocol) as (session, proxy_url):
+                    return await self.validate_single(proxy, test_url, session, proxy_url)
+            
+            start_time = asyncio.get_event_loop().time()
             
-            async with aiohttp.ClientSession(
-                connector=connector,
-                timeout=self.timeout
-            ) as session:
-                start_time = asyncio.get_event_loop().time()
+            async with session.get(test_url, proxy=proxy_url, ssl=request_ssl(proxy.protocol)) as response:
+                if response.status != 200:
+                    return False, asyncio.get_event_loop().time() - start_time
                 
-                async with session.get(
-                    test_url,
-                    proxy=proxy.url,
-                    headers={"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
-                ) as response:
-                    response_time = asyncio.get_event_loop().time() - start_time
-                    
-                    if response.status == 200:
-                        return True, response_time
-                    else:
-                        return False, response_time
+                if self.judges.is_echo(test_url):
+                    payload = await response.json(content_type=None)
+                    proxy.anonymity = classify_anonymity(payload, self.real_ip)
+                    proxy.anonymous = proxy.anonymity != 'transparent'
+                elif proxy.protocol == 'https':
+                    # 证书校验通过的CONNECT隧道内代理无法添加请求头，目标看到的来源是代理IP
+                    proxy.anonymity = 'elite'
+                    proxy.anonymous = True
+                
+                return True, asyncio.get_event_loop().time() - start_time
         except Exception as e:
             logger.debug(f"Proxy validation failed: {e}")
             return False, float('inf')
     
-    async def validate_proxy(self, proxy: Proxy) -> Tuple[bool, float]:
-        """全面验证代理"""
-        success_count = 0
-        total_time = 0.0
+    def urls_for(self, protocol: str) -> List[str]:
+        """验证地址: https 经CONNECT隧道访问TLS判定站点，其余从判定站点池中轮询选2个"""
+        if protocol == 'https':
+            return [HTTPS_JUDGE_URL]
+        return self.judges.pick(2)
+    
+    async def validate_proxy(self, proxy: Proxy) -> Tuple[Optional[bool], float]:
+        """
+        全面验证代理: 2个判定站点并发检查，首个成功结果即返回
         
-        for i in range(min(2, len(self.test_urls))):
-            test_url = self.test_urls[i]
-            success, response_time = await self.validate_single(proxy, test_url)
-            
-            if success:
-                success_count += 1
-                total_time += response_time
+        没有可用的判定站点，或失败时用到的站点都已被剔除，返回 (None, inf)，表示判定站点故障，与代理无关
+        """
+        await self.judges.maybe_check_health(self.transport.session)
+        urls = self.urls_for(proxy.protocol)
+        if not urls:
+            return None, float('inf')
         
-        if success_count > 0:
-            return True, total_time / success_count
-        else:
-            return False, float('inf')
+        async def attempt(test_url):
+            success, response_time = await self.validate_single(proxy, test_url, session, proxy_url)
+            self.judges.record(test_url, success)
+            return success, response_time
+        
+        async with self.transport.open(proxy.address, proxy.protocol) as (session, proxy_url):
+            tasks = [asyncio.ensure_future(attempt(test_url)) for test_url in urls]
+            try:
+                for future in asyncio.as_completed(tasks):
+                    success, response_time = await future
+                    if success:
+                        return True, response_time
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        
+        if not any(self.judges.healthy(test_url) for test_url in urls):
+            return None, float('inf')
+        return False, float('inf')
+    
+    def _get_precheck_semaphore(self):
+        """预检和协议探测使用独立的并发预算"""
+        loop = asyncio.get_running_loop()
+        if self._precheck_loop is not loop:
+            self._precheck_loop = loop
+            self._precheck_semaphore = asyncio.Semaphore(min(PRECHECK_CONCURRENCY, fd_limited_window()))
+        return self._precheck_semaphore
+    
+    async def detect(self, proxy: Proxy) -> List[str]:
+        """探测代理实际支持的协议，兼作TCP预检"""
+        async with self._get_precheck_semaphore():
+            protocols, _, _ = await detect_protocols(proxy.ip, proxy.port)
+        return protocols
+    
+    async def check(self, proxy: Proxy, precheck: bool = True) -> Tuple[Optional[bool], float]:
+        """
+        两阶段验证单个代理: TCP预检通过后在自适应并发窗口内完整验证，已探测过协议的代理可跳过预检
+        
+        判定站点故障时结果为 None，见 validate_proxy
+        """
+        if PRECHECK_ENABLED and precheck:
+            async with self._get_precheck_semaphore():
+                outcome, _ = await tcp_precheck(proxy.ip, proxy.port, proxy.protocol)
+            if outcome != 'success':
+                return False, float('inf')
+        
+        async with self.concurrency.slot():
+            return await self.validate_proxy(proxy)
+    
+    async def close(self):
+        """释放并发控制器和传输层"""
+        await self.concurrency.stop()
+        await self.transport.close()
     
     async def validate_proxies(self, proxies: List[Proxy]) -> List[Proxy]:
         """批量验证代理"""
         valid_proxies = []
+        await self.discover_real_ip()
         
-        # 限制并发数
-        semaphore = asyncio.Semaphore(20)
-        
-        async def validate_with_semaphore(proxy: Proxy) -> Tuple[Proxy, bool, float]:
-            async with semaphore:
-                is_valid, response_time = await self.validate_proxy(proxy)
-                return proxy, is_valid, response_time
-        
-        tasks = [validate_with_semaphore(proxy) for proxy in proxies]
-        results = await asyncio.gather(*tasks)
+        tasks = [self.check(proxy) for proxy in proxies]
+        try:
+            results = await asyncio.gather(*tasks)
+        finally:
+            await self.close()
         
-        for proxy, is_valid, response_time in results:
+        for proxy, (is_valid, response_time) in zip(proxies, results):
             if is_valid:
                 proxy.response_time = response_time
                 valid_proxies.append(proxy)
                 logger.debug(f"Valid proxy: {proxy}")
         
         logger.info(f"Validation completed: {len(valid_proxies)}/{len(proxies)} valid")
-        return valid_proxies
\ No newline at end of file
+        return valid_proxies
@@ -0,0 +1,114 @@
+"""
+异步Redis客户端
+供多进程验证工作者在各自的事件循环中写入验证结果
+"""
+import redis.asyncio as aioredis
+from loguru import logger
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from setting import REDIS_HOST, REDIS_PORT, REDIS_PASSWORD, REDIS_DB, REDIS_KEY, DUE_LEASE
+from db.redis_client import RedisKeysMixin
+
+
+class AsyncRedisClient(RedisKeysMixin):
+    """异步Redis客户端"""
+    
+    def __init__(self):
+        self.key_prefix = REDIS_KEY
+        self.redis = aioredis.Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            password=REDIS_PASSWORD if REDIS_PASSWORD else None,
+            db=REDIS_DB,
+            decode_responses=True,
+            socket_timeout=5,
+            socket_connect_timeout=5
+        )
+    
+    async def apply_results(self, results):
+        """批量写入验证结果，逻辑与 RedisClient.apply_results 相同"""
+        try:
+            if not results:
+                return 0
+            
+            pipe = self.redis.pipeline(transaction=False)
+            self._queue_state_reads(pipe, results)
+            state = await pipe.execute()
+            
+            pipe = self.redis.pipeline(transaction=False)
+            applied = self._queue_result_writes(pipe, results, state)
+            await pipe.execute()
+            
+            return applied
+        except Exception as e:
+            logger.error(f"Error applying results: {e}")
+            return 0
+    
+    async def renew_due_lease(self, proxies, lease=DUE_LEASE, profile=None):
+        """为仍在验证中的代理续租，逻辑与 RedisClient.renew_due_lease 相同"""
+        try:
+            if not proxies:
+                return False
+            
+            pipe = self.redis.pipeline(transaction=False)
+            self._queue_lease_renewal(pipe, proxies, lease, profile)
+            await pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error renewing due lease: {e}")
+            return False
+    
+    async def bandwidth_candidates(self, results):
+        """从验证结果中选出需要带宽探测的代理，逻辑与 RedisClient.bandwidth_candidates 相同"""
+        try:
+            if not results:
+                return []
+            
+            pipe = self.redis.pipeline(transaction=False)
+            passed = self._queue_bandwidth_reads(pipe, results)
+            if not passed:
+                return []
+            return self._select_bandwidth_candidates(passed, await pipe.execute())
+        except Exception as e:
+            logger.error(f"Error selecting bandwidth candidates: {e}")
+            return []
+    
+    async def save_bandwidth(self, results):
+        """写入带宽探测结果，逻辑与 RedisClient.save_bandwidth 相同"""
+        try:
+            if not results:
+                return 0
+            
+            pipe = self.redis.pipeline(transaction=False)
+            for result in results:
+                pipe.zscore(self._get_key(result['protocol']), result['proxy'])
+            scores = await pipe.execute()
+            
+            pipe = self.redis.pipeline(transaction=False)
+            written = self._queue_bandwidth_writes(pipe, results, scores)
+            await pipe.execute()
+            return written
+        except Exception as e:
+            logger.error(f"Error saving bandwidth: {e}")
+            return 0
+    
+    async def tunnel_candidates(self, results):
+        """从验证结果中选出需要检测CONNECT隧道的HTTP代理，逻辑与 RedisClient.tunnel_candidates 相同"""
+        try:
+            if not results:
+                return []
+            
+            pipe = self.redis.pipeline(transaction=False)
+            passed = self._queue_tunnel_reads(pipe, results)
+            if not passed:
+                return []
+            return self._select_tunnel_candidates(passed, await pipe.execute())
+        except Exception as e:
+            logger.error(f"Error selecting tunnel candidates: {e}")
+            return []
+    
+    async def close(self):
+        """关闭连接"""
+        await self.redis.aclose()
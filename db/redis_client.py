@@ -2,16 +2,363 @@
 Redis数据库客户端
 新增pop_proxy方法支持获取并删除代理
 """
+import hashlib
+import random
 import redis
+import time
 from loguru import logger
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from setting import REDIS_HOST, REDIS_PORT, REDIS_PASSWORD, REDIS_DB, REDIS_KEY
+from setting import (
+    REDIS_HOST, REDIS_PORT, REDIS_PASSWORD, REDIS_DB, REDIS_KEY, DUE_LEASE, PROXY_SCORE_INIT,
+    RANK_CANDIDATES, RANK_TOP, BANDWIDTH_MIN_SCORE, BANDWIDTH_INTERVAL, HTTPS_RECHECK_INTERVAL,
+    VALIDATE_PROFILES, CLUSTER_ENABLED, CLUSTER_NODE_ID, CLUSTER_SLOTS, INGEST_MODE, STREAM_BLOCK, STREAM_CLAIM_IDLE,
+    STREAM_MAXLEN, PENDING_LEASE
+)
+from utils.scoring import next_score, retest_interval, result_outcome, SUCCESS_OUTCOMES, NEUTRAL_OUTCOMES
+from utils.judge import anonymity_at_least
+from utils import history
+from utils.probe import AUTO_PROTOCOL
+from utils.tracing import encode_phases, decode_phases, blend_phases
 
+# 按成员名存储的代理元数据，删除代理时一并清理
+# history: 最近64次检查结果位图; checks: 累计检查次数; latency: 最近16次延迟分桶;
+# timing: 各阶段耗时的滑动平均(毫秒，逗号分隔); bandwidth: 最近一次带宽探测(KB/s); bandwidth_at: 探测时间;
+# tunnel_at: HTTP代理最近一次CONNECT隧道检测时间; source: 最先列出该代理的代理源
+META_FIELDS = (
+    'first_seen', 'fails', 'anonymity', 'history', 'checks', 'latency', 'timing', 'bandwidth', 'bandwidth_at',
+    'tunnel_at', 'source'
+)
+HISTORY_FIELDS = ('history', 'checks', 'latency', 'timing')
 
-class RedisClient:
+# 原子地领取到期代理，并把它们的到期时间推迟到租约结束
+CLAIM_DUE_SCRIPT = """
+local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, member in ipairs(items) do
+    redis.call('ZADD', KEYS[1], 'XX', ARGV[3], member)
+end
+return items
+"""
+
+# 集群模式下从本节点各哈希槽的到期队列中领取，从第 ARGV[4] 个键开始轮流，
+# 每次领取的起点随机，各槽的积压被均匀消化
+CLAIM_DUE_SLOTS_SCRIPT = """
+local limit, start = tonumber(ARGV[2]), tonumber(ARGV[4])
+local claimed = {}
+for i = 0, #KEYS - 1 do
+    local key = KEYS[(start + i) % #KEYS + 1]
+    local items = redis.call('ZRANGEBYSCORE', key, '-inf', ARGV[1], 'LIMIT', 0, limit - #claimed)
+    for _, member in ipairs(items) do
+        redis.call('ZADD', key, 'XX', ARGV[3], member)
+        claimed[#claimed + 1] = member
+    end
+    if #claimed >= limit then
+        break
+    end
+end
+return claimed
+"""
+
+# 获取或续期主节点租约: 已是主节点时续期，否则在租约空闲时获取
+ACQUIRE_LEADER_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 1
+end
+return 0
+"""
+
+# 只释放自己持有的租约
+RELEASE_LEADER_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# 从隔离区领取待验证代理: 先接管租约已到期的，再按入队顺序取出到期的新代理，一并移入领取中的有序集合，
+# 分数为租约到期时间；ARGV: 当前时间、数量、租约到期时间
+LEASE_PENDING_SCRIPT = """
+local count = tonumber(ARGV[2])
+local items = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1], 'LIMIT', 0, count)
+if #items < count then
+    local fresh = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, count - #items)
+    for _, member in ipairs(fresh) do
+        redis.call('ZREM', KEYS[1], member)
+        items[#items + 1] = member
+    end
+end
+for _, member in ipairs(items) do
+    redis.call('ZADD', KEYS[2], ARGV[3], member)
+end
+return items
+"""
+
+# stream 模式: 把新代理加入隔离区，只为新加入的成员写入候选流，两者原子完成
+# ARGV[1] 为候选流长度上限，之后每两个参数为 成员名、入队时间戳
+PUBLISH_CANDIDATES_SCRIPT = """
+local added = 0
+for i = 2, #ARGV, 2 do
+    if redis.call('ZADD', KEYS[1], 'NX', ARGV[i + 1], ARGV[i]) == 1 then
+        redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[1], '*', 'member', ARGV[i])
+        added = added + 1
+    end
+end
+return added
+"""
+
+
+def make_member(proxy, protocol):
+    """代理在到期队列等全局结构中的成员名"""
+    return f"{protocol}://{proxy}"
+
+
+def parse_member(member):
+    """解析成员名，返回 (proxy, protocol)"""
+    protocol, proxy = member.split('://', 1)
+    return proxy, protocol
+
+
+def due_slot(proxy):
+    """代理所在的哈希槽: sha1(ip:port) 前16位对 CLUSTER_SLOTS 取模，同一地址的各协议在同一个槽"""
+    return int(hashlib.sha1(proxy.encode()).hexdigest()[:4], 16) % CLUSTER_SLOTS
+
+
+class RedisKeysMixin:
+    """
+    键名和验证结果写入逻辑
+    
+    只向管道追加命令、不执行I/O，同步和异步客户端共用
+    """
+    
+    key_prefix = REDIS_KEY
+    
+    def _get_key(self, protocol):
+        """获取Redis键名"""
+        return f"{self.key_prefix}:{protocol}"
+    
+    def _meta_key(self, name):
+        """获取代理元数据键名(哈希表，字段为成员名)"""
+        return f"{self.key_prefix}:meta:{name}"
+    
+    def _profile_key(self, name, protocol):
+        """配置档代理池键名(有序集合，分数为该配置档下的质量分数)"""
+        return f"{self.key_prefix}:profile:{name}:{protocol}"
+    
+    def _profile_due_key(self, name):
+        """配置档到期队列键名"""
+        return f"{self.key_prefix}:profile:{name}:due"
+    
+    def _source_key(self, name):
+        """代理源状态键名(哈希表: etag、last_modified、内容哈希、产出计数等)"""
+        return f"{self.key_prefix}:source:{name}"
+    
+    def _source_members_key(self, name):
+        """代理源上一次列出的代理(集合，成员为 {协议}://ip:port)"""
+        return f"{self.key_prefix}:source:{name}:members"
+    
+    def _source_suppressed_key(self, name):
+        """代理源列出但在墓碑期内被拦下的代理(有序集合，分数为墓碑过期时间)"""
+        return f"{self.key_prefix}:source:{name}:suppressed"
+    
+    @property
+    def due_key(self):
+        """到期队列键名(有序集合，分数为下次验证时间戳)"""
+        return f"{self.key_prefix}:due"
+    
+    def _due_key(self, member, profile=None):
+        """
+        成员所在的到期队列键名
+        
+        集群模式下每个哈希槽一个有序集合({到期队列}:{槽号})，节点领取时只读取自己槽的键
+        """
+        key = self._profile_due_key(profile) if profile else self.due_key
+        if CLUSTER_ENABLED:
+            return f"{key}:{due_slot(parse_member(member)[0])}"
+        return key
+    
+    def _due_keys(self, profile=None, slots=None):
+        """到期队列的全部键名，集群模式下为 slots 指定的(默认全部)哈希槽的键"""
+        key = self._profile_due_key(profile) if profile else self.due_key
+        if not CLUSTER_ENABLED:
+            return [key]
+        return [f"{key}:{slot}" for slot in (range(CLUSTER_SLOTS) if slots is None else slots)]
+    
+    @property
+    def pending_key(self):
+        """待验证隔离区键名(有序集合，分数为入队时间戳)"""
+        return f"{self.key_prefix}:pending"
+    
+    @property
+    def leased_pending_key(self):
+        """已从隔离区领取、验证结果尚未写入的代理(有序集合，分数为租约到期时间戳)"""
+        return f"{self.key_prefix}:pending:leased"
+    
+    @property
+    def origin_key(self):
+        """待验证代理的来源(哈希表，字段为 ip:port，值为代理源名称)"""
+        return f"{self.key_prefix}:origin"
+    
+    @property
+    def tombstone_key(self):
+        """最近被清理的代理(有序集合，成员为 ip:port，分数为过期时间戳)"""
+        return f"{self.key_prefix}:tombstone"
+    
+    @property
+    def survival_key(self):
+        """待统计存活的新入池代理(有序集合，分数为入池时间戳)"""
+        return f"{self.key_prefix}:survival"
+    
+    @property
+    def candidates_stream(self):
+        """候选流(Stream，字段 member 为隔离区成员名)，stream 模式下由摄取管道的 ingest 消费组读取"""
+        return f"{self.key_prefix}:stream:candidates"
+    
+    @property
+    def results_stream(self):
+        """验证结果流(Stream，字段 proxy、protocol、anonymity)，由 updater 消费组写入代理池"""
+        return f"{self.key_prefix}:stream:results"
+    
+    @property
+    def nodes_key(self):
+        """集群存活节点(有序集合，成员为节点ID，分数为最近一次心跳时间戳)"""
+        return f"{self.key_prefix}:cluster:nodes"
+    
+    @property
+    def leader_key(self):
+        """集群主节点租约(字符串，值为主节点ID)"""
+        return f"{self.key_prefix}:cluster:leader"
+    
+    STATE_READS = 6
+    
+    def _queue_state_reads(self, pipe, results):
+        """追加读取验证结果相关状态的命令，每个结果 STATE_READS 条"""
+        for result in results:
+            member = make_member(result['proxy'], result['protocol'])
+            pipe.zscore(self._get_key(result['protocol']), result['proxy'])
+            pipe.hget(self._meta_key('fails'), member)
+            pipe.hget(self._meta_key('first_seen'), member)
+            pipe.hget(self._meta_key('history'), member)
+            pipe.hget(self._meta_key('latency'), member)
+            pipe.hget(self._meta_key('timing'), member)
+    
+    def _queue_result_writes(self, pipe, results, state):
+        """根据读取到的状态追加写入命令，返回写入的结果数量"""
+        now = time.time()
+        applied = 0
+        for i, result in enumerate(results):
+            member = make_member(result['proxy'], result['protocol'])
+            score, fails, first_seen, bits, latency, timing = state[i * self.STATE_READS:(i + 1) * self.STATE_READS]
+            if result.get('tunnel_probe'):
+                # HTTP代理的隧道检测: 支持CONNECT的加入https池，作为新代理等待首次复检
+                pipe.hset(self._meta_key('tunnel_at'), make_member(result['proxy'], 'http'), int(now))
+                if result['success'] and score is None:
+                    pipe.zadd(self._get_key(result['protocol']), {result['proxy']: PROXY_SCORE_INIT}, nx=True)
+                    pipe.zadd(self._due_key(member), {member: now + retest_interval(PROXY_SCORE_INIT, 0, 0)}, nx=True)
+                    pipe.hsetnx(self._meta_key('first_seen'), member, int(now))
+                    if result.get('anonymity'):
+                        pipe.hset(self._meta_key('anonymity'), member, result['anonymity'])
+                    applied += 1
+                continue
+            if score is None:
+                # 验证期间代理已被删除
+                pipe.zrem(self._due_key(member), member)
+                continue
+            
+            outcome = result_outcome(result)
+            age = now - float(first_seen or now)
+            if outcome in NEUTRAL_OUTCOMES:
+                # 与代理无关的失败: 分数、连续失败次数和检查历史都不变，按原节奏复检
+                pipe.zadd(self._due_key(member), {member: now + retest_interval(score, age, int(fails or 0))})
+                applied += 1
+                continue
+            
+            new_score = next_score(score, outcome)
+            fail_streak = 0 if outcome in SUCCESS_OUTCOMES else int(fails or 0) + 1
+            
+            pipe.zadd(self._get_key(result['protocol']), {result['proxy']: new_score}, xx=True)
+            if fail_streak:
+                pipe.hset(self._meta_key('fails'), member, fail_streak)
+            else:
+                pipe.hdel(self._meta_key('fails'), member)
+            pipe.zadd(self._due_key(member), {member: now + retest_interval(new_score, age, fail_streak)})
+            if result.get('anonymity'):
+                pipe.hset(self._meta_key('anonymity'), member, result['anonymity'])
+            
+            # 滚动检查历史
+            success = outcome in SUCCESS_OUTCOMES
+            bits = history.push_outcome(history.from_signed(bits), success)
+            pipe.hset(self._meta_key('history'), member, history.to_signed(bits))
+            pipe.hincrby(self._meta_key('checks'), member, 1)
+            if success and result.get('response_time') is not None:
+                latency = history.push_latency(history.from_signed(latency), result['response_time'])
+                pipe.hset(self._meta_key('latency'), member, history.to_signed(latency))
+            if success and result.get('timings'):
+                timing = blend_phases(decode_phases(timing), result['timings'])
+                pipe.hset(self._meta_key('timing'), member, encode_phases(timing))
+            applied += 1
+        return applied
+    
+    def _queue_bandwidth_writes(self, pipe, results, scores):
+        """追加写入带宽探测结果的命令，探测期间已被删除的代理跳过，scores 为各结果在代理池中的分数"""
+        now = time.time()
+        written = 0
+        for result, score in zip(results, scores):
+            if score is None or result.get('bandwidth') is None:
+                continue
+            member = make_member(result['proxy'], result['protocol'])
+            pipe.hset(self._meta_key('bandwidth'), member, round(result['bandwidth'], 1))
+            pipe.hset(self._meta_key('bandwidth_at'), member, int(now))
+            written += 1
+        return written
+    
+    def _queue_lease_renewal(self, pipe, proxies, lease, profile=None):
+        """把仍在验证中的代理的到期时间推迟到新租约结束，已被删除的代理不会重新加入"""
+        until = time.time() + lease
+        for proxy, protocol in proxies:
+            member = make_member(proxy, protocol)
+            pipe.zadd(self._due_key(member, profile), {member: until}, xx=True)
+    
+    def _queue_bandwidth_reads(self, pipe, results):
+        """追加读取带宽探测条件的命令，每个通过验证的结果2条"""
+        passed = [result for result in results if result['success']]
+        for result in passed:
+            pipe.zscore(self._get_key(result['protocol']), result['proxy'])
+            pipe.hget(self._meta_key('bandwidth_at'), make_member(result['proxy'], result['protocol']))
+        return passed
+    
+    def _queue_tunnel_reads(self, pipe, results):
+        """追加读取隧道检测条件的命令，每个通过验证的HTTP代理2条"""
+        passed = [result for result in results if result['success'] and result['protocol'] == 'http']
+        for result in passed:
+            pipe.zscore(self._get_key('https'), result['proxy'])
+            pipe.hget(self._meta_key('tunnel_at'), make_member(result['proxy'], 'http'))
+        return passed
+    
+    def _select_tunnel_candidates(self, passed, state):
+        """选出不在https池中且超过 HTTPS_RECHECK_INTERVAL 未检测的HTTP代理"""
+        now = time.time()
+        return [
+            result['proxy'] for result, score, probed_at in zip(passed, state[0::2], state[1::2])
+            if score is None and now - float(probed_at or 0) >= HTTPS_RECHECK_INTERVAL
+        ]
+    
+    def _select_bandwidth_candidates(self, passed, state):
+        """选出分数达到 BANDWIDTH_MIN_SCORE 且超过 BANDWIDTH_INTERVAL 未探测的结果"""
+        now = time.time()
+        return [
+            result for result, score, probed_at in zip(passed, state[0::2], state[1::2])
+            if score is not None and score >= BANDWIDTH_MIN_SCORE
+            and now - float(probed_at or 0) >= BANDWIDTH_INTERVAL
+        ]
+
+
+class RedisClient(RedisKeysMixin):
     """Redis客户端"""
     
     def __init__(self):
@@ -21,6 +368,15 @@ class RedisClient:
         self.db = REDIS_DB
         self.key_prefix = REDIS_KEY
         self.redis = self._connect()
+        self._claim_due = self.redis.register_script(CLAIM_DUE_SCRIPT) if self.redis else None
+        self._claim_due_slots = self.redis.register_script(CLAIM_DUE_SLOTS_SCRIPT) if self.redis else None
+        self._acquire_leader = self.redis.register_script(ACQUIRE_LEADER_SCRIPT) if self.redis else None
+        self._release_leader = self.redis.register_script(RELEASE_LEADER_SCRIPT) if self.redis else None
+        self._publish_candidates_script = self.redis.register_script(PUBLISH_CANDIDATES_SCRIPT) if self.redis else None
+        self._lease_pending = self.redis.register_script(LEASE_PENDING_SCRIPT) if self.redis else None
+        # 集群模式下各节点的指标分开存放
+        self.metrics_suffix = f"@{CLUSTER_NODE_ID}" if CLUSTER_ENABLED else ""
+        self._claim_cursors = {}  # 各流 XAUTOCLAIM 的扫描位置
     
     def _connect(self):
         """连接Redis"""
@@ -42,10 +398,6 @@ class RedisClient:
             logger.error(f"Failed to connect Redis: {e}")
             return None
     
-    def _get_key(self, protocol):
-        """获取Redis键名"""
-        return f"{self.key_prefix}:{protocol}"
-    
     def add_proxy(self, proxy, protocol='http', score=10):
         """添加代理"""
         try:
@@ -53,32 +405,100 @@ class RedisClient:
                 return False
             
             key = self._get_key(protocol)
+            member = make_member(proxy, protocol)
+            now = time.time()
+            pipe = self.redis.pipeline(transaction=False)
             # 使用有序集合，代理为成员，分数为质量分数
-            result = self.redis.zadd(key, {proxy: score}, nx=True)
+            pipe.zadd(key, {proxy: score}, nx=True)
+            # 新代理立即到期，等待首次验证
+            pipe.zadd(self._due_key(member), {member: now}, nx=True)
+            pipe.hsetnx(self._meta_key('first_seen'), member, int(now))
+            result = pipe.execute()[0]
             return result > 0
         except Exception as e:
             logger.error(f"Error adding proxy {proxy}: {e}")
             return False
     
-    def get_random_proxy(self, protocol='http'):
-        """随机获取代理"""
+    def _filter_by_meta(self, proxies, protocol, name, predicate):
+        """按代理元数据过滤 [(proxy, score)]"""
+        if not proxies:
+            return []
+        members = [make_member(proxy, protocol) for proxy, _ in proxies]
+        values = self.redis.hmget(self._meta_key(name), members)
+        return [item for item, value in zip(proxies, values) if value is not None and predicate(value)]
+    
+    def _load_quality(self, proxies, protocol):
+        """批量读取代理的检查历史，返回与 proxies 对应的质量摘要列表"""
+        members = [make_member(proxy, protocol) for proxy, _ in proxies]
+        pipe = self.redis.pipeline(transaction=False)
+        for name in HISTORY_FIELDS:
+            pipe.hmget(self._meta_key(name), members)
+        bits, checks, latency, timing = pipe.execute()
+        return [
+            (history.from_signed(b), int(c or 0), history.from_signed(l), decode_phases(t))
+            for b, c, l, t in zip(bits, checks, latency, timing)
+        ]
+    
+    def _rank_proxies(self, proxies, protocol, rank):
+        """按检查历史对 [(proxy, score)] 排序，返回排序后的列表"""
+        qualities = self._load_quality(proxies, protocol)
+        if rank == 'success_rate':
+            keys = [-history.success_lower_bound(bits, checks) for bits, checks, _, _ in qualities]
+        else:
+            # 按p90延迟分桶排序，同一分桶内按首字节时间的滑动平均排序；没有延迟记录的代理排在最后
+            keys = []
+            for _, _, latency, timing in qualities:
+                p90 = history.latency_percentile(latency)
+                keys.append((
+                    p90 if p90 is not None else float('inf'),
+                    timing['ttfb'] if timing else float('inf')
+                ))
+        order = sorted(range(len(proxies)), key=lambda i: (keys[i], -proxies[i][1]))
+        return [proxies[i] for i in order]
+    
+    def _apply_filters(self, proxies, protocol, anonymity=None, min_bandwidth=None):
+        """按匿名度和带宽过滤 [(proxy, score)]"""
+        if anonymity:
+            proxies = self._filter_by_meta(
+                proxies, protocol, 'anonymity', lambda level: anonymity_at_least(level, anonymity)
+            )
+        if min_bandwidth:
+            proxies = self._filter_by_meta(
+                proxies, protocol, 'bandwidth', lambda bandwidth: float(bandwidth) >= min_bandwidth
+            )
+        return proxies
+    
+    def get_random_proxy(self, protocol='http', anonymity=None, rank='score', min_bandwidth=None, profile=None):
+        """
+        随机获取代理
+        
+        Args:
+            protocol: 协议类型
+            profile: 验证配置档名称，为空时从全局代理池中选择
+            anonymity: 最低匿名度 (transparent, anonymous, elite)，为空时不过滤
+            rank: 排序方式 (score, success_rate, latency)，按历史排序时从排名前 RANK_TOP 的代理中随机选择
+            min_bandwidth: 最低带宽(KB/s)，只返回带宽探测达标的代理
+        """
         try:
             if not self.redis:
                 return None
             
-            key = self._get_key(protocol)
+            key = self._profile_key(profile, protocol) if profile else self._get_key(protocol)
             
-            # 先尝试获取高分代理
-            high_score_proxies = self.redis.zrevrangebyscore(key, '+inf', 60, withscores=True)
-            if high_score_proxies:
-                import random
-                return random.choice(high_score_proxies)[0]
+            if rank != 'score':
+                # 在高分候选中按最近64次的成功率或p90延迟排序
+                proxies = self.redis.zrevrange(key, 0, RANK_CANDIDATES - 1, withscores=True)
+                proxies = self._apply_filters(proxies, protocol, anonymity, min_bandwidth)
+                if not proxies:
+                    return None
+                return random.choice(self._rank_proxies(proxies, protocol, rank)[:RANK_TOP])[0]
             
-            # 如果没有高分代理，获取所有代理
-            all_proxies = self.redis.zrevrange(key, 0, -1, withscores=True)
-            if all_proxies:
-                import random
-                return random.choice(all_proxies)[0]
+            # 先尝试获取高分代理，如果没有高分代理，获取所有代理
+            for fetch in (lambda: self.redis.zrevrangebyscore(key, '+inf', 60, withscores=True),
+                          lambda: self.redis.zrevrange(key, 0, -1, withscores=True)):
+                proxies = self._apply_filters(fetch(), protocol, anonymity, min_bandwidth)
+                if proxies:
+                    return random.choice(proxies)[0]
             
             return None
         except Exception as e:
@@ -111,20 +531,19 @@ class RedisClient:
             logger.error(f"Error popping proxy: {e}")
             return None
     
-    def update_proxy_score(self, proxy, protocol='http', success=True):
-        """更新代理分数"""
+    def update_proxy_score(self, proxy, protocol='http', success=True, outcome=None):
+        """更新代理分数，outcome 为验证结果分类，未提供时按 success 判断"""
         try:
             if not self.redis:
                 return False
             
             key = self._get_key(protocol)
+            score = self.redis.zscore(key, proxy)
+            if score is None:
+                return False
             
-            if success:
-                # 成功，分数增加
-                new_score = min(self.redis.zincrby(key, 1, proxy) or 10, 100)
-            else:
-                # 失败，分数减少
-                new_score = max(self.redis.zincrby(key, -2, proxy) or 10, 0)
+            new_score = next_score(score, result_outcome({'success': success, 'outcome': outcome}))
+            self.redis.zadd(key, {proxy: new_score}, xx=True)
             
             logger.debug(f"Updated proxy {proxy} score to {new_score}")
             return True
@@ -139,7 +558,17 @@ class RedisClient:
                 return False
             
             key = self._get_key(protocol)
-            result = self.redis.zrem(key, proxy)
+            member = make_member(proxy, protocol)
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.zrem(key, proxy)
+            pipe.zrem(self._due_key(member), member)
+            pipe.zrem(self.survival_key, member)
+            for name in META_FIELDS:
+                pipe.hdel(self._meta_key(name), member)
+            for name in VALIDATE_PROFILES:
+                pipe.zrem(self._profile_key(name, protocol), proxy)
+                pipe.zrem(self._due_key(member, name), member)
+            result = pipe.execute()[0]
             if result > 0:
                 logger.info(f"Removed proxy {proxy}")
             return result > 0
@@ -147,6 +576,816 @@ class RedisClient:
             logger.error(f"Error removing proxy: {e}")
             return False
     
+    def get_proxy_meta(self, proxy, protocol, name):
+        """获取代理的一项元数据"""
+        try:
+            if not self.redis:
+                return None
+            return self.redis.hget(self._meta_key(name), make_member(proxy, protocol))
+        except Exception as e:
+            logger.error(f"Error getting proxy meta {name}: {e}")
+            return None
+    
+    def get_proxy_quality(self, proxy, protocol):
+        """获取代理最近检查窗口的成功率和p90延迟"""
+        try:
+            if not self.redis:
+                return None
+            bits, checks, latency, timing = self._load_quality([(proxy, None)], protocol)[0]
+            return history.quality(bits, checks, latency, timing)
+        except Exception as e:
+            logger.error(f"Error getting proxy quality: {e}")
+            return None
+    
+    def add_pending(self, proxies, source=None):
+        """
+        把新获取的代理放入隔离区，已在代理池中的跳过
+        
+        Args:
+            proxies: [{'proxy', 'protocol'}]，协议为 auto 的代理在任一协议的池中都算已入池
+            source: 代理源名称，记录为这些代理的来源并计入该源的 new 计数
+        
+        Returns:
+            (新放入隔离区的数量, 已接收的成员): 已接收的成员包括本次入队、之前已在隔离区、已被领取和已在代理池中的，
+            写入失败时为空集合
+        """
+        try:
+            if not self.redis or not proxies:
+                return 0, set()
+            
+            protocols = ['http', 'https', 'socks4', 'socks5']
+            pipe = self.redis.pipeline(transaction=False)
+            for proxy_info in proxies:
+                if proxy_info['protocol'] == AUTO_PROTOCOL:
+                    for protocol in protocols:
+                        pipe.zscore(self._get_key(protocol), proxy_info['proxy'])
+                else:
+                    pipe.zscore(self._get_key(proxy_info['protocol']), proxy_info['proxy'])
+                # 已被领取、正在验证的也不再入队
+                pipe.zscore(self.leased_pending_key, make_member(proxy_info['proxy'], proxy_info['protocol']))
+            scores = iter(pipe.execute())
+            
+            now = time.time()
+            pending = {}
+            accepted = set()
+            for proxy_info in proxies:
+                member = make_member(proxy_info['proxy'], proxy_info['protocol'])
+                accepted.add(member)
+                checks = (len(protocols) if proxy_info['protocol'] == AUTO_PROTOCOL else 1) + 1
+                live = [score for score in (next(scores) for _ in range(checks)) if score is not None]
+                if not live:
+                    pending[member] = now
+            if not pending:
+                return 0, accepted
+            if INGEST_MODE == 'stream':
+                queued = self._publish_candidates(pending)
+            else:
+                queued = self.redis.zadd(self.pending_key, pending, nx=True)
+            if source:
+                pipe = self.redis.pipeline(transaction=False)
+                for member in pending:
+                    pipe.hsetnx(self.origin_key, parse_member(member)[0], source)
+                pipe.hincrby(self._source_key(source), 'new', queued)
+                pipe.execute()
+            return queued, accepted
+        except Exception as e:
+            logger.error(f"Error adding pending proxies: {e}")
+            return 0, set()
+    
+    def _publish_candidates(self, pending):
+        """隔离区仍用于去重，新加入隔离区的代理写入候选流，返回写入数量"""
+        args = [STREAM_MAXLEN]
+        for member, score in pending.items():
+            args.extend((member, score))
+        return self._publish_candidates_script(keys=[self.pending_key, self.candidates_stream], args=args)
+    
+    def _xadd_candidates(self, members):
+        """把隔离区成员写入候选流"""
+        pipe = self.redis.pipeline(transaction=False)
+        for member in members:
+            pipe.xadd(self.candidates_stream, {'member': member}, maxlen=STREAM_MAXLEN, approximate=True)
+        pipe.execute()
+    
+    def add_tombstones(self, proxies, ttl):
+        """
+        记录被清理的代理，ttl 秒内再次获取到时不会重新入队
+        
+        Args:
+            proxies: ip:port 列表
+        """
+        try:
+            if not self.redis or not proxies:
+                return 0
+            
+            now = time.time()
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.zadd(self.tombstone_key, {proxy: now + ttl for proxy in proxies})
+            pipe.zremrangebyscore(self.tombstone_key, '-inf', now)
+            return pipe.execute()[0]
+        except Exception as e:
+            logger.error(f"Error adding tombstones: {e}")
+            return 0
+    
+    def filter_tombstoned(self, proxies):
+        """
+        去掉仍在墓碑期内的代理
+        
+        Args:
+            proxies: [{'proxy', 'protocol'}]
+        
+        Returns:
+            (保留的代理, {被拦下的成员: 墓碑过期时间})
+        """
+        try:
+            if not self.redis or not proxies:
+                return proxies, {}
+            
+            expires = self.redis.zmscore(self.tombstone_key, [proxy_info['proxy'] for proxy_info in proxies])
+            now = time.time()
+            kept, tombstoned = [], {}
+            for proxy_info, expire in zip(proxies, expires):
+                if expire is None or expire <= now:
+                    kept.append(proxy_info)
+                else:
+                    tombstoned[make_member(proxy_info['proxy'], proxy_info['protocol'])] = expire
+            return kept, tombstoned
+        except Exception as e:
+            logger.error(f"Error filtering tombstoned proxies: {e}")
+            return proxies, {}
+    
+    def get_tombstone_count(self):
+        """墓碑期内的代理数量"""
+        try:
+            if not self.redis:
+                return 0
+            return self.redis.zcount(self.tombstone_key, time.time(), '+inf')
+        except Exception as e:
+            logger.error(f"Error getting tombstone count: {e}")
+            return 0
+    
+    def migrate_mixed_pool(self, legacy='all'):
+        """
+        把旧版本写入 proxy_pool:all 的代理移回隔离区，由摄取管道探测协议后重新入池
+        
+        旧版本把混合协议源的代理按类型 all 入池，没有任何接口会读取这个池。
+        
+        Returns:
+            移回隔离区的数量
+        """
+        try:
+            if not self.redis:
+                return 0
+            
+            key = self._get_key(legacy)
+            proxies = self.redis.zrange(key, 0, -1)
+            prefix = f"{legacy}://"
+            stale = [
+                member for due_key in self._due_keys() for member, _ in self.redis.zscan_iter(due_key, match=f"{prefix}*")
+            ]
+            pending = [member for member, _ in self.redis.zscan_iter(self.pending_key, match=f"{prefix}*")]
+            if not proxies and not stale and not pending:
+                return 0
+            
+            now = time.time()
+            addresses = set(proxies) | {parse_member(member)[0] for member in pending}
+            pipe = self.redis.pipeline(transaction=False)
+            if addresses:
+                pipe.zadd(self.pending_key, {make_member(proxy, AUTO_PROTOCOL): now for proxy in addresses}, nx=True)
+            if pending:
+                pipe.zrem(self.pending_key, *pending)
+            members = set(stale) | {make_member(proxy, legacy) for proxy in proxies}
+            if members:
+                for member in members:
+                    pipe.zrem(self._due_key(member), member)
+                for name in META_FIELDS:
+                    pipe.hdel(self._meta_key(name), *members)
+            pipe.delete(key)
+            pipe.execute()
+            logger.info(f"Migrated {len(addresses)} proxies from {key} back to pending")
+            return len(addresses)
+        except Exception as e:
+            logger.error(f"Error migrating {legacy} pool: {e}")
+            return 0
+    
+    def ensure_stream_groups(self):
+        """
+        创建候选流和结果流的消费组
+        
+        候选流的消费组首次创建时(从 queue 模式切换过来)，把隔离区中已有的代理补写入候选流。
+        
+        Returns:
+            是否新创建了候选流的消费组
+        """
+        try:
+            if not self.redis:
+                return False
+            
+            created = False
+            for stream, group in ((self.candidates_stream, 'ingest'), (self.results_stream, 'updater')):
+                try:
+                    self.redis.xgroup_create(stream, group, id='0', mkstream=True)
+                    created = created or stream == self.candidates_stream
+                except redis.ResponseError as e:
+                    if 'BUSYGROUP' not in str(e):
+                        raise
+            if created:
+                members = [member for member, _ in self.redis.zscan_iter(self.pending_key)]
+                for i in range(0, len(members), 1000):
+                    self._xadd_candidates(members[i:i + 1000])
+                if members:
+                    logger.info(f"Published {len(members)} pending proxies to candidate stream")
+            return created
+        except Exception as e:
+            logger.error(f"Error creating stream groups: {e}")
+            return False
+    
+    def read_stream(self, stream, group, consumer, count, block=STREAM_BLOCK):
+        """
+        通过消费组读取流，先接管其他消费者超过 STREAM_CLAIM_IDLE 秒未确认的条目，没有时阻塞读取新条目
+        
+        Returns:
+            [(条目ID, 字段)]
+        """
+        try:
+            if not self.redis:
+                return []
+            
+            cursor = self._claim_cursors.get(stream, '0-0')
+            claimed = self.redis.xautoclaim(
+                stream, group, consumer, int(STREAM_CLAIM_IDLE * 1000), start_id=cursor, count=count
+            )
+            self._claim_cursors[stream] = claimed[0]
+            entries = [(entry_id, fields) for entry_id, fields in claimed[1] if fields]
+            if entries:
+                logger.info(f"Reclaimed {len(entries)} stale entries from {stream}")
+                return entries
+            
+            response = self.redis.xreadgroup(group, consumer, {stream: '>'}, count=count, block=block)
+            return response[0][1] if response else []
+        except Exception as e:
+            logger.error(f"Error reading stream {stream}: {e}")
+            return []
+    
+    def publish_results(self, items):
+        """
+        写入候选代理的验证结果并确认候选条目，两者在同一事务中完成，进程退出时不会丢失结果
+        
+        Args:
+            items: [(候选条目ID, 隔离区成员名, [{'proxy', 'protocol', 'anonymity'}])]，结果列表只包含通过验证的代理
+        
+        Returns:
+            写入结果流的数量
+        """
+        try:
+            if not self.redis or not items:
+                return 0
+            
+            pipe = self.redis.pipeline()
+            published = 0
+            for _, _, records in items:
+                for record in records:
+                    fields = {
+                        'proxy': record['proxy'],
+                        'protocol': record['protocol'],
+                        'anonymity': record.get('anonymity') or ''
+                    }
+                    pipe.xadd(self.results_stream, fields, maxlen=STREAM_MAXLEN, approximate=True)
+                    published += 1
+            entry_ids = [entry_id for entry_id, _, _ in items]
+            pipe.xack(self.candidates_stream, 'ingest', *entry_ids)
+            pipe.xdel(self.candidates_stream, *entry_ids)
+            pipe.zrem(self.pending_key, *[member for _, member, _ in items])
+            pipe.execute()
+            return published
+        except Exception as e:
+            logger.error(f"Error publishing validation results: {e}")
+            return 0
+    
+    def get_stream_stats(self):
+        """候选流和结果流的积压(未读取和未确认的条目)"""
+        try:
+            if not self.redis:
+                return {}
+            
+            pipe = self.redis.pipeline(transaction=False)
+            for stream, group in ((self.candidates_stream, 'ingest'), (self.results_stream, 'updater')):
+                pipe.xlen(stream)
+                pipe.xpending(stream, group)
+            candidates, candidates_pending, results, results_pending = pipe.execute()
+            return {
+                "stream_candidates": candidates,
+                "stream_candidates_unacked": candidates_pending['pending'],
+                "stream_results": results,
+                "stream_results_unacked": results_pending['pending']
+            }
+        except Exception as e:
+            logger.error(f"Error getting stream stats: {e}")
+            return {}
+    
+    def lease_pending(self, count=500, lease=PENDING_LEASE):
+        """
+        按入队顺序领取隔离区中的代理，返回 [(proxy, protocol)]
+        
+        领取的代理移入 leased_pending_key 直到验证结果写入(promote_proxies 的 leased 参数)；
+        进程退出时未写入结果的代理在 lease 秒后重新被领取，不会丢失。
+        """
+        try:
+            if not self.redis:
+                return []
+            
+            now = time.time()
+            members = self._lease_pending(keys=[self.pending_key, self.leased_pending_key], args=[now, count, now + lease])
+            return [parse_member(member) for member in members]
+        except Exception as e:
+            logger.error(f"Error leasing pending proxies: {e}")
+            return []
+    
+    def requeue_pending(self, members, delay):
+        """把已领取但未能验证的隔离区成员(如判定站点全部不可用)放回隔离区，delay 秒后才会再被领取"""
+        try:
+            if not self.redis or not members:
+                return 0
+            
+            pipe = self.redis.pipeline()
+            pipe.zrem(self.leased_pending_key, *members)
+            pipe.zadd(self.pending_key, {member: time.time() + delay for member in members})
+            pipe.execute()
+            return len(members)
+        except Exception as e:
+            logger.error(f"Error requeueing pending proxies: {e}")
+            return 0
+    
+    def get_pending_count(self):
+        """隔离区中的代理数量"""
+        try:
+            if not self.redis:
+                return 0
+            return self.redis.zcard(self.pending_key)
+        except Exception as e:
+            logger.error(f"Error getting pending count: {e}")
+            return 0
+    
+    def promote_proxies(self, proxies, score=PROXY_SCORE_INIT, ack=None, leased=None):
+        """
+        把通过验证的代理放入代理池
+        
+        Args:
+            proxies: [{'proxy', 'protocol', 'anonymity'}]
+            ack: stream 模式下结果流的条目ID，与代理池写入在同一事务中确认并删除；
+                写入失败时不确认，条目由 updater 消费组重新领取
+            leased: 已验证完的隔离区成员(包括未通过的)，与代理池写入在同一事务中结束租约；
+                写入失败时租约保留，到期后重新验证
+        
+        Returns:
+            新加入代理池的数量
+        """
+        try:
+            if not self.redis or not (proxies or leased):
+                return 0
+            
+            now = time.time()
+            pipe = self.redis.pipeline(transaction=bool(ack or leased))
+            # 先写入代理池，前 len(proxies) 条结果即为是否新加入，最后一条为各代理的来源
+            for proxy_info in proxies:
+                pipe.zadd(self._get_key(proxy_info['protocol']), {proxy_info['proxy']: score}, nx=True)
+            for proxy_info in proxies:
+                member = make_member(proxy_info['proxy'], proxy_info['protocol'])
+                pipe.zadd(self._due_key(member), {member: now + retest_interval(score, 0, 0)}, nx=True)
+                pipe.hsetnx(self._meta_key('first_seen'), member, int(now))
+                if proxy_info.get('anonymity'):
+                    pipe.hset(self._meta_key('anonymity'), member, proxy_info['anonymity'])
+            origins_at = len(pipe)
+            if proxies:
+                pipe.hmget(self.origin_key, [proxy_info['proxy'] for proxy_info in proxies])
+            if ack:
+                pipe.xack(self.results_stream, 'updater', *ack)
+                pipe.xdel(self.results_stream, *ack)
+            if leased:
+                pipe.zrem(self.leased_pending_key, *leased)
+            result = pipe.execute()
+            if not proxies:
+                return 0
+            added, origins = result[:len(proxies)], result[origins_at]
+            
+            # 记录来源，计入代理源的 validated 计数，并等待统计24小时存活
+            pipe = self.redis.pipeline(transaction=False)
+            for proxy_info, new, origin in zip(proxies, added, origins):
+                if not new or not origin:
+                    continue
+                member = make_member(proxy_info['proxy'], proxy_info['protocol'])
+                pipe.hset(self._meta_key('source'), member, origin)
+                pipe.hincrby(self._source_key(origin), 'validated', 1)
+                pipe.zadd(self.survival_key, {member: now}, nx=True)
+            pipe.execute()
+            return sum(added)
+        except Exception as e:
+            logger.error(f"Error promoting proxies: {e}")
+            return 0
+    
+    def sync_due_queue(self):
+        """把尚未进入到期队列的代理加入队列，返回新加入的数量"""
+        try:
+            if not self.redis:
+                return 0
+            
+            now = time.time()
+            enrolled = 0
+            for protocol in ['http', 'https', 'socks4', 'socks5']:
+                proxies = self.redis.zrange(self._get_key(protocol), 0, -1)
+                if not proxies:
+                    continue
+                pipe = self.redis.pipeline(transaction=False)
+                for proxy in proxies:
+                    member = make_member(proxy, protocol)
+                    pipe.zadd(self._due_key(member), {member: now}, nx=True)
+                    pipe.hsetnx(self._meta_key('first_seen'), member, int(now))
+                enrolled += sum(pipe.execute()[::2])
+            
+            if enrolled:
+                logger.info(f"Enrolled {enrolled} proxies into due queue")
+            return enrolled
+        except Exception as e:
+            logger.error(f"Error syncing due queue: {e}")
+            return 0
+    
+    def claim_due_proxies(self, limit=500, lease=DUE_LEASE, profile=None, slots=None):
+        """
+        领取到期的代理，返回 [(proxy, protocol)]
+        
+        Args:
+            profile: 指定时从该配置档的到期队列领取
+            slots: 集群模式下本节点的哈希槽，只领取属于这些槽的代理；None 表示不划分
+        """
+        try:
+            if not self.redis:
+                return []
+            
+            now = time.time()
+            due_keys = self._due_keys(profile, slots)
+            if not due_keys:
+                return []
+            if len(due_keys) == 1:
+                members = self._claim_due(keys=due_keys, args=[now, limit, now + lease])
+            else:
+                members = self._claim_due_slots(
+                    keys=due_keys, args=[now, limit, now + lease, random.randrange(len(due_keys))]
+                )
+            return [parse_member(member) for member in members]
+        except Exception as e:
+            logger.error(f"Error claiming due proxies: {e}")
+            return []
+    
+    def renew_due_lease(self, proxies, lease=DUE_LEASE, profile=None):
+        """为仍在验证中的代理续租，批次验证超过租约时长时避免被其他验证者重新领取"""
+        try:
+            if not self.redis or not proxies:
+                return False
+            
+            pipe = self.redis.pipeline(transaction=False)
+            self._queue_lease_renewal(pipe, proxies, lease, profile)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error renewing due lease: {e}")
+            return False
+    
+    def get_due_stats(self):
+        """到期队列统计: 队列大小、积压数量、最大延迟(秒)"""
+        try:
+            if not self.redis:
+                return {}
+            
+            now = time.time()
+            due_keys = self._due_keys()
+            pipe = self.redis.pipeline(transaction=False)
+            for due_key in due_keys:
+                pipe.zcard(due_key)
+                pipe.zcount(due_key, '-inf', now)
+                pipe.zrange(due_key, 0, 0, withscores=True)
+            counts = pipe.execute()
+            oldest = min((items[0][1] for items in counts[2::3] if items), default=now)
+            return {"size": sum(counts[0::3]), "backlog": sum(counts[1::3]), "max_lag": round(max(0.0, now - oldest), 1)}
+        except Exception as e:
+            logger.error(f"Error getting due stats: {e}")
+            return {}
+    
+    def bandwidth_candidates(self, results):
+        """从验证结果中选出需要带宽探测的代理"""
+        try:
+            if not self.redis or not results:
+                return []
+            
+            pipe = self.redis.pipeline(transaction=False)
+            passed = self._queue_bandwidth_reads(pipe, results)
+            if not passed:
+                return []
+            return self._select_bandwidth_candidates(passed, pipe.execute())
+        except Exception as e:
+            logger.error(f"Error selecting bandwidth candidates: {e}")
+            return []
+    
+    def save_bandwidth(self, results):
+        """写入带宽探测结果，返回写入数量"""
+        try:
+            if not self.redis or not results:
+                return 0
+            
+            pipe = self.redis.pipeline(transaction=False)
+            for result in results:
+                pipe.zscore(self._get_key(result['protocol']), result['proxy'])
+            scores = pipe.execute()
+            
+            pipe = self.redis.pipeline(transaction=False)
+            written = self._queue_bandwidth_writes(pipe, results, scores)
+            pipe.execute()
+            return written
+        except Exception as e:
+            logger.error(f"Error saving bandwidth: {e}")
+            return 0
+    
+    def tunnel_candidates(self, results):
+        """从验证结果中选出需要检测CONNECT隧道的HTTP代理"""
+        try:
+            if not self.redis or not results:
+                return []
+            
+            pipe = self.redis.pipeline(transaction=False)
+            passed = self._queue_tunnel_reads(pipe, results)
+            if not passed:
+                return []
+            return self._select_tunnel_candidates(passed, pipe.execute())
+        except Exception as e:
+            logger.error(f"Error selecting tunnel candidates: {e}")
+            return []
+    
+    def apply_results(self, results):
+        """
+        批量写入验证结果
+        
+        Args:
+            results: 验证结果列表，每项为 {'proxy', 'protocol', 'success', 'outcome', 'response_time', 'anonymity'}
+        
+        Returns:
+            成功写入的数量
+        """
+        try:
+            if not self.redis or not results:
+                return 0
+            
+            # 第一轮: 读取当前状态
+            pipe = self.redis.pipeline(transaction=False)
+            self._queue_state_reads(pipe, results)
+            state = pipe.execute()
+            
+            # 第二轮: 写入新分数、失败次数和下次到期时间
+            pipe = self.redis.pipeline(transaction=False)
+            applied = self._queue_result_writes(pipe, results, state)
+            pipe.execute()
+            
+            return applied
+        except Exception as e:
+            logger.error(f"Error applying results: {e}")
+            return 0
+    
+    def sync_profile(self, name, min_score=0):
+        """
+        同步配置档: 把全局分数达到 min_score 的代理加入配置档，
+        并移除全局分数已低于 min_score 或已不在全局代理池中的代理
+        
+        Returns:
+            (新加入的数量, 移除的数量)
+        """
+        try:
+            if not self.redis:
+                return 0, 0
+            
+            now = time.time()
+            enrolled = removed = 0
+            for protocol in ['http', 'https', 'socks4', 'socks5']:
+                key = self._profile_key(name, protocol)
+                members = self.redis.zrange(key, 0, -1)
+                if members:
+                    scores = self.redis.zmscore(self._get_key(protocol), members)
+                    dropped = [proxy for proxy, score in zip(members, scores) if score is None or score < min_score]
+                    if dropped:
+                        pipe = self.redis.pipeline(transaction=False)
+                        pipe.zrem(key, *dropped)
+                        for proxy in dropped:
+                            member = make_member(proxy, protocol)
+                            pipe.zrem(self._due_key(member, name), member)
+                        removed += pipe.execute()[0]
+                
+                proxies = self.redis.zrangebyscore(self._get_key(protocol), min_score, '+inf')
+                if not proxies:
+                    continue
+                pipe = self.redis.pipeline(transaction=False)
+                for proxy in proxies:
+                    pipe.zadd(key, {proxy: PROXY_SCORE_INIT}, nx=True)
+                    member = make_member(proxy, protocol)
+                    pipe.zadd(self._due_key(member, name), {member: now}, nx=True)
+                enrolled += sum(pipe.execute()[::2])
+            return enrolled, removed
+        except Exception as e:
+            logger.error(f"Error syncing profile {name}: {e}")
+            return 0, 0
+    
+    def apply_profile_results(self, name, results, interval):
+        """
+        写入配置档验证结果
+        
+        Args:
+            name: 配置档名称
+            results: 验证结果列表，每项为 {'proxy', 'protocol', 'success', 'outcome'}
+            interval: 复检间隔(秒)
+        
+        Returns:
+            成功写入的数量
+        """
+        try:
+            if not self.redis or not results:
+                return 0
+            
+            pipe = self.redis.pipeline(transaction=False)
+            for result in results:
+                pipe.zscore(self._profile_key(name, result['protocol']), result['proxy'])
+                pipe.zscore(self._get_key(result['protocol']), result['proxy'])
+            state = pipe.execute()
+            
+            now = time.time()
+            applied = 0
+            pipe = self.redis.pipeline(transaction=False)
+            for result, score, global_score in zip(results, state[0::2], state[1::2]):
+                key = self._profile_key(name, result['protocol'])
+                member = make_member(result['proxy'], result['protocol'])
+                if score is None or global_score is None:
+                    # 代理已从全局代理池或配置档中删除
+                    pipe.zrem(key, result['proxy'])
+                    pipe.zrem(self._due_key(member, name), member)
+                    continue
+                
+                outcome = result_outcome(result)
+                if outcome not in NEUTRAL_OUTCOMES:
+                    pipe.zadd(key, {result['proxy']: next_score(score, outcome)}, xx=True)
+                pipe.zadd(self._due_key(member, name), {member: now + interval * random.uniform(0.9, 1.1)})
+                applied += 1
+            pipe.execute()
+            return applied
+        except Exception as e:
+            logger.error(f"Error applying profile {name} results: {e}")
+            return 0
+    
+    def get_profile_stats(self, name):
+        """配置档各协议的代理数量和到期队列积压"""
+        try:
+            if not self.redis:
+                return {}
+            
+            pipe = self.redis.pipeline(transaction=False)
+            protocols = ['http', 'https', 'socks4', 'socks5']
+            for protocol in protocols:
+                pipe.zcard(self._profile_key(name, protocol))
+            now = time.time()
+            for due_key in self._due_keys(name):
+                pipe.zcount(due_key, '-inf', now)
+            counts = pipe.execute()
+            stats = dict(zip(protocols, counts))
+            stats["backlog"] = sum(counts[len(protocols):])
+            return stats
+        except Exception as e:
+            logger.error(f"Error getting profile {name} stats: {e}")
+            return {}
+    
+    def get_source_state(self, name):
+        """获取代理源的抓取状态"""
+        try:
+            if not self.redis:
+                return {}
+            
+            return self.redis.hgetall(self._source_key(name))
+        except Exception as e:
+            logger.error(f"Error getting source {name} state: {e}")
+            return {}
+    
+    def incr_source_counter(self, name, field, amount=1):
+        """累加代理源的计数"""
+        try:
+            if not self.redis:
+                return 0
+            return self.redis.hincrby(self._source_key(name), field, amount)
+        except Exception as e:
+            logger.error(f"Error updating source {name} counter: {e}")
+            return 0
+    
+    def set_source_state(self, name, state):
+        """更新代理源的抓取状态"""
+        try:
+            if not self.redis or not state:
+                return False
+            
+            self.redis.hset(self._source_key(name), mapping=state)
+            return True
+        except Exception as e:
+            logger.error(f"Error setting source {name} state: {e}")
+            return False
+    
+    def diff_source_members(self, name, members):
+        """
+        与代理源上一次保存的成员比较，返回新增和移除的成员；不写入，入队后由 save_source_members 保存
+        
+        墓碑期内被拦下的成员在墓碑过期前也不算新增，过期后重新算新增并入队
+        
+        Args:
+            name: 代理源名称
+            members: 本次列出的成员集合，成员为 {协议}://ip:port
+        
+        Returns:
+            (added, removed)
+        """
+        try:
+            if not self.redis:
+                return set(members), set()
+            
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.smembers(self._source_members_key(name))
+            pipe.zrangebyscore(self._source_suppressed_key(name), time.time(), '+inf')
+            previous, suppressed = pipe.execute()
+            return members - previous - set(suppressed), previous - members
+        except Exception as e:
+            logger.error(f"Error diffing source {name} members: {e}")
+            return set(members), set()
+    
+    def save_source_members(self, name, added, removed, suppressed=None):
+        """
+        保存代理源的成员变化
+        
+        Args:
+            name: 代理源名称
+            added: 已入队的新增成员，未入队的不保存，下一轮仍算新增
+            removed: 源已不再列出的成员
+            suppressed: {墓碑期内被拦下的新增成员: 墓碑过期时间}，过期前不再算新增，也不重复计入 suppressed 计数
+        """
+        try:
+            if not self.redis or not (added or removed or suppressed):
+                return
+            
+            key = self._source_members_key(name)
+            pipe = self.redis.pipeline(transaction=False)
+            if suppressed:
+                pipe.zadd(self._source_suppressed_key(name), suppressed)
+            pipe.zremrangebyscore(self._source_suppressed_key(name), '-inf', time.time())
+            if added:
+                pipe.sadd(key, *added)
+            if removed:
+                pipe.srem(key, *removed)
+                # 源已不再列出、也尚未入池的代理不需要再记来源
+                addresses = [parse_member(member)[0] for member in removed]
+                pipe.hmget(self.origin_key, addresses)
+            result = pipe.execute()
+            if removed:
+                # 换了协议前缀重新列出的代理仍由该源提供
+                listed = {parse_member(member)[0] for member in added or ()}
+                stale = [
+                    address for address, origin in zip(addresses, result[-1])
+                    if origin == name and address not in listed
+                ]
+                if stale:
+                    self.redis.hdel(self.origin_key, *stale)
+        except Exception as e:
+            logger.error(f"Error saving source {name} members: {e}")
+    
+    def settle_survival(self, window=86400):
+        """
+        统计入池满 window 秒的代理是否仍在池中，计入其来源的 survived_24h 计数
+        
+        Returns:
+            本次统计的代理数量
+        """
+        try:
+            if not self.redis:
+                return 0
+            
+            members = self.redis.zrangebyscore(self.survival_key, '-inf', time.time() - window)
+            if not members:
+                return 0
+            
+            pipe = self.redis.pipeline(transaction=False)
+            for member in members:
+                proxy, protocol = parse_member(member)
+                pipe.zscore(self._get_key(protocol), proxy)
+                pipe.hget(self._meta_key('source'), member)
+            state = pipe.execute()
+            
+            pipe = self.redis.pipeline(transaction=False)
+            for score, origin in zip(state[0::2], state[1::2]):
+                if score is not None and origin:
+                    pipe.hincrby(self._source_key(origin), 'survived_24h', 1)
+            pipe.zrem(self.survival_key, *members)
+            pipe.execute()
+            return len(members)
+        except Exception as e:
+            logger.error(f"Error settling survival: {e}")
+            return 0
+    
     def get_all_proxies(self, protocol='http'):
         """获取所有代理"""
         try:
@@ -186,6 +1425,114 @@ class RedisClient:
             logger.error(f"Error clearing proxies: {e}")
             return False
     
+    def set_metrics(self, name, metrics, replace=False, per_node=True):
+        """
+        写入一组运行指标
+        
+        Args:
+            replace: 为 True 时先清除该组原有的指标
+            per_node: 集群模式下按节点分开存放，为 False 时写入集群共用的指标组
+        """
+        try:
+            if not self.redis or not metrics:
+                return False
+            
+            key = f"{self.key_prefix}:metrics:{name}{self.metrics_suffix if per_node else ''}"
+            pipe = self.redis.pipeline()
+            if replace:
+                pipe.delete(key)
+            pipe.hset(key, mapping=metrics)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error setting metrics {name}: {e}")
+            return False
+    
+    def get_metrics(self):
+        """获取所有运行指标"""
+        try:
+            if not self.redis:
+                return {}
+            
+            prefix = f"{self.key_prefix}:metrics:"
+            metrics = {}
+            for key in self.redis.scan_iter(match=f"{prefix}*"):
+                metrics[key[len(prefix):]] = self.redis.hgetall(key)
+            return metrics
+        except Exception as e:
+            logger.error(f"Error getting metrics: {e}")
+            return {}
+    
+    def cluster_heartbeat(self, node_id, ttl):
+        """
+        记录节点心跳并清除超时节点
+        
+        Returns:
+            (存活节点ID列表(已排序), 本次清除的节点ID列表)
+        """
+        try:
+            if not self.redis:
+                return [], []
+            
+            now = time.time()
+            pipe = self.redis.pipeline()
+            pipe.zadd(self.nodes_key, {node_id: now})
+            pipe.zrangebyscore(self.nodes_key, '-inf', now - ttl)
+            pipe.zremrangebyscore(self.nodes_key, '-inf', now - ttl)
+            pipe.zrange(self.nodes_key, 0, -1)
+            _, dead, _, nodes = pipe.execute()
+            return sorted(nodes), dead
+        except Exception as e:
+            logger.error(f"Error sending cluster heartbeat: {e}")
+            return [], []
+    
+    def leave_cluster(self, node_id):
+        """节点退出集群，释放主节点租约"""
+        try:
+            if not self.redis:
+                return False
+            
+            self.redis.zrem(self.nodes_key, node_id)
+            self._release_leader(keys=[self.leader_key], args=[node_id])
+            return True
+        except Exception as e:
+            logger.error(f"Error leaving cluster: {e}")
+            return False
+    
+    def acquire_leader(self, node_id, lease):
+        """获取或续期主节点租约(秒)，返回本节点是否为主节点"""
+        try:
+            if not self.redis:
+                return False
+            
+            return bool(self._acquire_leader(keys=[self.leader_key], args=[node_id, int(lease * 1000)]))
+        except Exception as e:
+            logger.error(f"Error acquiring leader lease: {e}")
+            return False
+    
+    def get_leader(self):
+        """当前主节点ID"""
+        try:
+            if not self.redis:
+                return None
+            
+            return self.redis.get(self.leader_key)
+        except Exception as e:
+            logger.error(f"Error getting leader: {e}")
+            return None
+    
+    def delete_node_metrics(self, node_id):
+        """删除已下线节点的指标"""
+        try:
+            if not self.redis:
+                return 0
+            
+            keys = list(self.redis.scan_iter(match=f"{self.key_prefix}:metrics:*@{node_id}"))
+            return self.redis.delete(*keys) if keys else 0
+        except Exception as e:
+            logger.error(f"Error deleting metrics of node {node_id}: {e}")
+            return 0
+    
     def health_check(self):
         """健康检查"""
         try:
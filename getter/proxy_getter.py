@@ -2,80 +2,243 @@
 代理获取器
 从免费代理网站获取代理
 """
-import requests
+import aiohttp
+import asyncio
 import time
 from loguru import logger
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from setting import PROXY_SOURCES
-from db.redis_client import RedisClient
+from setting import (
+    PROXY_SOURCES, FETCH_CONCURRENCY, FETCH_PER_HOST, FETCH_TICK,
+    SOURCE_TARGET_YIELD, SOURCE_MIN_SAMPLE, SOURCE_INTERVAL_MAX_FACTOR, SURVIVAL_WINDOW
+)
+from db.redis_client import RedisClient, make_member
+from getter.sources import build_sources
+from utils.transport import DEFAULT_HEADERS
+
+
+def source_interval(stats, base):
+    """
+    按代理源的产出计算抓取间隔(秒)
+    
+    新代理验证通过率低于 SOURCE_TARGET_YIELD 时按比例拉长，最长为基础间隔的 SOURCE_INTERVAL_MAX_FACTOR 倍
+    """
+    new = int(stats.get('new', 0))
+    if new < SOURCE_MIN_SAMPLE:
+        return base
+    rate = int(stats.get('validated', 0)) / new
+    factor = SOURCE_TARGET_YIELD / rate if rate else SOURCE_INTERVAL_MAX_FACTOR
+    return base * min(max(factor, 1), SOURCE_INTERVAL_MAX_FACTOR)
 
 
 class ProxyGetter:
-    """代理获取器"""
+    """
+    代理获取器
+    
+    代理源由 getter/sources.py 中的插件下载和解析，每个源按自己的间隔抓取，
+    调度器每 FETCH_TICK 秒调用一次 run()，到期的源并发下载，同一主机的连接数受 FETCH_PER_HOST 限制。
+    304 或内容未变时跳过解析和入队。每个源保留上一次列出的代理，只把新增的代理放入隔离区；
+    低产出的源按 source_interval 降低抓取频率。
+    """
     
     def __init__(self):
         self.redis_client = RedisClient()
-        self.session = requests.Session()
-        self.session.headers.update({
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-        })
+        self.sources = build_sources(PROXY_SOURCES)
+    
+    def parse_proxies(self, parser):
+        """把解析结果转换为入队格式"""
+        return [{'proxy': address, 'protocol': protocol} for address, protocol in parser.addresses()]
     
-    def fetch_from_source(self, source):
-        """从指定源获取代理"""
-        proxies = []
+    async def fetch_from_source(self, session, source, state):
+        """
+        从指定源获取代理
+        
+        Args:
+            state: 该源上一次的抓取状态
+        
+        Returns:
+            (source, status, proxies, state): status 为 updated / not_modified / unchanged / error，
+            state 为入队完成后需要保存的源状态
+        """
         try:
-            logger.info(f"Fetching proxies from {source['name']}")
-            response = self.session.get(source['url'], timeout=10)
-            response.raise_for_status()
-            
-            # 解析代理列表 (ip:port格式)
-            for line in response.text.strip().split('\n'):
-                line = line.strip()
-                if line and ':' in line and not line.startswith('#'):
-                    try:
-                        # 清理可能的空白字符
-                        proxy = line.strip()
-                        if '://' in proxy:
-                            # 去掉协议前缀
-                            proxy = proxy.split('://')[1]
-                        
-                        ip, port = proxy.split(':', 1)
-                        port = int(port)
-                        
-                        # 验证IP和端口
-                        if 1 <= port <= 65535 and len(ip.split('.')) == 4:
-                            proxies.append({
-                                'proxy': f"{ip}:{port}",
-                                'protocol': source.get('type', 'http')
-                            })
-                    except Exception as e:
-                        logger.debug(f"Invalid proxy format: {line}, error: {e}")
-                        continue
-            
-            logger.info(f"Fetched {len(proxies)} proxies from {source['name']}")
-            return proxies
-            
+            status, parser, new_state = await source.fetch(session, state)
         except Exception as e:
-            logger.error(f"Failed to fetch from {source['name']}: {e}")
-            return []
+            logger.error(f"Failed to fetch from {source.name}: {e}")
+            return source, 'error', [], None
+        
+        if status != 'updated':
+            logger.info(f"Source {source.name} {status.replace('_', ' ')}")
+            return source, status, [], new_state
+        if source.incremental:
+            # 逐批产出的源由 ingest_batches 边读边入队
+            return source, 'updated', parser, new_state
+        
+        proxies = self.parse_proxies(parser)
+        new_state['count'] = len(proxies)
+        logger.info(f"Fetched {len(proxies)} proxies from {source.name}")
+        return source, 'updated', proxies, new_state
     
-    def process_proxies(self, proxies):
-        """处理获取到的代理"""
+    def process_proxies(self, proxies, source=None):
+        """
+        处理获取到的代理: 放入隔离区，由摄取管道验证通过后再进入代理池
+        
+        Returns:
+            (放入隔离区的数量, {因刚被清理而跳过的成员: 墓碑过期时间}, 隔离区已接收的成员)
+        """
         if not proxies:
-            return
+            return 0, {}, set()
+        
+        # 刚被清理的代理上游列表里往往还在，墓碑期内不再入队
+        proxies, tombstoned = self.redis_client.filter_tombstoned(proxies)
+        if tombstoned and source:
+            self.redis_client.incr_source_counter(source, 'suppressed', len(tombstoned))
+        queued_count, accepted = self.redis_client.add_pending(proxies, source)
         
-        added_count = 0
-        for proxy_info in proxies:
-            proxy = proxy_info['proxy']
-            protocol = proxy_info['protocol']
-            
-            if self.redis_client.add_proxy(proxy, protocol):
-                added_count += 1
+        logger.info(f"Queued {queued_count} new proxies for validation, {len(tombstoned)} tombstoned skipped")
+        return queued_count, tombstoned, accepted
+    
+    async def ingest_batches(self, source, batches):
+        """
+        逐批读取只产出新增内容的源并放入隔离区，内存占用与源的大小无关
         
-        logger.info(f"Added {added_count} new proxies to pool")
+        Returns:
+            (代理数量, 放入隔离区的数量, 跳过的数量)
+        """
+        total = queued = suppressed = 0
+        while True:
+            # 读文件和解析在线程中进行，不阻塞其他源的下载
+            batch = await asyncio.to_thread(next, batches, None)
+            if batch is None:
+                break
+            proxies = self.parse_proxies(batch)
+            batch_queued, batch_tombstoned, _ = self.process_proxies(proxies, source.name)
+            total += len(proxies)
+            queued += batch_queued
+            suppressed += len(batch_tombstoned)
+        logger.info(f"Read {total} new proxies from {source.name}")
+        return total, queued, suppressed
+    
+    def due_sources(self, states):
+        """到达抓取时间的代理源"""
+        # 调度器每 FETCH_TICK 秒调用一次，留出半个周期的余量，避免到期时间稍晚于调用时间时被推迟一整轮
+        deadline = time.time() + FETCH_TICK / 2
+        return [source for source in self.sources if float(states[source.name].get('next_fetch_at', 0)) <= deadline]
+    
+    async def fetch_all(self, states, sources):
+        """并发获取到期的代理源，每个源下载完成后立即把新增代理放入隔离区"""
+        start = time.monotonic()
+        counts = {'updated': 0, 'not_modified': 0, 'unchanged': 0, 'error': 0}
+        queued = suppressed = added_total = removed_total = 0
+        seen = set()
+        accepted = set()  # 本轮隔离区已接收的成员，多个源列出同一代理时只入队一次
+        tombstoned = {}  # 本轮墓碑期内被拦下的成员及墓碑过期时间
+        
+        # 超时由各源在请求时单独设置
+        connector = aiohttp.TCPConnector(limit=FETCH_CONCURRENCY, limit_per_host=FETCH_PER_HOST)
+        async with aiohttp.ClientSession(connector=connector, headers=DEFAULT_HEADERS) as session:
+            tasks = [self.fetch_from_source(session, source, states[source.name]) for source in sources]
+            for future in asyncio.as_completed(tasks):
+                source, status, proxies, state = await future
+                counts[status] += 1
+                if status == 'error':
+                    self.save_source_error(source, states[source.name])
+                    continue
+                
+                if status == 'updated' and source.incremental:
+                    try:
+                        state['count'], source_queued, source_suppressed = await self.ingest_batches(source, proxies)
+                    except Exception as e:
+                        logger.error(f"Failed to read from {source.name}: {e}")
+                        self.save_source_error(source, states[source.name])
+                        continue
+                    added_total += state['count']
+                    queued += source_queued
+                    suppressed += source_suppressed
+                    self.save_source_state(source, states[source.name], state)
+                    continue
+                
+                # 只处理与上一次相比新增的代理
+                added = removed = set()
+                if proxies:
+                    added, removed = self.redis_client.diff_source_members(
+                        source.name, {make_member(p['proxy'], p['protocol']) for p in proxies}
+                    )
+                    proxies = [p for p in proxies if make_member(p['proxy'], p['protocol']) in added]
+                    added_total += len(added)
+                    removed_total += len(removed)
+                    logger.info(f"Source {source.name}: {len(added)} added, {len(removed)} removed")
+                
+                # 去重: 开启协议探测时没有协议前缀的代理协议为 auto，同一 ip:port 只入队一次，协议由摄取管道探测确定
+                unique_proxies = []
+                for proxy_info in proxies:
+                    member = make_member(proxy_info['proxy'], proxy_info['protocol'])
+                    if member not in seen:
+                        seen.add(member)
+                        unique_proxies.append(proxy_info)
+                
+                source_queued, source_tombstoned, source_accepted = self.process_proxies(unique_proxies, source.name)
+                queued += source_queued
+                suppressed += len(source_tombstoned)
+                accepted |= source_accepted
+                tombstoned.update(source_tombstoned)
+                # 只保存隔离区已接收的新增成员，入队失败的下一轮仍算新增；
+                # 墓碑期内被拦下的单独记录，墓碑过期前不再算新增，过期后重新入队
+                self.redis_client.save_source_members(
+                    source.name, added & accepted, removed,
+                    {member: tombstoned[member] for member in added if member in tombstoned}
+                )
+                # 入队后再保存状态，入队失败时下一轮会重新下载
+                if state:
+                    self.save_source_state(source, states[source.name], state)
+        
+        return {
+            "sources": len(self.sources),
+            "skipped": len(self.sources) - len(sources),
+            **counts,
+            "added": added_total,
+            "removed": removed_total,
+            "unique": len(seen),
+            "queued": queued,
+            "suppressed": suppressed,
+            "elapsed_ms": round((time.monotonic() - start) * 1000)
+        }
+    
+    def save_source_state(self, source, previous, state):
+        """按产出计算下一次抓取时间，并保存源状态"""
+        interval = source_interval(previous, source.interval)
+        state.update({'interval': interval, 'next_fetch_at': time.time() + interval, 'errors': 0})
+        self.redis_client.set_source_state(source.name, state)
+    
+    def save_source_error(self, source, previous):
+        """
+        抓取或读取失败时按指数退避推迟下一次抓取，保留上一次的缓存信息
+        
+        第 n 次连续失败后等待 基础间隔 * 2^(n-1)，最长为基础间隔的 SOURCE_INTERVAL_MAX_FACTOR 倍
+        """
+        errors = int(previous.get('errors', 0)) + 1
+        delay = source.interval * min(2 ** (errors - 1), SOURCE_INTERVAL_MAX_FACTOR)
+        self.redis_client.set_source_state(source.name, {'errors': errors, 'next_fetch_at': time.time() + delay})
+        logger.warning(f"Source {source.name} failed {errors} times in a row, retrying in {delay:.0f}s")
+    
+    def source_stats(self):
+        """各代理源的产出指标，键为 {源名称}_{指标}"""
+        metrics = {}
+        for source in self.sources:
+            state = self.redis_client.get_source_state(source.name)
+            new = int(state.get('new', 0))
+            validated = int(state.get('validated', 0))
+            metrics.update({
+                f"{source.name}_new": new,
+                f"{source.name}_validated": validated,
+                f"{source.name}_survived_24h": int(state.get('survived_24h', 0)),
+                f"{source.name}_suppressed": int(state.get('suppressed', 0)),
+                f"{source.name}_errors": int(state.get('errors', 0)),
+                f"{source.name}_yield": round(validated / new, 4) if new else 0,
+                f"{source.name}_interval": round(float(state.get('interval', source.interval)))
+            })
+        return metrics
     
     def run(self):
         """运行代理获取"""
@@ -83,38 +246,33 @@ class ProxyGetter:
             logger.error("Redis not connected, cannot fetch proxies")
             return
         
-        logger.info("Starting proxy fetching...")
-        
-        all_proxies = []
-        for source in PROXY_SOURCES:
-            proxies = self.fetch_from_source(source)
-            all_proxies.extend(proxies)
-            
-            # 避免请求过快
-            time.sleep(1)
-        
-        # 去重
-        unique_proxies = []
-        seen = set()
-        for proxy_info in all_proxies:
-            proxy_key = (proxy_info['proxy'], proxy_info['protocol'])
-            if proxy_key not in seen:
-                seen.add(proxy_key)
-                unique_proxies.append(proxy_info)
-        
-        logger.info(f"Total unique proxies: {len(unique_proxies)}")
+        states = {source.name: self.redis_client.get_source_state(source.name) for source in self.sources}
+        sources = self.due_sources(states)
+        if not sources:
+            logger.debug("No proxy source due")
+            return
         
-        # 保存到Redis
-        self.process_proxies(unique_proxies)
+        logger.info(f"Starting proxy fetching: {', '.join(source.name for source in sources)}")
+        metrics = asyncio.run(self.fetch_all(states, sources))
+        self.redis_client.set_metrics("fetch", metrics)
+        self.redis_client.settle_survival(SURVIVAL_WINDOW)
+        self.redis_client.set_metrics("sources", self.source_stats())
+        logger.info(
+            f"Fetch cycle done in {metrics['elapsed_ms']}ms: {metrics['updated']} updated, "
+            f"{metrics['not_modified']} not modified, {metrics['unchanged']} unchanged, {metrics['error']} failed, "
+            f"{metrics['skipped']} not due"
+        )
+        logger.info(f"Total unique proxies: {metrics['unique']}")
         
         # 统计
         for protocol in ['http', 'https', 'socks4', 'socks5']:
             count = self.redis_client.get_proxy_count(protocol)
             logger.info(f"{protocol} proxies count: {count}")
+        logger.info(f"pending proxies count: {self.redis_client.get_pending_count()}")
 
 if __name__ == '__main__':
     from utils.logger import setup_logger
     setup_logger('getter')
     
     getter = ProxyGetter()
-    getter.run()
\ No newline at end of file
+    getter.run()
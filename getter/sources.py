@@ -0,0 +1,406 @@
+"""
+代理源插件
+每种代理源(纯文本列表、JSON接口、HTML表格、本地文件)各自负责下载和解析，
+并声明自己的抓取间隔、超时和并发数。PROXY_SOURCES 中每一项通过 kind 选择插件
+"""
+import asyncio
+import fnmatch
+import hashlib
+import importlib
+import json
+import mmap
+import os
+import sys
+import time
+from html.parser import HTMLParser
+import aiohttp
+from loguru import logger
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from setting import FETCH_INTERVAL, FETCH_TIMEOUT, FETCH_CHUNK_SIZE, FILE_BATCH_SIZE, SOURCE_PLUGINS, PROTOCOL_DETECT
+from utils.parser import ProxyListParser, PROTOCOLS
+from utils.probe import AUTO_PROTOCOL
+
+# 混合协议源的类型: 协议以每行的前缀为准，没有前缀的由摄取管道探测
+MIXED_TYPE = 'all'
+
+
+class ProxySource:
+    """
+    代理源插件基类
+
+    子类实现 fetch()，返回 (status, parser, state):
+        status: updated / not_modified / unchanged
+        parser: 解析结果(ProxyListParser)，未变化时为 None；
+                incremental 为 True 的源返回逐批产出 ProxyListParser 的迭代器，内容已经是新增部分
+        state: 需要保存的源状态，下一次抓取时原样传回
+    抓取失败时直接抛出异常。
+
+    配置项:
+        name: 源名称
+        type: 未标注协议的代理使用的协议，为 all 或开启 PROTOCOL_DETECT 时由摄取管道探测；
+              行内或字段中标注的协议始终优先
+        interval: 基础抓取间隔(秒)，默认 FETCH_INTERVAL
+        timeout: 单次下载超时(秒)，默认 FETCH_TIMEOUT
+        concurrency: 该源同时下载的地址数，默认 1
+    """
+
+    kind = None
+    # 是否采用行内或字段中标注的协议
+    honor_scheme = True
+    # 是否只产出新增内容(不需要和上一次的结果做差集)
+    incremental = False
+
+    def __init__(self, config):
+        self.config = config
+        self.name = config['name']
+        self.protocol = config.get('type', 'http')
+        if self.protocol == MIXED_TYPE or PROTOCOL_DETECT:
+            self.protocol = AUTO_PROTOCOL
+        self.interval = config.get('interval', FETCH_INTERVAL)
+        self.timeout = config.get('timeout', FETCH_TIMEOUT)
+        self.concurrency = config.get('concurrency', 1)
+
+    def new_parser(self):
+        """创建该源使用的解析器"""
+        return ProxyListParser(self.protocol, honor_scheme=self.honor_scheme)
+
+    async def fetch(self, session, state):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.name})"
+
+
+class HttpSource(ProxySource):
+    """
+    经HTTP下载的代理源
+
+    配置 url 或 urls(如分页接口)，多个地址按 concurrency 并发下载，合并为一份结果。
+    单个地址的源带上次响应的 ETag / Last-Modified 发送条件请求；所有源都按内容哈希判断是否变化。
+    子类实现 reader()，返回带 feed(chunk) / close() 的对象，close() 返回 ProxyListParser。
+    """
+
+    @property
+    def urls(self):
+        return self.config.get('urls') or [self.config['url']]
+
+    def reader(self):
+        raise NotImplementedError
+
+    async def _download(self, session, url, headers, semaphore):
+        """下载一个地址，返回 (response, parser, digest)，304 时 parser 为 None"""
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with semaphore:
+            async with session.get(url, headers=headers, timeout=timeout) as response:
+                if response.status == 304:
+                    return response, None, None
+                response.raise_for_status()
+                # 边下载边解析和计算哈希，不保留完整响应
+                digest = hashlib.sha1()
+                reader = self.reader()
+                async for chunk in response.content.iter_chunked(FETCH_CHUNK_SIZE):
+                    digest.update(chunk)
+                    reader.feed(chunk)
+                return response, reader.close(), digest.digest()
+
+    async def fetch(self, session, state):
+        urls = self.urls
+        headers = {}
+        if len(urls) == 1:
+            if state.get('etag'):
+                headers['If-None-Match'] = state['etag']
+            if state.get('last_modified'):
+                headers['If-Modified-Since'] = state['last_modified']
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        downloads = await asyncio.gather(*(self._download(session, url, headers, semaphore) for url in urls))
+        new_state = {'fetched_at': time.time()}
+        if all(parser is None for _, parser, _ in downloads):
+            return 'not_modified', None, new_state
+
+        if len(urls) == 1:
+            response = downloads[0][0]
+            new_state['etag'] = response.headers.get('ETag', '')
+            new_state['last_modified'] = response.headers.get('Last-Modified', '')
+
+        # 不支持条件请求的源按内容哈希判断是否变化
+        new_state['hash'] = hashlib.sha1(b''.join(digest for _, _, digest in downloads)).hexdigest()
+        if new_state['hash'] == state.get('hash'):
+            return 'unchanged', None, new_state
+
+        parser = downloads[0][1]
+        for _, other, _ in downloads[1:]:
+            parser.extend(other)
+        return 'updated', parser, new_state
+
+
+class PlainSource(HttpSource):
+    """纯文本列表，每行一个 ip:port，流式解析"""
+
+    kind = 'plain'
+
+    def reader(self):
+        return self.new_parser()
+
+
+class BufferedSource(HttpSource):
+    """需要完整响应才能解析的源，子类实现 rows(text) 返回 [(ip, port, protocol)]"""
+
+    def reader(self):
+        return _BufferedReader(self)
+
+    def rows(self, text):
+        raise NotImplementedError
+
+    def parse(self, body):
+        """把提取出的行转换为解析结果，地址和端口的校验与纯文本源一致"""
+        lines = []
+        for ip, port, protocol in self.rows(body.decode('utf-8', errors='ignore')):
+            protocol = str(protocol or '').lower()
+            prefix = f"{protocol}://" if protocol in PROTOCOLS else ''
+            lines.append(f"{prefix}{str(ip).strip()}:{str(port).strip()}" if port else f"{prefix}{str(ip).strip()}")
+        parser = self.new_parser()
+        parser.feed('\n'.join(lines).encode())
+        return parser.close()
+
+
+class JsonSource(BufferedSource):
+    """
+    JSON接口
+
+    配置项:
+        items: 代理列表在响应中的路径，用点分隔(如 "data.proxies")，为空时响应本身就是列表
+        fields: 字段名，默认 {"ip": "ip", "port": "port", "protocol": "protocol"}；
+                列表项也可以直接是 "ip:port" 字符串
+    """
+
+    kind = 'json'
+
+    def rows(self, text):
+        items = json.loads(text)
+        for key in filter(None, self.config.get('items', '').split('.')):
+            items = items[int(key)] if isinstance(items, list) else items[key]
+        fields = {"ip": "ip", "port": "port", "protocol": "protocol", **self.config.get('fields', {})}
+        for item in items:
+            if isinstance(item, str):
+                yield item, None, None
+            elif isinstance(item, dict) and item.get(fields['ip']):
+                yield item[fields['ip']], item.get(fields['port']), item.get(fields['protocol'])
+
+
+class _TableParser(HTMLParser):
+    """收集HTML表格中每一行单元格的文本"""
+
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+        self._row = None
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'tr':
+            self._row = []
+        elif tag in ('td', 'th') and self._row is not None:
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        if tag in ('td', 'th') and self._cell is not None:
+            self._row.append(''.join(self._cell).strip())
+            self._cell = None
+        elif tag == 'tr' and self._row is not None:
+            self.rows.append(self._row)
+            self._row = None
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+
+class HtmlTableSource(BufferedSource):
+    """
+    HTML表格
+
+    配置项:
+        columns: 列序号，默认 {"ip": 0, "port": 1}；没有 port 列时 ip 列应为 "ip:port"，
+                 可选 protocol 列
+    """
+
+    kind = 'html'
+
+    def rows(self, text):
+        columns = self.config.get('columns', {"ip": 0, "port": 1})
+        parser = _TableParser()
+        parser.feed(text)
+        parser.close()
+        width = max(columns.values()) + 1
+        for row in parser.rows:
+            if len(row) < width:
+                continue
+            yield (
+                row[columns['ip']],
+                row[columns['port']] if 'port' in columns else None,
+                row[columns['protocol']] if 'protocol' in columns else None
+            )
+
+
+class FileSource(ProxySource):
+    """
+    本地文件，每行一个 ip:port
+
+    配置项:
+        path: 文件路径
+    按修改时间和大小判断文件是否变化，在线程中分块读取和解析，不阻塞事件循环
+    """
+
+    kind = 'file'
+
+    def _read(self):
+        parser = self.new_parser()
+        with open(self.config['path'], 'rb') as f:
+            for chunk in iter(lambda: f.read(FETCH_CHUNK_SIZE), b''):
+                parser.feed(chunk)
+        return parser.close()
+
+    async def fetch(self, session, state):
+        stat = os.stat(self.config['path'])
+        new_state = {'fetched_at': time.time(), 'mtime': stat.st_mtime, 'size': stat.st_size}
+        if str(stat.st_mtime) == state.get('mtime') and str(stat.st_size) == state.get('size'):
+            return 'not_modified', None, new_state
+        parser = await asyncio.wait_for(asyncio.to_thread(self._read), self.timeout)
+        return 'updated', parser, new_state
+
+
+class DirectorySource(ProxySource):
+    """
+    本地目录，适合共享卷上定期投放的大文件
+
+    配置项:
+        path: 目录路径
+        pattern: 文件名匹配模式，默认 *.txt
+    按修改时间和大小轮询目录中的文件。新文件整个读取，变长的文件只读取追加的部分，
+    被截断或替换(inode变化)的文件重新读取。文件通过内存映射分块解析，每 FILE_BATCH_SIZE 个代理产出一批，
+    内存占用与文件大小无关。末尾不完整的一行留到下一次轮询，文件大小不再变化时再读取。
+    """
+
+    kind = 'directory'
+    incremental = True
+
+    def _plan(self, files):
+        """
+        比较目录中的文件和上次的状态
+
+        Returns:
+            (plan, new_files): plan 为 [(路径, 起始位置, 结束位置)]，new_files 为新的文件状态
+        """
+        directory = self.config['path']
+        pattern = self.config.get('pattern', '*.txt')
+        plan = []
+        new_files = {}
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file() or not fnmatch.fnmatch(entry.name, pattern):
+                    continue
+                stat = entry.stat()
+                size, offset = stat.st_size, 0
+                previous = files.get(entry.name)
+                if previous and previous['inode'] == stat.st_ino and previous['offset'] <= size:
+                    offset = previous['offset']
+                    if size == previous['size'] and stat.st_mtime == previous['mtime'] and offset == size:
+                        new_files[entry.name] = previous
+                        continue
+                    # 两次轮询之间大小没变，末尾没有换行的最后一行也已写完
+                    stable = size == previous['size']
+                else:
+                    stable = False
+
+                end = size
+                if not stable and size > offset:
+                    with open(entry.path, 'rb') as f:
+                        end = self._last_line_end(f, offset, size)
+                if end > offset:
+                    plan.append((entry.path, offset, end))
+                new_files[entry.name] = {'inode': stat.st_ino, 'size': size, 'mtime': stat.st_mtime, 'offset': end}
+        return plan, new_files
+
+    @staticmethod
+    def _last_line_end(f, start, size):
+        """start 之后最后一个换行符之后的位置，没有完整的行时返回 start"""
+        position = size
+        while position > start:
+            step = min(FETCH_CHUNK_SIZE, position - start)
+            f.seek(position - step)
+            index = f.read(step).rfind(b'\n')
+            if index >= 0:
+                return position - step + index + 1
+            position -= step
+        return start
+
+    def _batches(self, plan):
+        """按计划逐个文件内存映射、分块解析，逐批产出"""
+        parser = self.new_parser()
+        for path, start, end in plan:
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for position in range(start, end, FETCH_CHUNK_SIZE):
+                    parser.feed(mapped[position:min(position + FETCH_CHUNK_SIZE, end)])
+                    if len(parser) >= FILE_BATCH_SIZE:
+                        # 块边界不一定是行边界，不完整的末行交给下一批的解析器
+                        batch, parser = parser, self.new_parser()
+                        parser.carry_tail(batch)
+                        yield batch
+            # 文件之间不共享未完成的行
+            parser.close()
+        if len(parser):
+            yield parser
+
+    async def fetch(self, session, state):
+        files = json.loads(state.get('files') or '{}')
+        plan, new_files = await asyncio.to_thread(self._plan, files)
+        new_state = {'fetched_at': time.time(), 'files': json.dumps(new_files)}
+        if not plan:
+            return 'not_modified', None, new_state
+        return 'updated', self._batches(plan), new_state
+
+
+class _BufferedReader:
+    """缓存完整响应，结束时交给源解析"""
+
+    def __init__(self, source):
+        self.source = source
+        self.chunks = []
+
+    def feed(self, chunk):
+        self.chunks.append(chunk)
+
+    def close(self):
+        return self.source.parse(b''.join(self.chunks))
+
+
+SOURCE_KINDS = {
+    source.kind: source for source in (PlainSource, JsonSource, HtmlTableSource, FileSource, DirectorySource)
+}
+
+
+def _load_plugins():
+    """加载 SOURCE_PLUGINS 中注册的自定义插件，值为 "模块路径.类名" """
+    kinds = dict(SOURCE_KINDS)
+    for kind, path in SOURCE_PLUGINS.items():
+        try:
+            module, name = path.rsplit('.', 1)
+            kinds[kind] = getattr(importlib.import_module(module), name)
+        except Exception as e:
+            logger.error(f"Failed to load source plugin {kind} ({path}): {e}")
+    return kinds
+
+
+def build_sources(configs):
+    """按配置创建代理源插件，kind 缺省为 plain，未知类型的源跳过"""
+    kinds = _load_plugins()
+    sources = []
+    for config in configs:
+        kind = config.get('kind', 'plain')
+        if kind not in kinds:
+            logger.error(f"Unknown source kind {kind} for {config.get('name')}")
+            continue
+        sources.append(kinds[kind](config))
+    return sources
@@ -11,9 +11,14 @@ from loguru import logger
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from utils.logger import setup_logger
 from api.web import run_api_server
+from api.judge import run_judge_server
 from getter.proxy_getter import ProxyGetter
 from tester.proxy_tester import ProxyTester
+from tester.sharded import ShardedValidator
+from tester.profiles import ProfileValidator
+from core.pipeline import IngestPipeline
 from scheduler.scheduler import ProxyScheduler, run_scheduler
+from setting import VALIDATE_MODE
 
 def run_getter():
     """运行代理获取器"""
@@ -24,14 +29,31 @@ def run_getter():
 def run_tester():
     """运行代理测试器"""
     logger.info("Starting Proxy Tester...")
+    if VALIDATE_MODE == 'sharded':
+        ShardedValidator().run_forever()
+        return
+    
     tester = ProxyTester()
-    tester.run()
+    if VALIDATE_MODE == 'continuous':
+        tester.run_forever()
+    else:
+        tester.run()
+
+def run_ingest():
+    """运行摄取管道"""
+    logger.info("Starting Ingest Pipeline...")
+    IngestPipeline().run_forever()
+
+def run_profiles():
+    """运行配置档验证器"""
+    logger.info("Starting Profile Validator...")
+    ProfileValidator().run_forever()
 
 def main():
     """主入口函数"""
     parser = argparse.ArgumentParser(description="Proxy Pool Runner")
     parser.add_argument("service", 
-                       choices=["all", "api", "getter", "tester", "scheduler"],
+                       choices=["all", "api", "getter", "tester", "ingest", "profiles", "scheduler", "judge"],
                        help="Service to run")
     parser.add_argument("--debug", action="store_true", help="Enable debug mode")
     parser.add_argument("--host", default="0.0.0.0", help="API host")
@@ -71,6 +93,12 @@ def main():
         run_getter()
     elif args.service == "tester":
         run_tester()
+    elif args.service == "ingest":
+        run_ingest()
+    elif args.service == "profiles":
+        run_profiles()
+    elif args.service == "judge":
+        run_judge_server()
     elif args.service == "scheduler":
         scheduler = ProxyScheduler()
         scheduler.start()
@@ -0,0 +1,81 @@
+"""
+集群节点
+多个节点共用一个Redis时，按心跳维护存活节点、用租约选出主节点，并把到期队列的哈希槽划分给存活节点
+"""
+import threading
+from loguru import logger
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from setting import CLUSTER_NODE_ID, CLUSTER_HEARTBEAT, CLUSTER_NODE_TTL, CLUSTER_LEASE, CLUSTER_SLOTS
+from db.redis_client import RedisClient
+
+
+def assign_slots(nodes, node_id, slots=CLUSTER_SLOTS):
+    """
+    按排序后的节点列表把哈希槽等分为连续区间，返回 node_id 分到的槽
+
+    各节点用同一份存活列表独立计算，结果一致；列表变化的瞬间两个节点可能短暂认为同一个槽属于自己，
+    领取是原子的且带租约，不会重复验证同一个代理。
+    """
+    if node_id not in nodes:
+        return range(0)
+    index = nodes.index(node_id)
+    return range(index * slots // len(nodes), (index + 1) * slots // len(nodes))
+
+
+class ClusterNode:
+    """集群节点: 心跳、主节点租约和哈希槽划分"""
+
+    def __init__(self, node_id=CLUSTER_NODE_ID, redis_client=None):
+        self.node_id = node_id
+        self.redis_client = redis_client or RedisClient()
+        self.nodes = []
+        self.slots = range(0)
+        self.is_leader = False
+        self.running = False
+        self._stop = threading.Event()
+
+    def heartbeat(self):
+        """发送心跳、续期或竞争主节点租约，存活节点变化时重新划分哈希槽"""
+        nodes, dead = self.redis_client.cluster_heartbeat(self.node_id, CLUSTER_NODE_TTL)
+        is_leader = self.redis_client.acquire_leader(self.node_id, CLUSTER_LEASE)
+
+        if nodes != self.nodes:
+            self.nodes = nodes
+            self.slots = assign_slots(nodes, self.node_id)
+            logger.info(
+                f"Cluster has {len(nodes)} live nodes, node {self.node_id} owns "
+                f"{len(self.slots)}/{CLUSTER_SLOTS} slots"
+            )
+        if is_leader != self.is_leader:
+            self.is_leader = is_leader
+            logger.info(f"Node {self.node_id} {'became' if is_leader else 'is no longer'} the leader")
+
+        # 超时节点由最先发现的节点清除
+        for node_id in dead:
+            self.redis_client.delete_node_metrics(node_id)
+            logger.warning(f"Node {node_id} missed heartbeats, removed from cluster")
+        if self.is_leader:
+            metrics = {"nodes": len(nodes), "leader": self.node_id, "slots": CLUSTER_SLOTS}
+            metrics.update({f"{node_id}_slots": len(assign_slots(nodes, node_id)) for node_id in nodes})
+            self.redis_client.set_metrics("cluster", metrics, replace=True, per_node=False)
+
+    def run_forever(self):
+        """每 CLUSTER_HEARTBEAT 秒发送一次心跳，直到 stop()"""
+        self.running = True
+        while self.running:
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.error(f"Cluster heartbeat error: {e}")
+            self._stop.wait(CLUSTER_HEARTBEAT)
+
+    def stop(self):
+        """停止心跳并退出集群，其他节点在下一次心跳时接管本节点的槽和租约"""
+        self.running = False
+        self._stop.set()
+        self.redis_client.leave_cluster(self.node_id)
+        self.is_leader = False
+        self.slots = range(0)
@@ -0,0 +1,162 @@
+"""
+定时任务执行器
+每个任务有自己的锁和重叠策略，互不相关的任务在线程池中并发执行
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from setting import JOB_WORKERS, JOB_QUEUE_LIMIT
+
+# 重叠策略: 上一次执行还没结束时又到期
+# skip: 跳过这次; queue: 排队等上一次结束后执行(至多 JOB_QUEUE_LIMIT 次); coalesce: 合并为结束后立即补跑一次
+POLICIES = ('skip', 'queue', 'coalesce')
+
+
+class Job:
+    """一个定时任务及其运行指标"""
+
+    def __init__(self, name, func, interval, policy='skip'):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overlap policy: {policy}")
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.policy = policy
+        self.next_run = time.time() + interval
+        self.active = False  # 已交给线程池(排队或执行中)，相当于任务锁
+        self.pending = deque()  # 等上一次结束后执行的 (到期时间, 请求时间)
+        self.runs = 0
+        self.skipped = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.lag = 0.0  # 最近一次从到期到开始执行的延迟(秒)
+        self.max_lag = 0.0
+        self.lock_wait = 0.0  # 最近一次等上一次执行结束的时间(秒)
+        self.duration = 0.0
+
+    def stats(self):
+        """任务指标"""
+        return {
+            "running": int(self.active),
+            "pending": len(self.pending),
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "lag_ms": round(self.lag * 1000),
+            "max_lag_ms": round(self.max_lag * 1000),
+            "lock_wait_ms": round(self.lock_wait * 1000),
+            "duration_ms": round(self.duration * 1000)
+        }
+
+
+class JobExecutor:
+    """
+    定时任务执行器
+
+    调度线程睡到最近一个任务到期，把到期任务交给线程池。同一任务同时只有一次在执行，
+    重叠的执行按任务的策略跳过、排队或合并；排队的执行不占用线程池，不影响其他任务。
+    """
+
+    def __init__(self, workers=JOB_WORKERS):
+        self.jobs = {}
+        self.running = False
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Job")
+        self._wake = threading.Event()
+        self._state_lock = threading.Lock()
+
+    def add(self, name, func, interval, policy='skip'):
+        """注册任务，首次执行在一个间隔之后"""
+        self.jobs[name] = Job(name, func, interval, policy)
+        self._wake.set()
+        return self.jobs[name]
+
+    def submit(self, name, scheduled_at=None):
+        """
+        触发一次任务
+
+        Returns:
+            是否已提交到线程池(被跳过、排队或合并时为 False)
+        """
+        job = self.jobs[name]
+        now = time.time()
+        scheduled_at = scheduled_at or now
+        with self._state_lock:
+            if job.active:
+                if job.policy == 'skip':
+                    job.skipped += 1
+                    logger.debug(f"Job {name} still running, skipped")
+                elif job.policy == 'coalesce' and job.pending:
+                    job.coalesced += 1
+                elif job.policy == 'queue' and len(job.pending) >= JOB_QUEUE_LIMIT:
+                    job.skipped += 1
+                    logger.warning(f"Job {name} queue full, skipped")
+                else:
+                    job.pending.append((scheduled_at, now))
+                return False
+            job.active = True
+        try:
+            self._pool.submit(self._execute, job, scheduled_at, now)
+        except RuntimeError:
+            # 线程池已关闭(stop() 与调度循环同时发生)
+            job.active = False
+            return False
+        return True
+
+    def _execute(self, job, scheduled_at, requested_at):
+        """在线程池中执行任务，结束后接着执行排队的下一次"""
+        while True:
+            started = time.time()
+            job.lag = started - scheduled_at
+            job.max_lag = max(job.max_lag, job.lag)
+            try:
+                job.func()
+            except Exception as e:
+                job.errors += 1
+                logger.error(f"Job {job.name} error: {e}")
+            job.runs += 1
+            job.duration = time.time() - started
+
+            with self._state_lock:
+                if not job.pending or not self.running:
+                    job.pending.clear()
+                    job.active = False
+                    return
+                scheduled_at, requested_at = job.pending.popleft()
+            job.lock_wait = time.time() - requested_at
+
+    def run(self):
+        """调度循环，直到 stop()"""
+        self.running = True
+        while self.running:
+            now = time.time()
+            for job in list(self.jobs.values()):
+                if job.next_run > now:
+                    continue
+                scheduled_at = job.next_run
+                # 落后超过一个间隔时不补跑错过的次数
+                job.next_run = max(job.next_run + job.interval, now)
+                self.submit(job.name, scheduled_at)
+            next_run = min((job.next_run for job in self.jobs.values()), default=now + 1)
+            self._wake.wait(max(next_run - time.time(), 0.01))
+            self._wake.clear()
+
+    def stop(self, wait=False):
+        """停止调度，排队的执行不再进行；wait 为 True 时等待正在执行的任务结束"""
+        self.running = False
+        self._wake.set()
+        self._pool.shutdown(wait=wait)
+
+    def stats(self):
+        """各任务指标，键为 {任务名}_{指标}"""
+        metrics = {"workers": self.workers}
+        for name, job in self.jobs.items():
+            metrics.update({f"{name}_{key}": value for key, value in job.stats().items()})
+        return metrics
@@ -1,8 +1,7 @@
 """
 调度器模块
-使用 schedule 库进行定时任务调度
+定时任务由 JobExecutor 在线程池中执行，每个任务单独加锁
 """
-import schedule
 import time
 import threading
 from loguru import logger
@@ -10,10 +9,16 @@ import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from setting import FETCH_INTERVAL, VALIDATE_INTERVAL, CLEAN_INTERVAL
+from setting import (FETCH_TICK, VALIDATE_INTERVAL, CLEAN_INTERVAL, TOMBSTONE_TTL, VALIDATE_MODE, VALIDATE_PROFILES,
+                     JOB_METRICS_INTERVAL, CLUSTER_ENABLED)
 from getter.proxy_getter import ProxyGetter
 from tester.proxy_tester import ProxyTester
+from tester.sharded import ShardedValidator
+from tester.profiles import ProfileValidator
+from core.pipeline import IngestPipeline
 from db.redis_client import RedisClient
+from scheduler.executor import JobExecutor
+from scheduler.cluster import ClusterNode
 
 
 class ProxyScheduler:
@@ -23,76 +28,103 @@ class ProxyScheduler:
         self.running = False
         self.getter = ProxyGetter()
         self.tester = ProxyTester()
+        self.sharded = ShardedValidator() if VALIDATE_MODE == 'sharded' else None
+        self.ingest = IngestPipeline()
+        self.profiles = ProfileValidator() if VALIDATE_PROFILES else None
         self.redis_client = RedisClient()
-        self._lock = threading.Lock()
+        self.executor = JobExecutor()
+        # 集群模式: 获取和清理只在主节点执行，验证按哈希槽分给各节点
+        self.cluster = ClusterNode() if CLUSTER_ENABLED else None
+        for validator in (self.tester, self.sharded, self.profiles):
+            if validator:
+                validator.cluster = self.cluster
+    
+    def is_follower(self):
+        """集群模式下本节点不是主节点"""
+        return bool(self.cluster) and not self.cluster.is_leader
     
     def fetch_job(self):
         """获取代理任务"""
-        with self._lock:
-            logger.info("Running fetch job...")
-            try:
-                self.getter.run()
-            except Exception as e:
-                logger.error(f"Fetch job error: {e}")
+        if self.is_follower():
+            return
+        try:
+            self.getter.run()
+        except Exception as e:
+            logger.error(f"Fetch job error: {e}")
     
     def test_job(self):
         """测试代理任务"""
-        with self._lock:
-            logger.info("Running test job...")
-            try:
-                self.tester.run()
-            except Exception as e:
-                logger.error(f"Test job error: {e}")
+        logger.info("Running test job...")
+        try:
+            self.tester.run()
+        except Exception as e:
+            logger.error(f"Test job error: {e}")
     
     def cleanup_job(self):
         """清理低分代理任务"""
-        with self._lock:
-            logger.info("Running cleanup job...")
-            try:
-                for protocol in ['http', 'https', 'socks4', 'socks5']:
-                    proxies = self.redis_client.get_all_proxies(protocol)
-                    for proxy, score in proxies:
-                        if score < 10:  # 分数低于10的代理
-                            self.redis_client.remove_proxy(proxy, protocol)
-                            logger.debug(f"Removed low score proxy: {proxy} (score: {score})")
-            except Exception as e:
-                logger.error(f"Cleanup job error: {e}")
+        if self.is_follower():
+            return
+        logger.info("Running cleanup job...")
+        try:
+            removed = []
+            for protocol in ['http', 'https', 'socks4', 'socks5']:
+                proxies = self.redis_client.get_all_proxies(protocol)
+                for proxy, score in proxies:
+                    if score < 10:  # 分数低于10的代理
+                        self.redis_client.remove_proxy(proxy, protocol)
+                        removed.append(proxy)
+                        logger.debug(f"Removed low score proxy: {proxy} (score: {score})")
+            # 记录墓碑，避免下一轮获取时把同一批失效代理重新入队
+            self.redis_client.add_tombstones(removed, TOMBSTONE_TTL)
+            self.redis_client.set_metrics("cleanup", {
+                "removed": len(removed),
+                "tombstones": self.redis_client.get_tombstone_count()
+            })
+            logger.info(f"Removed {len(removed)} low score proxies")
+        except Exception as e:
+            logger.error(f"Cleanup job error: {e}")
     
     def stats_job(self):
         """统计任务"""
-        with self._lock:
-            try:
-                total_count = 0
-                for protocol in ['http', 'https', 'socks4', 'socks5']:
-                    count = self.redis_client.get_proxy_count(protocol)
-                    total_count += count
-                    logger.info(f"{protocol.upper()} proxies: {count}")
-                
-                logger.info(f"Total proxies in pool: {total_count}")
-            except Exception as e:
-                logger.error(f"Stats job error: {e}")
+        try:
+            total_count = 0
+            for protocol in ['http', 'https', 'socks4', 'socks5']:
+                count = self.redis_client.get_proxy_count(protocol)
+                total_count += count
+                logger.info(f"{protocol.upper()} proxies: {count}")
+            
+            logger.info(f"Total proxies in pool: {total_count}")
+        except Exception as e:
+            logger.error(f"Stats job error: {e}")
+    
+    def metrics_job(self):
+        """发布任务执行指标"""
+        try:
+            self.redis_client.set_metrics("jobs", self.executor.stats())
+        except Exception as e:
+            logger.error(f"Metrics job error: {e}")
     
     def setup_schedule(self):
         """设置定时任务"""
-        # 每5分钟获取一次代理
-        schedule.every(FETCH_INTERVAL).seconds.do(self.fetch_job)
+        # 每个代理源按自己的间隔获取，这里只定期检查哪些源到期；上一轮未结束时跳过
+        self.executor.add("fetch", self.fetch_job, FETCH_TICK, policy='skip')
         
-        # 每1分钟测试一次代理
-        schedule.every(VALIDATE_INTERVAL).seconds.do(self.test_job)
+        # 每1分钟测试一次到期代理 (持续验证模式下由独立线程负责)；验证慢于间隔时合并为结束后补跑一次
+        if VALIDATE_MODE == 'interval':
+            self.executor.add("test", self.test_job, VALIDATE_INTERVAL, policy='coalesce')
         
         # 每30分钟清理一次低分代理
-        schedule.every(CLEAN_INTERVAL).seconds.do(self.cleanup_job)
+        self.executor.add("cleanup", self.cleanup_job, CLEAN_INTERVAL, policy='skip')
         
         # 每5分钟统计一次
-        schedule.every(300).seconds.do(self.stats_job)
+        self.executor.add("stats", self.stats_job, 300, policy='skip')
+        self.executor.add("metrics", self.metrics_job, JOB_METRICS_INTERVAL, policy='skip')
         
         logger.info("Schedule setup completed")
     
     def run_schedule(self):
-        """运行调度循环"""
-        while self.running:
-            schedule.run_pending()
-            time.sleep(1)
+        """运行调度循环，直到 stop()"""
+        self.executor.run()
     
     def start(self):
         """启动调度器"""
@@ -103,20 +135,97 @@ class ProxyScheduler:
         self.running = True
         self.setup_schedule()
         
+        # 先完成一次心跳，确定本节点是否为主节点和负责的哈希槽
+        if self.cluster:
+            self.cluster.heartbeat()
+            self.start_cluster_node()
+        
+        # 摄取管道先启动，获取到的代理边入隔离区边验证
+        self.start_ingest_pipeline()
+        
         # 立即执行一次所有任务
         logger.info("Running initial tasks...")
-        self.fetch_job()
+        self.executor.submit("fetch")
         time.sleep(2)
-        self.test_job()
+        if VALIDATE_MODE == 'interval':
+            self.executor.submit("test")
+        else:
+            self.start_continuous_validation()
+        if self.profiles:
+            self.start_profile_validation()
         time.sleep(2)
-        self.stats_job()
+        self.executor.submit("stats")
         
         logger.info("Proxy scheduler started")
         self.run_schedule()
     
+    def start_cluster_node(self):
+        """启动集群心跳线程"""
+        def run_cluster():
+            try:
+                self.cluster.run_forever()
+            except Exception as e:
+                logger.error(f"Cluster node error: {e}")
+        
+        thread = threading.Thread(target=run_cluster, name="ClusterNode")
+        thread.daemon = True
+        thread.start()
+        logger.info(f"Cluster node {self.cluster.node_id} started")
+    
+    def start_ingest_pipeline(self):
+        """启动摄取管道线程"""
+        def run_ingest():
+            try:
+                self.ingest.run_forever()
+            except Exception as e:
+                logger.error(f"Ingest pipeline error: {e}")
+        
+        thread = threading.Thread(target=run_ingest, name="ProxyIngest")
+        thread.daemon = True
+        thread.start()
+        logger.info("Ingest pipeline thread started")
+    
+    def start_continuous_validation(self):
+        """启动持续验证线程"""
+        def run_tester():
+            try:
+                if self.sharded:
+                    self.sharded.run_forever()
+                else:
+                    self.tester.run_forever()
+            except Exception as e:
+                logger.error(f"Continuous validation error: {e}")
+        
+        thread = threading.Thread(target=run_tester, name="ProxyValidation")
+        thread.daemon = True
+        thread.start()
+        logger.info("Continuous validation thread started")
+    
+    def start_profile_validation(self):
+        """启动配置档验证线程"""
+        def run_profiles():
+            try:
+                self.profiles.run_forever()
+            except Exception as e:
+                logger.error(f"Profile validation error: {e}")
+        
+        thread = threading.Thread(target=run_profiles, name="ProfileValidation")
+        thread.daemon = True
+        thread.start()
+        logger.info("Profile validation thread started")
+    
     def stop(self):
         """停止调度器"""
         self.running = False
+        self.executor.stop()
+        self.tester.stop()
+        self.ingest.stop()
+        if self.profiles:
+            self.profiles.stop()
+        if self.sharded:
+            self.sharded.stop()
+        if self.cluster:
+            self.cluster.stop()
         logger.info("Proxy scheduler stopped")
 
 
@@ -2,6 +2,7 @@
 配置文件
 """
 import os
+import socket
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -23,35 +24,53 @@ PROXY_SCORE_MAX = 100
 PROXY_SCORE_MIN = 0
 PROXY_SCORE_INIT = 10
 
+# 按验证结果分类的加减分策略
+SCORE_POLICY = {
+    "success": 1,
+    "slow_success": 0,  # 成功但响应慢于 SLOW_RESPONSE_THRESHOLD
+    "bad_status": -1,  # 代理可用，但目标返回了非200或内容异常
+    "handshake_failed": -2,  # 连上代理但代理握手/隧道失败
+    "timeout": -3,
+    "refused": -5,  # 连接被拒绝，代理端口已关闭
+    "judge_fault": 0  # 判定站点故障，与代理无关
+}
+SLOW_RESPONSE_THRESHOLD = 3.0
+
+# 检查历史与排序配置 (每个代理保留最近64次检查结果和16次延迟分桶)
+RANK_CANDIDATES = 200  # 按历史排序时从高分代理中取的候选数量
+RANK_TOP = 10  # 从排序最靠前的若干个代理中随机返回，避免请求集中到同一个代理
+
 # 代理源配置
+# 混合列表每行带协议前缀(socks5://ip:port)，一次下载覆盖所有协议，不再单独下载各协议的列表
 PROXY_SOURCES = [
     {
         "name": "all_proxies",
         "url": "https://cdn.jsdelivr.net/gh/proxifly/free-proxy-list@main/proxies/all/data.txt",
         "type": "all"
     },
-    {
-        "name": "http_proxies", 
-        "url": "https://cdn.jsdelivr.net/gh/proxifly/free-proxy-list@main/proxies/protocols/http/data.txt",
-        "type": "http"
-    },
-    {
-        "name": "socks4_proxies",
-        "url": "https://cdn.jsdelivr.net/gh/proxifly/free-proxy-list@main/proxies/protocols/socks4/data.txt", 
-        "type": "socks4"
-    },
-    {
-        "name": "socks5_proxies",
-        "url": "https://cdn.jsdelivr.net/gh/proxifly/free-proxy-list@main/proxies/protocols/socks5/data.txt",
-        "type": "socks5"
-    },
     {
         "name": "us_proxies",
         "url": "https://cdn.jsdelivr.net/gh/proxifly/free-proxy-list@main/proxies/countries/US/data.txt",
-        "type": "http"
+        "type": "all"
     }
 ]
 
+# 代理源获取配置
+# PROXY_SOURCES 每一项可选: kind 插件类型(plain/json/html/file，默认 plain)、interval 基础抓取间隔(秒)、
+# timeout 下载超时(秒)、concurrency 该源同时下载的地址数(配置 urls 时)，各插件的其他配置项见 getter/sources.py
+SOURCE_PLUGINS = {}  # 自定义插件: {"kind": "模块路径.类名"}
+FETCH_TICK = 30  # 调度器检查代理源是否到期的间隔(秒)
+FETCH_TIMEOUT = 10  # 单个代理源的下载超时(秒)
+FETCH_CONCURRENCY = 10  # 同时下载的代理源数量
+FETCH_PER_HOST = 5  # 同一主机的并发连接上限，多个源在同一CDN上时避免请求过猛
+FETCH_CHUNK_SIZE = 65536  # 流式解析的块大小(字节)
+FILE_BATCH_SIZE = 50000  # 目录源每批入队的代理数量
+# 按产出调整抓取间隔: 新代理的验证通过率低于 SOURCE_TARGET_YIELD 时按比例拉长间隔
+SOURCE_TARGET_YIELD = 0.05
+SOURCE_MIN_SAMPLE = 200  # 新代理数量达到该值后才开始调整
+SOURCE_INTERVAL_MAX_FACTOR = 12  # 最长间隔为基础抓取间隔的倍数
+SURVIVAL_WINDOW = 86400  # 存活统计窗口(秒)
+
 # 代理验证配置
 VALIDATE_TIMEOUT = 5
 VALIDATE_URLS = [
@@ -60,10 +79,105 @@ VALIDATE_URLS = [
     "http://www.baidu.com"
 ]
 
+# 摄取管道配置 (新代理验证通过后才进入代理池)
+INGEST_WORKERS = 500  # 验证协程数，实际并发由自适应窗口决定
+INGEST_QUEUE_SIZE = 2000  # 阶段间有界队列长度
+INGEST_DRAIN_BATCH = 500  # 每次从隔离区取出的数量
+INGEST_PROMOTE_BATCH = 100  # 每次写入代理池的数量
+PENDING_LEASE = 600  # 从隔离区领取后的租约(秒)，结果写入后才移除；管道异常退出时未写入的代理在租约到期后重新被领取
+# queue: 摄取管道轮询隔离区; stream: 新代理同时写入候选流，摄取管道通过消费组阻塞读取，
+# 验证结果写入结果流，再由各节点的写入阶段分批写入代理池，可以水平扩展
+INGEST_MODE = os.getenv("INGEST_MODE", "queue")
+STREAM_BLOCK = 1000  # 读取流时的阻塞时长(毫秒)
+STREAM_CLAIM_IDLE = 300  # 条目被领取后超过该时长(秒)未确认时由其他消费者接管
+STREAM_MAXLEN = 1000000  # 流的近似最大长度，已确认的条目会立即删除，正常情况下远低于该值
+
+# 判定服务配置
+JUDGE_HOST = os.getenv("JUDGE_HOST", "0.0.0.0")
+JUDGE_PORT = int(os.getenv("JUDGE_PORT", 8000))
+# 设置后验证器以该判定站点为目标并划分匿名度，如 http://judge.example.com:8000/judge
+JUDGE_URL = os.getenv("JUDGE_URL", "")
+
+# 判定站点池配置 (验证请求按权重轮询分散到多个判定站点，故障站点自动剔除)
+# [{"url": ..., "weight": 1, "echo": False}]，echo 表示站点回显来源IP和请求头，可用于划分匿名度；
+# 为空时使用 JUDGE_URL，未设置 JUDGE_URL 时使用 VALIDATE_URLS
+JUDGE_POOL = []
+JUDGE_HEALTH_INTERVAL = 30  # 直连健康检查间隔(秒)
+JUDGE_HEALTH_TIMEOUT = 5
+JUDGE_MAX_LATENCY = 3.0  # 直连延迟超过该值(秒)视为检查失败
+JUDGE_EJECT_AFTER = 2  # 连续健康检查失败达到该次数后剔除
+JUDGE_EJECT_TIME = 60  # 首次剔除时长(秒)，再次剔除时翻倍
+JUDGE_EJECT_MAX = 1800
+JUDGE_SUSPECT_AFTER = 20  # 经代理访问连续失败达到该次数时提前做健康检查
+# 离群剔除: 每个统计窗口内，经代理访问的成功率低于其他健康站点合计成功率 JUDGE_OUTLIER_RATIO 倍的站点被剔除，
+# 用来发现直连正常、但对代理流量限速或拦截的站点(免费代理整体失败率很高，按成功率的比例比较)
+JUDGE_OUTLIER_WINDOW = 60  # 统计窗口(秒)
+JUDGE_OUTLIER_MIN_CHECKS = 50  # 窗口内访问次数达到该值的站点才参与比较
+JUDGE_OUTLIER_MIN_EXPECTED = 20  # 按其他站点的成功率，该站点预期成功次数达到该值时才判断，避免样本太少误判
+JUDGE_OUTLIER_RATIO = 0.4
+
+# HTTPS隧道检测配置 (HTTP代理通过CONNECT访问TLS判定站点成功后进入https池)
+HTTPS_DETECT = True
+HTTPS_JUDGE_URL = os.getenv("HTTPS_JUDGE_URL", "https://httpbin.org/ip")
+HTTPS_RECHECK_INTERVAL = 86400  # 不支持隧道的HTTP代理的重新检测间隔(秒)
+
+# 验证传输配置
+DNS_CACHE_TTL = 600  # 判定站点DNS缓存时间(秒)
+
+# TCP预检配置 (完整HTTP验证前淘汰死代理)
+PRECHECK_ENABLED = True
+PRECHECK_TIMEOUT = 1.5
+PRECHECK_CONCURRENCY = 1000
+PROTOCOL_DETECT = True  # 新代理入池前用一次连接探测实际协议，同一 ip:port 只验证一次
+
+# 带宽探测配置 (只对高分代理下载固定大小的内容，测量持续吞吐)
+BANDWIDTH_ENABLED = os.getenv("BANDWIDTH_ENABLED", "false").lower() == "true"
+BANDWIDTH_MIN_SCORE = 80  # 分数不低于该值的代理才做带宽探测
+BANDWIDTH_SIZE = 1048576  # 下载大小(字节)
+# 探测地址，可以是本地托管的文件；为空时使用判定服务的 /bytes/{BANDWIDTH_SIZE}
+BANDWIDTH_URL = os.getenv("BANDWIDTH_URL", "")
+BANDWIDTH_TIMEOUT = 30
+BANDWIDTH_CONCURRENCY = 20  # 独立的并发预算，不占用可用性验证的窗口
+BANDWIDTH_INTERVAL = 3600  # 同一代理的最短探测间隔(秒)
+
 # 调度器配置
-FETCH_INTERVAL = 300  # 5分钟
+FETCH_INTERVAL = 300  # 代理源默认抓取间隔(秒)
 VALIDATE_INTERVAL = 60  # 1分钟
 CLEAN_INTERVAL = 1800  # 30分钟
+TOMBSTONE_TTL = 86400  # 被清理的代理在该时长(秒)内再次获取到时不重新入队
+JOB_WORKERS = 4  # 定时任务线程池大小，互不相关的任务并发执行
+JOB_QUEUE_LIMIT = 3  # queue 策略的任务最多排队的次数，超过后跳过
+JOB_METRICS_INTERVAL = 60  # 任务指标的发布间隔(秒)
+
+# 连续验证配置
+VALIDATE_MODE = os.getenv("VALIDATE_MODE", "continuous")  # continuous: 按到期队列持续验证; sharded: 多进程分片持续验证; interval: 每VALIDATE_INTERVAL验证一次到期代理
+VALIDATE_WORKERS = int(os.getenv("VALIDATE_WORKERS", os.cpu_count() or 1))  # sharded 模式的工作进程数
+VALIDATE_SLO = 600  # 每个代理最长复检间隔(秒)
+RETEST_INTERVAL_HIGH = 120  # 分数>=60的复检间隔
+RETEST_INTERVAL_MID = 300  # 分数30-59的复检间隔
+RETEST_INTERVAL_LOW = 600  # 分数<30的复检间隔
+RETEST_NEW_PROXY_AGE = 3600  # 入池不足该时长的代理复检间隔减半
+RETEST_BACKOFF_AFTER = 3  # 连续失败达到该次数后复检间隔按指数增长，不再受 VALIDATE_SLO 限制
+RETEST_BACKOFF_MAX = 86400  # 指数退避的最长复检间隔(秒)
+DUE_BATCH_SIZE = 500  # 每次拉取的到期代理数量
+DUE_LEASE = 120  # 拉取后的租约时长，验证期间每 DUE_LEASE/3 秒续租；工作者异常退出时代理会在租约到期后重新到期
+
+# 集群配置 (多个节点共用一个Redis时开启)
+# 持有租约的主节点负责获取和清理，到期队列按 ip:port 的哈希槽划分给存活节点，各节点只验证自己的槽
+CLUSTER_ENABLED = os.getenv("CLUSTER_ENABLED", "false").lower() == "true"
+CLUSTER_NODE_ID = os.getenv("CLUSTER_NODE_ID", f"{socket.gethostname()}-{os.getpid()}")
+CLUSTER_HEARTBEAT = 2  # 心跳间隔(秒)
+CLUSTER_NODE_TTL = 6  # 超过该时长(秒)没有心跳的节点视为下线，它的槽分给其他节点
+CLUSTER_LEASE = 10  # 主节点租约时长(秒)，主节点下线后最迟在租约到期后由其他节点接任
+CLUSTER_SLOTS = 256  # 哈希槽数量
+
+# 验证配置档 (按目标站点单独验证和打分，/get?profile=名称 从该配置档的代理池中选择)
+# 例: {"shop_a": {"urls": ["https://shop-a.example.com/robots.txt"], "status": 200,
+#                 "markers": ["User-agent"], "timeout": 10, "interval": 900, "min_score": 30}}
+# urls: 验证地址，每次随机取一个; status: 期望的状态码; markers: 响应中必须包含的内容;
+# interval: 复检间隔(秒); min_score: 全局分数达到该值的代理才进入配置档验证
+VALIDATE_PROFILES = {}
+PROFILE_BATCH_SIZE = 200  # 每个配置档每次领取的到期代理数量
 
 # 日志配置
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
@@ -71,5 +185,15 @@ LOG_FILE = os.getenv("LOG_FILE", "proxy_pool.log")
 LOG_FORMAT = "{time:YYYY-MM-DD HH:mm:ss} | {level} | {name} | {message}"
 
 # 并发配置
-MAX_CONCURRENT_TASKS = 20
-BATCH_SIZE = 50
\ No newline at end of file
+MAX_CONCURRENT_TASKS = 20  # 初始并发窗口
+BATCH_SIZE = 50
+
+# 自适应并发配置 (AIMD)
+CONCURRENCY_MIN = 5
+CONCURRENCY_MAX = 2000
+CONCURRENCY_INCREASE_STEP = 5  # 健康时每个采样周期增加的窗口
+CONCURRENCY_DECREASE_FACTOR = 0.7  # 恶化时窗口收缩比例
+CONCURRENCY_TIMEOUT_RATIO_DELTA = 0.15  # 超时比例高于基线多少视为恶化
+CONCURRENCY_LOOP_LAG_LIMIT = 0.2  # 事件循环延迟上限(秒)
+CONCURRENCY_FD_RESERVE = 128  # 为Redis、日志等保留的文件描述符
+CONCURRENCY_FDS_PER_TASK = 2
@@ -0,0 +1,165 @@
+"""
+配置档验证器
+按 VALIDATE_PROFILES 中每个目标站点的验证地址、期望状态码和响应内容单独验证代理并打分
+"""
+import aiohttp
+import asyncio
+import random
+import time
+from typing import Any, Dict, List, Tuple
+from loguru import logger
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from setting import (
+    VALIDATE_PROFILES, VALIDATE_TIMEOUT, VALIDATE_SLO, VALIDATE_INTERVAL, PROFILE_BATCH_SIZE, DUE_LEASE
+)
+from db.redis_client import RedisClient
+from utils.concurrency import AdaptiveConcurrency
+from utils.transport import ValidationTransport, classify_exception
+from utils.scoring import success_outcome
+from tester.proxy_tester import keep_leased, stop_renewal
+
+
+class ProfileValidator:
+    """
+    配置档验证器
+
+    每个配置档有独立的代理池(proxy_pool:profile:{name}:{protocol})和到期队列，
+    全局分数达到 min_score 的代理自动加入，按配置档的 interval 复检。
+    所有配置档共用一个自适应并发窗口和传输层。
+    """
+
+    def __init__(self, profiles=None, redis_client=None):
+        self.profiles = profiles if profiles is not None else VALIDATE_PROFILES
+        self.redis_client = redis_client or RedisClient()
+        self.concurrency = AdaptiveConcurrency()
+        self.transport = ValidationTransport()
+        self.running = False
+        self.cluster = None  # 集群模式下只验证本节点哈希槽内的代理
+        self.started_at = time.time()
+        self.counters = {name: {"tested": 0, "valid": 0} for name in self.profiles}
+
+    async def check(self, profile: Dict[str, Any], proxy: str, protocol: str) -> Dict[str, Any]:
+        """按配置档验证一个代理"""
+        result = {'success': False, 'outcome': 'timeout', 'response_time': None}
+        url = random.choice(profile['urls'])
+        timeout = aiohttp.ClientTimeout(total=profile.get('timeout', VALIDATE_TIMEOUT))
+        try:
+            async with self.concurrency.slot():
+                async with self.transport.open(proxy, protocol) as (session, proxy_url):
+                    start = time.monotonic()
+                    async with session.get(url, proxy=proxy_url, timeout=timeout) as response:
+                        if response.status != profile.get('status', 200):
+                            result['outcome'] = 'bad_status'
+                            return result
+                        markers = profile.get('markers') or []
+                        if markers:
+                            body = await response.text(errors='ignore')
+                            if not all(marker in body for marker in markers):
+                                # 目标返回了验证页或拦截页
+                                result['outcome'] = 'bad_status'
+                                return result
+                        else:
+                            await response.read()
+                    result['response_time'] = time.monotonic() - start
+            result['success'] = True
+            result['outcome'] = success_outcome(result['response_time'])
+        except Exception as e:
+            result['outcome'] = classify_exception(e)
+            logger.debug(f"Proxy {proxy} failed profile check {url}: {result['outcome']}")
+        return result
+
+    async def validate_batch(self, name: str, proxies: List[Tuple[str, str]]) -> int:
+        """验证配置档的一批代理并写入结果，返回通过数量"""
+        profile = self.profiles[name]
+        renewer = asyncio.create_task(keep_leased(lambda: self.redis_client.renew_due_lease(proxies, profile=name)))
+        try:
+            results = await asyncio.gather(*(self.check(profile, proxy, protocol) for proxy, protocol in proxies))
+        finally:
+            await stop_renewal(renewer)
+        records = [dict(result, proxy=proxy, protocol=protocol) for (proxy, protocol), result in zip(proxies, results)]
+        self.redis_client.apply_profile_results(name, records, profile.get('interval', VALIDATE_SLO))
+
+        valid = sum(1 for record in records if record['success'])
+        self.counters[name]["tested"] += len(records)
+        self.counters[name]["valid"] += valid
+        return valid
+
+    def publish_metrics(self):
+        """写入各配置档指标"""
+        elapsed = max(time.time() - self.started_at, 1)
+        for name, counters in self.counters.items():
+            metrics = dict(counters)
+            metrics["checks_per_min"] = round(counters["tested"] * 60 / elapsed, 1)
+            metrics.update(self.redis_client.get_profile_stats(name))
+            self.redis_client.set_metrics(f"profile_{name}", metrics)
+
+    def sync_profiles(self):
+        """把达标的全局代理加入各配置档，移除不再达标的代理"""
+        for name, profile in self.profiles.items():
+            enrolled, removed = self.redis_client.sync_profile(name, profile.get('min_score', 0))
+            if enrolled or removed:
+                logger.info(f"Profile {name}: enrolled {enrolled}, removed {removed} below min_score")
+
+    async def run(self):
+        """持续验证所有配置档"""
+        if not self.redis_client.redis:
+            logger.error("Redis not connected, cannot validate profiles")
+            return
+        if not self.profiles:
+            logger.info("No validation profiles configured")
+            return
+
+        self.running = True
+        logger.info(f"Profile validation started: {', '.join(self.profiles)}")
+        batches = set()
+        last_sync = 0
+        try:
+            while self.running:
+                if time.time() - last_sync >= VALIDATE_INTERVAL:
+                    self.sync_profiles()
+                    self.publish_metrics()
+                    last_sync = time.time()
+
+                # 每个配置档至多一个批次在途，互不阻塞
+                busy = {task.get_name() for task in batches}
+                for name in self.profiles:
+                    if name in busy:
+                        continue
+                    proxies = self.redis_client.claim_due_proxies(
+                        PROFILE_BATCH_SIZE, DUE_LEASE, profile=name, slots=self.cluster.slots if self.cluster else None
+                    )
+                    if proxies:
+                        batches.add(asyncio.create_task(self.validate_batch(name, proxies), name=name))
+
+                if batches:
+                    done, batches = await asyncio.wait(batches, timeout=1, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception():
+                            logger.error(f"Profile {task.get_name()} batch error: {task.exception()}")
+                else:
+                    await asyncio.sleep(1)
+        finally:
+            if batches:
+                await asyncio.gather(*batches, return_exceptions=True)
+            await self.concurrency.stop()
+            await self.transport.close()
+            self.publish_metrics()
+            logger.info("Profile validation stopped")
+
+    def run_forever(self):
+        """在新事件循环中运行配置档验证"""
+        asyncio.run(self.run())
+
+    def stop(self):
+        """停止配置档验证"""
+        self.running = False
+
+
+if __name__ == '__main__':
+    from utils.logger import setup_logger
+    setup_logger('profiles')
+
+    ProfileValidator().run_forever()
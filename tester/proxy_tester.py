@@ -5,109 +5,335 @@
 import aiohttp
 import asyncio
 import time
-from typing import List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urljoin
 from loguru import logger
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from setting import VALIDATE_TIMEOUT, VALIDATE_URLS
+from setting import (
+    VALIDATE_TIMEOUT, VALIDATE_INTERVAL, VALIDATE_MODE, VALIDATE_SLO, DUE_BATCH_SIZE, DUE_LEASE,
+    PRECHECK_ENABLED, PRECHECK_CONCURRENCY, JUDGE_URL, BANDWIDTH_ENABLED, BANDWIDTH_URL, BANDWIDTH_SIZE,
+    BANDWIDTH_TIMEOUT, BANDWIDTH_CONCURRENCY, HTTPS_DETECT, HTTPS_JUDGE_URL
+)
 from db.redis_client import RedisClient
+from utils.concurrency import AdaptiveConcurrency, fd_limited_window
+from utils.probe import tcp_precheck
+from utils.transport import ValidationTransport, classify_exception, request_ssl
+from utils.judge import classify_anonymity
+from utils.tracing import RequestTimings, PhaseStats
+from utils.judge_pool import JudgePool
+from utils.scoring import success_outcome, least_severe, SUCCESS_OUTCOMES, FAILURE_OUTCOMES, NEUTRAL_OUTCOMES
+
+
+async def keep_leased(renew, interval=DUE_LEASE / 3):
+    """
+    批次验证期间每隔 interval 秒续租一次，直到任务被取消
+    
+    批次开始时并发窗口很小，500个代理的批次常常超过 DUE_LEASE，不续租会被其他验证者重新领取并重复验证。
+    renew 可以是普通函数或协程函数。
+    """
+    while True:
+        await asyncio.sleep(interval)
+        result = renew()
+        if asyncio.iscoroutine(result):
+            await result
+
+
+async def stop_renewal(renewer):
+    """取消续租任务并等待它结束，之后才能写入结果，避免续租覆盖新的到期时间"""
+    renewer.cancel()
+    await asyncio.gather(renewer, return_exceptions=True)
 
 
 class ProxyTester:
     """代理测试器"""
     
-    def __init__(self):
-        self.redis_client = RedisClient()
+    def __init__(self, redis_client=None):
+        self.redis_client = redis_client if redis_client is not None else RedisClient()
         self.timeout = aiohttp.ClientTimeout(total=VALIDATE_TIMEOUT)
-        self.test_urls = VALIDATE_URLS
+        # 验证请求按权重分散到判定站点池
+        self.judges = JudgePool.from_settings()
+        self.real_ip = None
+        self.concurrency = AdaptiveConcurrency()
+        self.transport = ValidationTransport()
+        self.running = False
+        self.cluster = None  # 集群模式下只验证本节点哈希槽内的代理
+        self.started_at = time.time()
+        self.tested_count = 0
+        self.valid_count = 0
+        self.precheck_dropped = 0
+        self.outcome_counts = {outcome: 0 for outcome in SUCCESS_OUTCOMES + FAILURE_OUTCOMES + NEUTRAL_OUTCOMES}
+        self.phase_stats = PhaseStats()
+        self.bandwidth_url = BANDWIDTH_URL or (urljoin(JUDGE_URL, f"/bytes/{BANDWIDTH_SIZE}") if JUDGE_URL else None)
+        self.bandwidth_enabled = BANDWIDTH_ENABLED and bool(self.bandwidth_url)
+        if BANDWIDTH_ENABLED and not self.bandwidth_url:
+            logger.warning("Bandwidth probe enabled but neither BANDWIDTH_URL nor JUDGE_URL is set")
+        self.bandwidth_probed = 0
+        self.tunnel_probed = 0
+        self.tunnel_found = 0
+        self._precheck_semaphore = None
+        self._precheck_loop = None
+        self._bandwidth_semaphore = None
+        self._bandwidth_loop = None
+        self._bandwidth_tasks = set()
+        self._bandwidth_inflight = set()  # 正在后台探测的 (proxy, protocol)
     
-    async def test_single_proxy(self, proxy: str, protocol: str, test_url: str) -> Tuple[bool, float]:
-        """测试单个代理"""
+    async def discover_real_ip(self):
+        """直连回显站点获取本机公网IP，用于识别透明代理"""
+        self.real_ip = await self.judges.discover_real_ip(self.transport.session)
+        return self.real_ip
+    
+    async def test_single_proxy(self, proxy: str, protocol: str, test_url: str,
+                                session=None, proxy_url=None, connect=None) -> Dict[str, Any]:
+        """
+        测试单个代理
+        
+        Args:
+            connect: TCP预检测得的建连耗时，计入阶段耗时
+        
+        Returns:
+            {'success', 'outcome', 'response_time', 'anonymity', 'timings'}，以判定站点为目标时划分匿名度，
+            timings 为成功请求的各阶段耗时
+        """
+        result = {'success': False, 'outcome': 'timeout', 'response_time': None, 'anonymity': None, 'timings': None}
         try:
-            # 构建代理URL
-            if protocol in ['socks4', 'socks5']:
-                proxy_url = f"{protocol}://{proxy}"
-            else:
-                proxy_url = f"http://{proxy}"
+            if session is None:
+                async with self.transport.open(proxy, protocol) as (session, proxy_url):
+                    return await self.test_single_proxy(proxy, protocol, test_url, session, proxy_url, connect)
             
-            connector = aiohttp.TCPConnector(ssl=False)
+            timings = RequestTimings(connect)
             
-            async with aiohttp.ClientSession(
-                connector=connector,
-                timeout=self.timeout
-            ) as session:
-                start_time = time.time()
+            async with session.get(
+                test_url, proxy=proxy_url, ssl=request_ssl(protocol), trace_request_ctx=timings
+            ) as response:
+                if response.status != 200:
+                    result['outcome'] = 'bad_status'
+                    return result
                 
+                if self.judges.is_echo(test_url):
+                    # 判定站点返回的内容必须完整可解析，否则视为代理篡改了响应
+                    payload = await response.json(content_type=None)
+                    result['anonymity'] = classify_anonymity(payload, self.real_ip)
+                elif protocol == 'https':
+                    # 证书校验通过的CONNECT隧道内是端到端TLS，代理无法添加请求头，目标看到的来源是代理IP
+                    result['anonymity'] = 'elite'
+                
+                result['success'] = True
+                result['timings'] = timings.finish()
+                result['response_time'] = result['timings']['total']
+                result['outcome'] = success_outcome(result['response_time'])
+                return result
+                        
+        except Exception as e:
+            result['outcome'] = classify_exception(e)
+            logger.debug(f"Proxy {proxy} test failed ({result['outcome']}): {e}")
+            return result
+    
+    def urls_for(self, protocol: str) -> List[str]:
+        """验证地址: https池中的代理经CONNECT隧道访问TLS判定站点，其余从判定站点池中轮询选2个"""
+        if protocol == 'https':
+            return [HTTPS_JUDGE_URL]
+        return self.judges.pick(2)
+    
+    async def test_proxy(self, proxy: str, protocol: str, connect=None) -> Dict[str, Any]:
+        """
+        全面测试代理: 2个判定站点并发检查，首个成功结果即返回，全部失败时取最轻的失败类型
+        
+        失败时用到的判定站点都已被剔除(或没有可用站点)，且代理并非拒绝连接，记为 judge_fault，不影响分数
+        """
+        failed = {'success': False, 'outcome': 'judge_fault', 'response_time': None, 'anonymity': None, 'timings': None}
+        urls = self.urls_for(protocol)
+        if not urls:
+            return failed
+        
+        async def attempt(test_url):
+            result = await self.test_single_proxy(proxy, protocol, test_url, session, proxy_url, connect)
+            self.judges.record(test_url, result['success'])
+            return result
+        
+        outcomes = []
+        async with self.transport.open(proxy, protocol) as (session, proxy_url):
+            tasks = [asyncio.ensure_future(attempt(test_url)) for test_url in urls]
+            try:
+                for future in asyncio.as_completed(tasks):
+                    result = await future
+                    if result['success']:
+                        return result
+                    outcomes.append(result['outcome'])
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        
+        if 'refused' not in outcomes and not any(self.judges.healthy(test_url) for test_url in urls):
+            return failed
+        return dict(failed, outcome=least_severe(outcomes) if outcomes else 'timeout')
+    
+    async def precheck_proxy(self, proxy: str, protocol: str) -> Tuple[str, float]:
+        """第一阶段: TCP预检，使用独立的并发预算，返回 (结果分类, 耗时)"""
+        loop = asyncio.get_running_loop()
+        if self._precheck_loop is not loop:
+            self._precheck_loop = loop
+            self._precheck_semaphore = asyncio.Semaphore(min(PRECHECK_CONCURRENCY, fd_limited_window()))
+        
+        host, port = proxy.rsplit(':', 1)
+        async with self._precheck_semaphore:
+            return await tcp_precheck(host, int(port), protocol)
+    
+    async def test_proxy_limited(self, proxy: str, protocol: str) -> Dict[str, Any]:
+        """两阶段测试: TCP预检通过后在自适应并发窗口内做完整HTTP测试"""
+        connect = None
+        if PRECHECK_ENABLED:
+            outcome, connect = await self.precheck_proxy(proxy, protocol)
+            if outcome != 'success':
+                self.precheck_dropped += 1
+                return {'success': False, 'outcome': outcome, 'response_time': None, 'anonymity': None, 'timings': None}
+        
+        async with self.concurrency.slot():
+            return await self.test_proxy(proxy, protocol, connect)
+    
+    async def measure_bandwidth(self, proxy: str, protocol: str) -> Optional[float]:
+        """
+        经代理下载 bandwidth_url，测量持续吞吐
+        
+        Returns:
+            KB/s，从收到首个数据块开始计时；超时则按已收到的数据计算，完全失败返回None
+        """
+        received = 0
+        first_byte_at = None
+        loop = asyncio.get_running_loop()
+        try:
+            async with self.transport.open(proxy, protocol) as (session, proxy_url):
                 async with session.get(
-                    test_url,
-                    proxy=proxy_url,
-                    headers={
-                        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-                    }
+                    self.bandwidth_url, proxy=proxy_url, timeout=aiohttp.ClientTimeout(total=BANDWIDTH_TIMEOUT)
                 ) as response:
-                    end_time = time.time()
-                    response_time = end_time - start_time
-                    
-                    if response.status == 200:
-                        return True, response_time
-                    else:
-                        return False, response_time
-                        
-        except asyncio.TimeoutError:
-            return False, float('inf')
+                    if response.status != 200:
+                        return None
+                    async for chunk in response.content.iter_any():
+                        if first_byte_at is None:
+                            first_byte_at = loop.time()
+                        received += len(chunk)
         except Exception as e:
-            logger.debug(f"Proxy {proxy} test failed: {e}")
-            return False, float('inf')
-    
-    async def test_proxy(self, proxy: str, protocol: str) -> Tuple[bool, float]:
-        """全面测试代理"""
-        success_count = 0
-        total_time = 0
-        
-        # 测试前2个URL
-        for i in range(min(2, len(self.test_urls))):
-            test_url = self.test_urls[i]
-            success, response_time = await self.test_single_proxy(proxy, protocol, test_url)
-            
-            if success:
-                success_count += 1
-                total_time += response_time
+            logger.debug(f"Proxy {proxy} bandwidth probe interrupted: {e}")
         
-        if success_count > 0:
-            avg_time = total_time / success_count
-            return True, avg_time
-        else:
-            return False, float('inf')
+        if first_byte_at is None:
+            return None
+        elapsed = max(loop.time() - first_byte_at, 1e-3)
+        return received / 1024 / elapsed
     
-    async def test_proxies_batch(self, proxies: List[Tuple[str, str]]):
-        """批量测试代理"""
+    async def probe_bandwidth(self, records: List[Dict[str, Any]]):
+        """对选出的验证结果做带宽探测，结果写入记录的 bandwidth 字段"""
+        loop = asyncio.get_running_loop()
+        if self._bandwidth_loop is not loop:
+            self._bandwidth_loop = loop
+            self._bandwidth_semaphore = asyncio.Semaphore(BANDWIDTH_CONCURRENCY)
+        
+        async def probe(record):
+            async with self._bandwidth_semaphore:
+                bandwidth = await self.measure_bandwidth(record['proxy'], record['protocol'])
+            # 探测失败记为0，按最短探测间隔重试
+            record['bandwidth'] = bandwidth or 0.0
+        
+        await asyncio.gather(*(probe(record) for record in records))
+        self.bandwidth_probed += len(records)
+    
+    def start_bandwidth_probes(self, records: List[Dict[str, Any]]):
+        """
+        在后台做带宽探测并单独写入结果，不阻塞可用性结果的写入和下一批领取
+        
+        同一代理上一次探测未结束时跳过；探测结束后 bandwidth_at 更新，按 BANDWIDTH_INTERVAL 再次探测。
+        """
+        records = [
+            record for record in records if (record['proxy'], record['protocol']) not in self._bandwidth_inflight
+        ]
+        if not records:
+            return
+        keys = [(record['proxy'], record['protocol']) for record in records]
+        self._bandwidth_inflight.update(keys)
+        
+        async def run():
+            try:
+                await self.probe_bandwidth(records)
+                saved = self.redis_client.save_bandwidth(records)
+                if asyncio.iscoroutine(saved):
+                    await saved
+            except Exception as e:
+                logger.error(f"Bandwidth probe error: {e}")
+            finally:
+                self._bandwidth_inflight.difference_update(keys)
+        
+        task = asyncio.create_task(run())
+        self._bandwidth_tasks.add(task)
+        task.add_done_callback(self._bandwidth_tasks.discard)
+    
+    async def wait_bandwidth_probes(self):
+        """等待后台带宽探测结束"""
+        if self._bandwidth_tasks:
+            await asyncio.gather(*self._bandwidth_tasks, return_exceptions=True)
+    
+    async def probe_tunnels(self, proxies: List[str]) -> List[Dict[str, Any]]:
+        """检测HTTP代理能否通过CONNECT建立TLS隧道，返回 https 协议的检测记录"""
+        async def probe(proxy):
+            async with self.concurrency.slot():
+                result = await self.test_proxy(proxy, 'https')
+            return dict(result, proxy=proxy, protocol='https', tunnel_probe=True)
+        
+        records = await asyncio.gather(*(probe(proxy) for proxy in proxies))
+        self.tunnel_probed += len(records)
+        self.tunnel_found += sum(1 for record in records if record['success'])
+        return records
+    
+    async def check_batch(self, proxies: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """批量测试代理，返回验证结果(不写入Redis)"""
+        await self.judges.maybe_check_health(self.transport.session)
         tasks = []
         for proxy, protocol in proxies:
-            task = self.test_proxy(proxy, protocol)
+            task = self.test_proxy_limited(proxy, protocol)
             tasks.append(task)
         
         results = await asyncio.gather(*tasks, return_exceptions=True)
         
         valid_count = 0
+        records = []
         for (proxy, protocol), result in zip(proxies, results):
             if isinstance(result, Exception):
                 logger.error(f"Error testing proxy {proxy}: {result}")
                 # 测试失败，降低分数
-                self.redis_client.update_proxy_score(proxy, protocol, success=False)
-                continue
+                result = {'success': False, 'outcome': 'handshake_failed', 'response_time': None,
+                          'anonymity': None, 'timings': None}
             
-            success, response_time = result
-            
-            if success:
+            if result['success']:
                 valid_count += 1
-                self.redis_client.update_proxy_score(proxy, protocol, success=True)
-                logger.debug(f"Proxy {proxy} valid, response time: {response_time:.2f}s")
+                if result['timings']:
+                    self.phase_stats.add(protocol, result['timings'])
+                logger.debug(f"Proxy {proxy} valid, response time: {result['response_time']:.2f}s")
             else:
-                self.redis_client.update_proxy_score(proxy, protocol, success=False)
                 logger.debug(f"Proxy {proxy} invalid")
+            self.outcome_counts[result['outcome']] = self.outcome_counts.get(result['outcome'], 0) + 1
+            records.append(dict(result, proxy=proxy, protocol=protocol))
         
+        self.tested_count += len(proxies)
+        self.valid_count += valid_count
+        return records
+    
+    async def test_proxies_batch(self, proxies: List[Tuple[str, str]]):
+        """批量测试代理并写入结果"""
+        renewer = asyncio.create_task(keep_leased(lambda: self.redis_client.renew_due_lease(proxies)))
+        try:
+            records = await self.check_batch(proxies)
+            valid_count = sum(1 for record in records if record['success'])
+            
+            if HTTPS_DETECT:
+                records += await self.probe_tunnels(self.redis_client.tunnel_candidates(records))
+        finally:
+            await stop_renewal(renewer)
+        
+        # 批量写入分数和下次复检时间，之后才开始带宽探测
+        self.redis_client.apply_results(records)
+        if self.bandwidth_enabled:
+            self.start_bandwidth_probes(self.redis_client.bandwidth_candidates(records))
         return valid_count
     
     def get_proxies_to_test(self, protocol='http', limit=50):
@@ -128,38 +354,124 @@ class ProxyTester:
             logger.error(f"Error getting proxies to test: {e}")
             return []
     
+    def publish_metrics(self):
+        """写入验证指标"""
+        elapsed = max(time.time() - self.started_at, 1)
+        metrics = {
+            "tested": self.tested_count,
+            "valid": self.valid_count,
+            "precheck_dropped": self.precheck_dropped,
+            "bandwidth_probed": self.bandwidth_probed,
+            "tunnel_probed": self.tunnel_probed,
+            "tunnel_found": self.tunnel_found,
+            "checks_per_min": round(self.tested_count * 60 / elapsed, 1),
+            "slo": VALIDATE_SLO
+        }
+        metrics.update({f"outcome_{outcome}": count for outcome, count in self.outcome_counts.items()})
+        metrics.update(self.redis_client.get_due_stats())
+        self.redis_client.set_metrics('validation', metrics)
+        self.redis_client.set_metrics('concurrency', self.concurrency.stats())
+        self.redis_client.set_metrics('phases', self.phase_stats.metrics())
+        self.redis_client.set_metrics('judges', self.judges.stats())
+    
     async def run_test(self):
-        """运行测试"""
+        """运行测试: 验证所有当前到期的代理"""
         if not self.redis_client.redis:
             logger.error("Redis not connected, cannot test proxies")
             return
         
-        total_tested = 0
-        total_valid = 0
+        self.redis_client.sync_due_queue()
+        await self.discover_real_ip()
+        tested_before = self.tested_count
+        valid_before = self.valid_count
         
-        for protocol in ['http', 'https', 'socks4', 'socks5']:
-            proxies = self.get_proxies_to_test(protocol, limit=20)
-            if not proxies:
-                continue
-            
-            logger.info(f"Testing {len(proxies)} {protocol} proxies...")
-            
-            valid_count = await self.test_proxies_batch(proxies)
-            
-            total_tested += len(proxies)
-            total_valid += valid_count
-            
-            logger.info(f"{protocol.upper()} test result: {valid_count}/{len(proxies)} valid")
+        try:
+            while True:
+                proxies = self.redis_client.claim_due_proxies(
+                    DUE_BATCH_SIZE, slots=self.cluster.slots if self.cluster else None
+                )
+                if not proxies:
+                    break
+                
+                logger.info(f"Testing {len(proxies)} due proxies...")
+                await self.test_proxies_batch(proxies)
+        finally:
+            await self.wait_bandwidth_probes()
+            await self.concurrency.stop()
+            await self.transport.close()
+            self.publish_metrics()
         
+        total_tested = self.tested_count - tested_before
+        total_valid = self.valid_count - valid_before
         logger.info(f"Total test result: {total_valid}/{total_tested} valid proxies")
+        logger.info(f"Concurrency window: {self.concurrency.window}, rate: {self.concurrency.rate:.1f}/s")
+    
+    async def run_continuous(self):
+        """持续验证: 从到期队列分批拉取代理"""
+        if not self.redis_client.redis:
+            logger.error("Redis not connected, cannot test proxies")
+            return
+        
+        self.running = True
+        self.redis_client.sync_due_queue()
+        await self.discover_real_ip()
+        logger.info("Continuous validation started")
+        
+        batches = set()
+        last_report = time.time()
+        try:
+            while self.running:
+                # 保持两个批次在途，避免批次尾部并发窗口空闲
+                if len(batches) < 2:
+                    proxies = self.redis_client.claim_due_proxies(
+                        DUE_BATCH_SIZE, slots=self.cluster.slots if self.cluster else None
+                    )
+                    if proxies:
+                        batches.add(asyncio.create_task(self.test_proxies_batch(proxies)))
+                        continue
+                
+                if batches:
+                    done, batches = await asyncio.wait(batches, timeout=1, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception():
+                            logger.error(f"Validation batch error: {task.exception()}")
+                else:
+                    await asyncio.sleep(1)
+                
+                if time.time() - last_report >= VALIDATE_INTERVAL:
+                    self.publish_metrics()
+                    last_report = time.time()
+        finally:
+            if batches:
+                await asyncio.gather(*batches, return_exceptions=True)
+            await self.wait_bandwidth_probes()
+            await self.concurrency.stop()
+            await self.transport.close()
+            self.publish_metrics()
+            logger.info("Continuous validation stopped")
     
     def run(self):
         """运行代理测试"""
         asyncio.run(self.run_test())
+    
+    def run_forever(self):
+        """持续运行代理测试"""
+        asyncio.run(self.run_continuous())
+    
+    def stop(self):
+        """停止持续验证"""
+        self.running = False
 
 if __name__ == '__main__':
     from utils.logger import setup_logger
     setup_logger('tester')
     
-    tester = ProxyTester()
-    tester.run()
\ No newline at end of file
+    if VALIDATE_MODE == 'sharded':
+        from tester.sharded import ShardedValidator
+        ShardedValidator().run_forever()
+    else:
+        tester = ProxyTester()
+        if VALIDATE_MODE == 'continuous':
+            tester.run_forever()
+        else:
+            tester.run()
\ No newline at end of file
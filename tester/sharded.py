@@ -0,0 +1,289 @@
+"""
+多进程分片验证引擎
+按 ip:port 一致性哈希把到期代理分配给多个工作进程，每个进程有独立的事件循环和异步Redis客户端
+"""
+import asyncio
+import multiprocessing
+import queue
+import time
+from collections import Counter, deque
+from loguru import logger
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from setting import VALIDATE_WORKERS, DUE_BATCH_SIZE, DUE_LEASE, VALIDATE_INTERVAL, VALIDATE_SLO, HTTPS_DETECT
+from db.redis_client import RedisClient
+from utils.hashring import HashRing
+from utils.tracing import PhaseStats
+
+
+def _shard_main(shard_id, task_queue, stats_queue, taken):
+    """工作进程入口"""
+    from utils.logger import setup_logger
+    setup_logger(f'validator-{shard_id}')
+    try:
+        asyncio.run(_shard_loop(shard_id, task_queue, stats_queue, taken))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _shard_loop(shard_id, task_queue, stats_queue, taken):
+    """
+    工作进程主循环: 接收分片批次，验证并写入结果
+
+    taken 是已从队列取出的批次数，主进程据此停止为已开始验证的批次续租，之后由本进程续租。
+    """
+    from db.async_redis_client import AsyncRedisClient
+    from tester.proxy_tester import ProxyTester, keep_leased, stop_renewal
+
+    redis_client = AsyncRedisClient()
+    tester = ProxyTester(redis_client=redis_client)
+    await tester.discover_real_ip()
+    loop = asyncio.get_running_loop()
+
+    async def run_batch(proxies):
+        start = time.time()
+        renewer = asyncio.create_task(keep_leased(lambda: redis_client.renew_due_lease(proxies)))
+        try:
+            records = await tester.check_batch(proxies)
+            valid = sum(1 for record in records if record['success'])
+            outcomes = dict(Counter(record['outcome'] for record in records))
+            if HTTPS_DETECT:
+                records += await tester.probe_tunnels(await redis_client.tunnel_candidates(records))
+        finally:
+            await stop_renewal(renewer)
+        await redis_client.apply_results(records)
+        if tester.bandwidth_enabled:
+            tester.start_bandwidth_probes(await redis_client.bandwidth_candidates(records))
+        # 取走本进程累计的阶段耗时，由主进程汇总
+        phases, tester.phase_stats.totals = tester.phase_stats.totals, {}
+        stats_queue.put((
+            shard_id, len(proxies), valid, time.time() - start, tester.concurrency.window, outcomes, phases
+        ))
+
+    batches = set()
+    try:
+        while True:
+            proxies = await loop.run_in_executor(None, task_queue.get)
+            if proxies is None:
+                break
+            taken.value += 1
+            batches.add(asyncio.create_task(run_batch(proxies)))
+            # 保持两个批次在途
+            if len(batches) >= 2:
+                done, batches = await asyncio.wait(batches, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception():
+                        logger.error(f"Shard {shard_id} batch error: {task.exception()}")
+    finally:
+        if batches:
+            await asyncio.gather(*batches, return_exceptions=True)
+        await tester.wait_bandwidth_probes()
+        await tester.concurrency.stop()
+        await tester.transport.close()
+        await redis_client.close()
+
+
+class ShardedValidator:
+    """多进程分片验证引擎"""
+
+    def __init__(self, workers=VALIDATE_WORKERS):
+        self.workers = max(1, workers)
+        self.redis_client = RedisClient()
+        self.ring = HashRing(range(self.workers))
+        self.running = False
+        self.cluster = None  # 集群模式下只验证本节点哈希槽内的代理
+        self._context = multiprocessing.get_context('spawn')
+        self._processes = []
+        self._task_queues = []
+        self._taken = []  # 各工作进程已从队列取出的批次数(共享内存)
+        self._put_counts = []  # 放入各工作进程当前队列的批次数
+        self._queued = []  # 各工作进程已放入队列的批次 (序号, 代理)，序号不超过 taken 的已开始验证
+        self._undispatched = []  # 本轮尚未放入队列的 (分片, 代理)
+        self._last_renewal = 0.0
+        self._stats_queue = None
+        # 每个工作进程的累计指标
+        self.shard_stats = {
+            shard_id: {"tested": 0, "valid": 0, "busy": 0.0, "window": 0}
+            for shard_id in range(self.workers)
+        }
+        self.outcome_counts = Counter()
+        self.phase_stats = PhaseStats()
+        self.started_at = time.time()
+        self.restarts = 0
+
+    def partition(self, proxies):
+        """按 ip:port 一致性哈希划分代理"""
+        shards = [[] for _ in range(self.workers)]
+        for proxy, protocol in proxies:
+            shards[self.ring.get_node(proxy)].append((proxy, protocol))
+        return shards
+
+    def _spawn_worker(self, shard_id):
+        """启动一个分片的工作进程，返回 (任务队列, 已取出批次计数, 进程)"""
+        # 有界队列: 工作进程处理不过来时阻塞领取，形成背压
+        task_queue = self._context.Queue(maxsize=2)
+        taken = self._context.Value('L', 0)
+        process = self._context.Process(
+            target=_shard_main,
+            args=(shard_id, task_queue, self._stats_queue, taken),
+            name=f"ProxyValidator-{shard_id}",
+            daemon=True
+        )
+        process.start()
+        return task_queue, taken, process
+
+    def start_workers(self):
+        """启动工作进程"""
+        self._stats_queue = self._context.Queue()
+        for shard_id in range(self.workers):
+            task_queue, taken, process = self._spawn_worker(shard_id)
+            self._task_queues.append(task_queue)
+            self._taken.append(taken)
+            self._processes.append(process)
+            self._put_counts.append(0)
+            self._queued.append(deque())
+        logger.info(f"Started {self.workers} validation worker processes")
+
+    def revive_workers(self):
+        """
+        重启已退出的工作进程，返回重启的数量
+
+        退出进程队列中尚未处理的批次随旧队列丢弃，这些代理在租约到期后重新到期。
+        """
+        revived = 0
+        for shard_id, process in enumerate(self._processes):
+            if process.is_alive() or not self.running:
+                continue
+            logger.warning(f"Validation worker {shard_id} exited with code {process.exitcode}, restarting")
+            self._task_queues[shard_id].cancel_join_thread()
+            self.restarts += 1
+            self._task_queues[shard_id], self._taken[shard_id], self._processes[shard_id] = self._spawn_worker(shard_id)
+            # 旧队列中的批次不再续租
+            self._put_counts[shard_id] = 0
+            self._queued[shard_id].clear()
+            revived += 1
+        return revived
+
+    def collect_stats(self):
+        """汇总工作进程上报的指标"""
+        while True:
+            try:
+                shard_id, tested, valid, elapsed, window, outcomes, phases = self._stats_queue.get_nowait()
+            except queue.Empty:
+                break
+            stats = self.shard_stats[shard_id]
+            stats["tested"] += tested
+            stats["valid"] += valid
+            stats["busy"] += elapsed
+            stats["window"] = window
+            self.outcome_counts.update(outcomes)
+            self.phase_stats.merge(phases)
+
+    def publish_metrics(self):
+        """写入分片指标"""
+        self.collect_stats()
+        elapsed = max(time.time() - self.started_at, 1)
+        metrics = {"workers": self.workers, "restarts": self.restarts, "slo": VALIDATE_SLO}
+        total = 0
+        for shard_id, stats in self.shard_stats.items():
+            metrics[f"shard_{shard_id}_checks_per_min"] = round(stats["tested"] * 60 / elapsed, 1)
+            metrics[f"shard_{shard_id}_valid"] = stats["valid"]
+            metrics[f"shard_{shard_id}_window"] = stats["window"]
+            total += stats["tested"]
+        metrics["tested"] = total
+        metrics["checks_per_min"] = round(total * 60 / elapsed, 1)
+        metrics.update({f"outcome_{outcome}": count for outcome, count in self.outcome_counts.items()})
+        metrics.update(self.redis_client.get_due_stats())
+        self.redis_client.set_metrics('validation', metrics)
+        self.redis_client.set_metrics('phases', self.phase_stats.metrics())
+
+    def renew_leases(self):
+        """
+        每 DUE_LEASE/3 秒为已领取、但工作进程还没开始验证的批次续租
+
+        工作进程同时验证两个批次，队列里还能排两个，排队的批次常常等待超过 DUE_LEASE，
+        不续租会被重新领取并重复验证。工作进程开始验证后由它自己续租。
+        """
+        if time.time() - self._last_renewal < DUE_LEASE / 3:
+            return
+        self._last_renewal = time.time()
+        proxies = [proxy for _, batch in self._undispatched for proxy in batch]
+        for shard_id, batches in enumerate(self._queued):
+            taken = self._taken[shard_id].value
+            while batches and batches[0][0] <= taken:
+                batches.popleft()
+            proxies.extend(proxy for _, batch in batches for proxy in batch)
+        if proxies:
+            self.redis_client.renew_due_lease(proxies)
+
+    def dispatch(self, shards):
+        """把分片批次交给工作进程，队列满时等待，等待期间续租"""
+        self._undispatched = [(shard_id, proxies) for shard_id, proxies in enumerate(shards) if proxies]
+        while self._undispatched and self.running:
+            shard_id, proxies = self._undispatched[0]
+            try:
+                self._task_queues[shard_id].put(proxies, timeout=1)
+            except queue.Full:
+                self.collect_stats()
+                # 工作进程退出后队列不会再被消费，重启它再重新放入
+                self.revive_workers()
+                self.renew_leases()
+                continue
+            self._put_counts[shard_id] += 1
+            self._queued[shard_id].append((self._put_counts[shard_id], proxies))
+            self._undispatched.pop(0)
+        self._undispatched = []
+
+    def run_forever(self):
+        """持续从到期队列领取代理并分发"""
+        if not self.redis_client.redis:
+            logger.error("Redis not connected, cannot test proxies")
+            return
+
+        self.running = True
+        self.redis_client.sync_due_queue()
+        self.start_workers()
+
+        last_report = time.time()
+        try:
+            while self.running:
+                self.revive_workers()
+                self.renew_leases()
+                proxies = self.redis_client.claim_due_proxies(
+                    DUE_BATCH_SIZE * self.workers, slots=self.cluster.slots if self.cluster else None
+                )
+                if proxies:
+                    self.dispatch(self.partition(proxies))
+                else:
+                    time.sleep(1)
+
+                if time.time() - last_report >= VALIDATE_INTERVAL:
+                    self.publish_metrics()
+                    last_report = time.time()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """通知工作进程退出并等待"""
+        for task_queue in self._task_queues:
+            try:
+                task_queue.put(None, timeout=1)
+            except queue.Full:
+                pass
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self.publish_metrics()
+        self._processes = []
+        self._task_queues = []
+        self._taken = []
+        self._put_counts = []
+        self._queued = []
+        logger.info("Validation worker processes stopped")
+
+    def stop(self):
+        """停止分片验证"""
+        self.running = False
@@ -0,0 +1,83 @@
+"""
+代理获取器测试: 代理源列出的代理按协议放入隔离区
+"""
+import asyncio
+import sys
+import os
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import getter.proxy_getter as proxy_getter
+import getter.sources as sources
+from db.redis_client import make_member
+
+LISTING = b"1.1.1.1:80\nsocks5://2.2.2.2:1080\nhttps://3.3.3.3:443\n4.4.4.4:8080\n1.1.1.1:80\n"
+
+
+class FakeRedisClient:
+    """只记录获取器写入隔离区和源成员的内存实现"""
+
+    redis = True
+
+    def __init__(self):
+        self.pending = []
+        self.members = {}
+
+    def diff_source_members(self, name, members):
+        previous = self.members.get(name, set())
+        return members - previous, previous - members
+
+    def filter_tombstoned(self, proxies):
+        return proxies, {}
+
+    def add_pending(self, proxies, source=None):
+        self.pending.extend((proxy_info['proxy'], proxy_info['protocol']) for proxy_info in proxies)
+        return len(proxies), {make_member(proxy_info['proxy'], proxy_info['protocol']) for proxy_info in proxies}
+
+    def save_source_members(self, name, added, removed, suppressed=None):
+        self.members.setdefault(name, set()).update(added)
+        self.members[name] -= removed
+
+    def set_source_state(self, name, state):
+        pass
+
+
+def fetch_pending(monkeypatch, detect, source_type):
+    """按给定配置抓取一次 LISTING，返回放入隔离区的 (proxy, protocol)"""
+    monkeypatch.setattr(sources, 'PROTOCOL_DETECT', detect)
+    monkeypatch.setattr(proxy_getter, 'RedisClient', FakeRedisClient)
+    monkeypatch.setattr(proxy_getter, 'PROXY_SOURCES', [
+        {"name": "test", "url": "http://example.com/proxies.txt", "type": source_type}
+    ])
+    getter = proxy_getter.ProxyGetter()
+    source = getter.sources[0]
+
+    async def fetch(session, state):
+        parser = source.new_parser()
+        parser.feed(LISTING)
+        return 'updated', parser.close(), {}
+
+    monkeypatch.setattr(source, 'fetch', fetch)
+    asyncio.run(getter.fetch_all({source.name: {}}, [source]))
+    return sorted(getter.redis_client.pending)
+
+
+@pytest.mark.parametrize('source_type', ['http', 'all'])
+def test_detect_keeps_line_schemes(monkeypatch, source_type):
+    # 开启协议探测时只有没有前缀的行交给摄取管道探测，行内标注的协议原样入队
+    assert fetch_pending(monkeypatch, True, source_type) == [
+        ("1.1.1.1:80", "auto"), ("2.2.2.2:1080", "socks5"), ("3.3.3.3:443", "https"), ("4.4.4.4:8080", "auto")
+    ]
+
+
+def test_without_detect_uses_source_type(monkeypatch):
+    assert fetch_pending(monkeypatch, False, 'socks4') == [
+        ("1.1.1.1:80", "socks4"), ("2.2.2.2:1080", "socks5"), ("3.3.3.3:443", "https"), ("4.4.4.4:8080", "socks4")
+    ]
+
+
+def test_without_detect_mixed_source_detects_unprefixed(monkeypatch):
+    assert fetch_pending(monkeypatch, False, 'all') == [
+        ("1.1.1.1:80", "auto"), ("2.2.2.2:1080", "socks5"), ("3.3.3.3:443", "https"), ("4.4.4.4:8080", "auto")
+    ]
@@ -0,0 +1,70 @@
+"""
+代理列表解析器测试
+"""
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.parser import ProxyListParser, parse_proxy_list
+
+
+def addresses(data, **kwargs):
+    return list(parse_proxy_list(data, **kwargs).addresses())
+
+
+def test_plain_lines():
+    assert addresses(b"1.2.3.4:80\n5.6.7.8:8080\n") == [("1.2.3.4:80", "http"), ("5.6.7.8:8080", "http")]
+
+
+def test_leading_zero_octets_are_decimal():
+    # inet_aton 会把 010 读成 8，08/09 直接报错
+    assert addresses(b"010.001.008.009:80\n1.2.3.4:81\n") == [("10.1.8.9:80", "http"), ("1.2.3.4:81", "http")]
+
+
+def test_out_of_range_lines_are_dropped():
+    data = b"256.1.1.1:80\n1.2.3.4:80\n1.2.3.999:80\n1.2.3.4:65536\n5.6.7.8:65535\n"
+    assert addresses(data) == [("1.2.3.4:80", "http"), ("5.6.7.8:65535", "http")]
+
+
+def test_out_of_range_with_leading_zeros():
+    assert addresses(b"1.2.3.0256:80\n01.2.3.4:80\n") == [("1.2.3.4:80", "http")]
+
+
+def test_crlf_lines():
+    assert addresses(b"1.2.3.4:80\r\n5.6.7.8:3128\r\n") == [("1.2.3.4:80", "http"), ("5.6.7.8:3128", "http")]
+
+
+def test_invalid_lines_are_skipped():
+    data = b"# comment\n\nexample.com:80\n1.2.3:80\n1.2.3.4:0\n  1.2.3.4:80  \n"
+    assert addresses(data) == [("1.2.3.4:80", "http")]
+
+
+def test_scheme_prefix_ignored_by_default():
+    assert addresses(b"socks5://1.2.3.4:1080\n", default_protocol='socks4') == [("1.2.3.4:1080", "socks4")]
+
+
+def test_scheme_prefix_honored():
+    data = b"socks5://1.2.3.4:1080\nhttps://5.6.7.8:443\n9.9.9.9:80\n"
+    assert addresses(data, honor_scheme=True) == [
+        ("1.2.3.4:1080", "socks5"), ("5.6.7.8:443", "https"), ("9.9.9.9:80", "http")
+    ]
+
+
+def test_lines_split_across_chunks():
+    data = b"1.2.3.4:80\n05.6.7.8:8080\n9.9.9.9:3128"
+    parser = ProxyListParser()
+    for offset in range(0, len(data), 3):
+        parser.feed(data[offset:offset + 3])
+    assert list(parser.close().addresses()) == [
+        ("1.2.3.4:80", "http"), ("5.6.7.8:8080", "http"), ("9.9.9.9:3128", "http")
+    ]
+
+
+def test_carry_tail_across_parsers():
+    first = ProxyListParser()
+    first.feed(b"1.2.3.4:80\n5.6.7")
+    second = ProxyListParser()
+    second.carry_tail(first)
+    second.feed(b".8:8080\n")
+    assert list(first.close().addresses()) == [("1.2.3.4:80", "http")]
+    assert list(second.close().addresses()) == [("5.6.7.8:8080", "http")]
@@ -0,0 +1,179 @@
+"""
+自适应并发控制器
+基于AIMD(加性增、乘性减)动态调整验证并发窗口
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from loguru import logger
+import sys
+import os
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块
+    resource = None
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from setting import (
+    VALIDATE_TIMEOUT, MAX_CONCURRENT_TASKS, CONCURRENCY_MIN, CONCURRENCY_MAX,
+    CONCURRENCY_INCREASE_STEP, CONCURRENCY_DECREASE_FACTOR, CONCURRENCY_TIMEOUT_RATIO_DELTA,
+    CONCURRENCY_LOOP_LAG_LIMIT, CONCURRENCY_FD_RESERVE, CONCURRENCY_FDS_PER_TASK
+)
+
+
+def fd_limited_window(reserve=CONCURRENCY_FD_RESERVE, fds_per_task=CONCURRENCY_FDS_PER_TASK):
+    """根据文件描述符上限计算可用的最大并发数"""
+    if resource is None:
+        return CONCURRENCY_MAX
+    try:
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    except (ValueError, OSError):
+        return CONCURRENCY_MAX
+    if soft == resource.RLIM_INFINITY:
+        return CONCURRENCY_MAX
+    return max(1, (soft - reserve) // fds_per_task)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD自适应并发控制器
+
+    超时比例和事件循环延迟保持健康时窗口线性增长，任一指标恶化时窗口按比例收缩。
+    超时比例与健康期的基线比较，避免免费代理本身的高死亡率被误判为主机过载。
+    窗口状态在多次运行(多个事件循环)之间保留。
+    """
+
+    def __init__(self, timeout=VALIDATE_TIMEOUT, initial=MAX_CONCURRENT_TASKS,
+                 min_window=CONCURRENCY_MIN, max_window=CONCURRENCY_MAX):
+        self.timeout = timeout
+        self.min_window = max(1, min_window)
+        self.max_window = max(self.min_window, min(max_window, fd_limited_window()))
+        self.window = min(max(initial, self.min_window), self.max_window)
+        self.in_flight = 0
+        self.loop_lag = 0.0
+        self.timeout_ratio = 0.0
+        self.baseline_ratio = None
+        self.rate = 0.0
+        self.best_rate = 0.0
+        self.total_completed = 0
+
+        self._loop = None
+        self._cond = None
+        self._lag_task = None
+        self._reset_period()
+
+    def _reset_period(self):
+        """重置采样周期"""
+        self._period_start = time.monotonic()
+        self._period_completed = 0
+        self._period_timeouts = 0
+        self._period_lag = 0.0
+        self._period_saturated = False
+
+    def _ensure_loop(self):
+        """绑定当前事件循环(asyncio原语不能跨循环复用)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._cond = asyncio.Condition()
+            self.in_flight = 0
+            self._reset_period()
+            self._lag_task = loop.create_task(self._monitor_lag())
+
+    async def _monitor_lag(self, interval=0.1):
+        """监测事件循环延迟"""
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            self.loop_lag = max(0.0, loop.time() - start - interval)
+            self._period_lag = max(self._period_lag, self.loop_lag)
+
+    async def acquire(self):
+        """获取一个并发槽位"""
+        self._ensure_loop()
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < self.window)
+            self.in_flight += 1
+            if self.in_flight >= self.window:
+                self._period_saturated = True
+
+    async def release(self, timed_out=False):
+        """释放槽位并记录结果"""
+        async with self._cond:
+            self.in_flight -= 1
+            self.total_completed += 1
+            self._period_completed += 1
+            if timed_out:
+                self._period_timeouts += 1
+            if self._period_completed >= max(10, self.window // 2):
+                self._adjust()
+            # 只唤醒可用槽位数量的等待者，避免大批量任务的惊群
+            self._cond.notify(max(0, self.window - self.in_flight))
+
+    @asynccontextmanager
+    async def slot(self):
+        """并发槽位上下文，耗时达到超时阈值视为一次超时"""
+        await self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            await self.release(timed_out=time.monotonic() - start >= self.timeout)
+
+    def _adjust(self):
+        """根据采样周期的指标调整窗口"""
+        elapsed = max(time.monotonic() - self._period_start, 1e-6)
+        self.rate = self._period_completed / elapsed
+        self.best_rate = max(self.best_rate, self.rate)
+        self.timeout_ratio = self._period_timeouts / self._period_completed
+
+        if self.baseline_ratio is None:
+            self.baseline_ratio = self.timeout_ratio
+
+        degraded = (
+            self.timeout_ratio - self.baseline_ratio > CONCURRENCY_TIMEOUT_RATIO_DELTA
+            or self._period_lag > CONCURRENCY_LOOP_LAG_LIMIT
+        )
+
+        old_window = self.window
+        if degraded:
+            self.window = max(self.min_window, int(self.window * CONCURRENCY_DECREASE_FACTOR))
+        else:
+            # 健康期缓慢更新基线
+            self.baseline_ratio = 0.9 * self.baseline_ratio + 0.1 * self.timeout_ratio
+            if self._period_saturated:
+                self.window = min(self.max_window, self.window + CONCURRENCY_INCREASE_STEP)
+
+        if self.window != old_window:
+            logger.debug(
+                f"Concurrency window {old_window} -> {self.window} "
+                f"(timeout ratio: {self.timeout_ratio:.2f}, loop lag: {self._period_lag * 1000:.0f}ms, "
+                f"rate: {self.rate:.1f}/s)"
+            )
+        self._reset_period()
+
+    async def stop(self):
+        """停止延迟监测"""
+        if self._lag_task:
+            self._lag_task.cancel()
+            try:
+                await self._lag_task
+            except asyncio.CancelledError:
+                pass
+        self._lag_task = None
+        self._loop = None
+
+    def stats(self):
+        """返回当前指标"""
+        return {
+            "window": self.window,
+            "in_flight": self.in_flight,
+            "max_window": self.max_window,
+            "timeout_ratio": round(self.timeout_ratio, 3),
+            "loop_lag_ms": round(self.loop_lag * 1000, 1),
+            "rate": round(self.rate, 1),
+            "best_rate": round(self.best_rate, 1),
+            "completed": self.total_completed
+        }
@@ -0,0 +1,43 @@
+"""
+一致性哈希环
+按 ip:port 把代理稳定地划分到分片
+"""
+import bisect
+import hashlib
+
+
+def hash_key(key):
+    """计算键的64位哈希值"""
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """带虚拟节点的一致性哈希环"""
+
+    def __init__(self, nodes, replicas=100):
+        self.replicas = replicas
+        self._ring = []
+        self._nodes = {}
+        for node in nodes:
+            self.add_node(node)
+
+    def add_node(self, node):
+        """添加节点"""
+        for i in range(self.replicas):
+            point = hash_key(f"{node}#{i}")
+            self._nodes[point] = node
+            bisect.insort(self._ring, point)
+
+    def remove_node(self, node):
+        """移除节点"""
+        for i in range(self.replicas):
+            point = hash_key(f"{node}#{i}")
+            if self._nodes.pop(point, None) is not None:
+                self._ring.remove(point)
+
+    def get_node(self, key):
+        """获取键所属的节点"""
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._ring, hash_key(key)) % len(self._ring)
+        return self._nodes[self._ring[index]]
@@ -0,0 +1,86 @@
+"""
+代理检查历史
+最近64次检查结果按位存储，最近16次成功检查的延迟按4位分桶存储，每项都是一个64位整数
+"""
+import bisect
+import math
+
+HISTORY_SIZE = 64
+LATENCY_SLOTS = 16
+_MASK = (1 << 64) - 1
+
+# 延迟分桶上界(秒)，分桶编号从1开始，0表示空槽；超出最后一档的计入最后一档
+LATENCY_BUCKETS = (0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 4.0, 5.0, 7.0, 10.0, 15.0, 30.0)
+
+RANK_MODES = ('score', 'success_rate', 'latency')
+
+
+def to_signed(value):
+    """无符号64位转有符号，使Redis以整数编码存储"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def from_signed(value):
+    """读取Redis中存储的64位整数"""
+    return int(value or 0) & _MASK
+
+
+def push_outcome(history, success):
+    """在历史中追加一次检查结果，最低位为最近一次"""
+    return ((history << 1) | int(bool(success))) & _MASK
+
+
+def latency_bucket(seconds):
+    """延迟对应的分桶编号(1-15)"""
+    return min(bisect.bisect_left(LATENCY_BUCKETS, seconds), len(LATENCY_BUCKETS) - 1) + 1
+
+
+def push_latency(latency, seconds):
+    """在延迟槽中追加一次延迟，最低4位为最近一次"""
+    return ((latency << 4) | latency_bucket(seconds)) & _MASK
+
+
+def success_rate(history, checks):
+    """窗口内成功率，无检查记录时返回None"""
+    window = min(int(checks or 0), HISTORY_SIZE)
+    if not window:
+        return None
+    return bin(history & ((1 << window) - 1)).count('1') / window
+
+
+def success_lower_bound(history, checks, z=1.96):
+    """
+    窗口内成功率的Wilson下界
+
+    检查次数越少下界越低，"200次中成功90%"排在"最近5次全部成功"之前
+    """
+    window = min(int(checks or 0), HISTORY_SIZE)
+    if not window:
+        return 0.0
+    rate = success_rate(history, checks)
+    denominator = 1 + z * z / window
+    center = rate + z * z / (2 * window)
+    margin = z * math.sqrt(rate * (1 - rate) / window + z * z / (4 * window * window))
+    return (center - margin) / denominator
+
+
+def latency_percentile(latency, percentile=0.9):
+    """延迟槽中的分位延迟(分桶上界，秒)，无记录时返回None"""
+    buckets = sorted(
+        bucket for bucket in ((latency >> (4 * i)) & 0xf for i in range(LATENCY_SLOTS)) if bucket
+    )
+    if not buckets:
+        return None
+    index = min(len(buckets) - 1, math.ceil(percentile * len(buckets)) - 1)
+    return LATENCY_BUCKETS[buckets[index] - 1]
+
+
+def quality(history, checks, latency, timing=None):
+    """代理质量摘要，timing 为各阶段耗时的滑动平均(秒)"""
+    rate = success_rate(history, checks)
+    return {
+        "checks": int(checks or 0),
+        "success_rate": round(rate, 3) if rate is not None else None,
+        "latency_p90": latency_percentile(latency),
+        "phases_ms": {phase: int(seconds * 1000) for phase, seconds in timing.items()} if timing else None
+    }
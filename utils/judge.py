@@ -0,0 +1,62 @@
+"""
+判定工具
+根据判定站点回显的来源IP和请求头划分代理匿名度
+"""
+import re
+
+ANONYMITY_LEVELS = ['transparent', 'anonymous', 'elite']
+
+# 代理可能添加的、暴露代理身份的请求头
+PROXY_HEADERS = (
+    'via', 'forwarded', 'x-forwarded-for', 'x-forwarded-host', 'x-forwarded-proto',
+    'x-real-ip', 'x-proxy-id', 'proxy-connection', 'client-ip', 'x-client-ip', 'x-originating-ip'
+)
+
+# 请求头中的地址列表按逗号、分号或空白分隔，如 X-Forwarded-For: a, b 或 Forwarded: for=a;proto=http
+_TOKEN_SEPARATORS = re.compile(r'[,;\s]+')
+
+
+def _addresses(value):
+    """从来源IP或请求头的值中取出各个地址，去掉 for= 前缀、引号、IPv6方括号和端口"""
+    addresses = set()
+    for token in _TOKEN_SEPARATORS.split(value):
+        token = token.strip('"\'')
+        if token.lower().startswith('for='):
+            token = token[4:].strip('"\'')
+        if token.startswith('['):
+            token = token[1:token.find(']')] if ']' in token else token[1:]
+        elif token.count(':') == 1:
+            token = token.split(':', 1)[0]
+        if token:
+            addresses.add(token)
+    return addresses
+
+
+def classify_anonymity(payload, real_ip=None):
+    """
+    划分代理匿名度
+
+    Args:
+        payload: 判定站点返回的JSON，包含 origin 和 headers
+        real_ip: 本机公网IP，未知时无法识别透明代理
+
+    Returns:
+        transparent: 泄露本机IP
+        anonymous: 未泄露本机IP，但暴露了代理身份
+        elite: 既不泄露IP也不暴露代理身份
+    """
+    headers = {key.lower(): str(value) for key, value in (payload.get('headers') or {}).items()}
+    origin = str(payload.get('origin') or '')
+
+    if real_ip and (real_ip in _addresses(origin) or any(real_ip in _addresses(value) for value in headers.values())):
+        return 'transparent'
+    if any(header in headers for header in PROXY_HEADERS):
+        return 'anonymous'
+    return 'elite'
+
+
+def anonymity_at_least(level, minimum):
+    """判断匿名度是否不低于指定级别"""
+    if level not in ANONYMITY_LEVELS or minimum not in ANONYMITY_LEVELS:
+        return False
+    return ANONYMITY_LEVELS.index(level) >= ANONYMITY_LEVELS.index(minimum)
@@ -0,0 +1,250 @@
+"""
+判定站点池
+按权重轮询分散验证请求，跟踪各站点的健康状况和延迟，故障站点自动剔除
+"""
+import asyncio
+import time
+import aiohttp
+from loguru import logger
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from setting import (
+    JUDGE_POOL, JUDGE_URL, VALIDATE_URLS, JUDGE_HEALTH_INTERVAL, JUDGE_HEALTH_TIMEOUT, JUDGE_MAX_LATENCY,
+    JUDGE_EJECT_AFTER, JUDGE_EJECT_TIME, JUDGE_EJECT_MAX, JUDGE_SUSPECT_AFTER, JUDGE_OUTLIER_WINDOW,
+    JUDGE_OUTLIER_MIN_CHECKS, JUDGE_OUTLIER_MIN_EXPECTED, JUDGE_OUTLIER_RATIO
+)
+
+# 延迟滑动平均系数
+LATENCY_EWMA_ALPHA = 0.3
+
+
+class Judge:
+    """单个判定站点的状态"""
+
+    def __init__(self, url, weight=1, echo=False):
+        self.url = url
+        self.weight = max(1, int(weight))
+        self.echo = echo
+        self.current_weight = 0
+        self.latency = None  # 直连延迟的滑动平均(秒)
+        self.checks = 0
+        self.failures = 0
+        self.consecutive_failures = 0  # 经代理访问的连续失败次数
+        self.health_failures = 0  # 连续健康检查失败次数
+        self.window_checks = 0  # 当前离群统计窗口内经代理的访问次数
+        self.window_failures = 0
+        self.ejections = 0
+        self.outlier_ejections = 0
+        self.ejected_until = 0.0
+
+    @property
+    def healthy(self):
+        return time.time() >= self.ejected_until
+
+    def stats(self):
+        """站点指标"""
+        return {
+            "healthy": int(self.healthy),
+            "weight": self.weight,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else -1,
+            "checks": self.checks,
+            "failures": self.failures,
+            "ejections": self.ejections,
+            "outlier_ejections": self.outlier_ejections
+        }
+
+
+class JudgePool:
+    """
+    判定站点池
+
+    选择: 平滑加权轮询，只在健康站点间轮询
+    健康: 定期直连检查，连续失败或延迟超过 JUDGE_MAX_LATENCY 达到 JUDGE_EJECT_AFTER 次后剔除，
+          剔除时长按次数翻倍；经代理访问连续失败过多时提前检查
+    离群: 每 JUDGE_OUTLIER_WINDOW 秒比较各站点经代理访问的成功率，明显低于其他站点的剔除。
+          各站点按轮询面对同一批代理，失败率的差异来自站点本身(如对代理流量限速)
+    """
+
+    def __init__(self, judges):
+        self.judges = {judge.url: judge for judge in judges}
+        self.last_health_check = 0.0
+        self.window_started = time.time()
+        self._health_lock = None
+        self._health_loop = None
+
+    @classmethod
+    def from_settings(cls):
+        """按配置创建站点池"""
+        if JUDGE_POOL:
+            entries = JUDGE_POOL
+        elif JUDGE_URL:
+            entries = [{"url": JUDGE_URL, "echo": True}]
+        else:
+            entries = [{"url": url} for url in VALIDATE_URLS]
+        return cls([Judge(entry["url"], entry.get("weight", 1), entry.get("echo", False)) for entry in entries])
+
+    def is_echo(self, url):
+        """站点是否回显请求，可用于划分匿名度"""
+        judge = self.judges.get(url)
+        return bool(judge and judge.echo)
+
+    def healthy(self, url):
+        """站点当前是否健康"""
+        judge = self.judges.get(url)
+        return judge is None or judge.healthy
+
+    def _next(self, candidates):
+        """平滑加权轮询选出一个站点"""
+        total = sum(judge.weight for judge in candidates)
+        for judge in candidates:
+            judge.current_weight += judge.weight
+        best = max(candidates, key=lambda judge: judge.current_weight)
+        best.current_weight -= total
+        return best
+
+    def pick(self, count=2):
+        """选出至多 count 个不同的健康站点，全部被剔除时返回空列表"""
+        candidates = [judge for judge in self.judges.values() if judge.healthy]
+        picked = []
+        while candidates and len(picked) < count:
+            judge = self._next(candidates)
+            picked.append(judge.url)
+            candidates.remove(judge)
+        return picked
+
+    def record(self, url, success):
+        """记录一次经代理的访问结果"""
+        judge = self.judges.get(url)
+        if judge is None:
+            return
+        judge.checks += 1
+        judge.window_checks += 1
+        if time.time() - self.window_started >= JUDGE_OUTLIER_WINDOW:
+            self._eject_outliers()
+        if success:
+            judge.consecutive_failures = 0
+            return
+        judge.failures += 1
+        judge.window_failures += 1
+        judge.consecutive_failures += 1
+        if judge.consecutive_failures >= JUDGE_SUSPECT_AFTER:
+            # 连续失败可能是站点本身的问题，下次调用 maybe_check_health 时立即检查
+            judge.consecutive_failures = 0
+            self.last_health_check = 0.0
+
+    def _eject(self, judge):
+        """剔除站点"""
+        judge.ejections += 1
+        duration = min(JUDGE_EJECT_TIME * 2 ** (judge.ejections - 1), JUDGE_EJECT_MAX)
+        judge.ejected_until = time.time() + duration
+        judge.health_failures = 0
+        logger.warning(f"Judge {judge.url} ejected for {duration}s")
+
+    def _eject_outliers(self):
+        """
+        剔除成功率低于其他健康站点 JUDGE_OUTLIER_RATIO 倍的站点，然后开始新的统计窗口
+
+        只比较样本足够的健康站点，至少要有一个其他站点作对照，且不会剔除最后一个健康站点。
+        """
+        sampled = [
+            judge for judge in self.judges.values()
+            if judge.healthy and judge.window_checks >= JUDGE_OUTLIER_MIN_CHECKS
+        ]
+        success = {judge.url: judge.window_checks - judge.window_failures for judge in sampled}
+        total_checks = sum(judge.window_checks for judge in sampled)
+        total_success = sum(success.values())
+        healthy = sum(1 for judge in self.judges.values() if judge.healthy)
+        for judge in sorted(sampled, key=lambda judge: success[judge.url] / judge.window_checks):
+            peer_checks = total_checks - judge.window_checks
+            if not peer_checks or healthy <= 1:
+                break
+            rate = success[judge.url] / judge.window_checks
+            peer_rate = (total_success - success[judge.url]) / peer_checks
+            if peer_rate * judge.window_checks < JUDGE_OUTLIER_MIN_EXPECTED or rate >= peer_rate * JUDGE_OUTLIER_RATIO:
+                break
+            logger.warning(
+                f"Judge {judge.url} success rate {rate:.1%} is an outlier against peers ({peer_rate:.1%})"
+            )
+            judge.outlier_ejections += 1
+            self._eject(judge)
+            healthy -= 1
+            total_checks, total_success = peer_checks, total_success - success[judge.url]
+
+        for judge in self.judges.values():
+            judge.window_checks = 0
+            judge.window_failures = 0
+        self.window_started = time.time()
+
+    async def _check_judge(self, session, judge):
+        """直连检查一个站点"""
+        start = time.monotonic()
+        try:
+            timeout = aiohttp.ClientTimeout(total=JUDGE_HEALTH_TIMEOUT)
+            async with session.get(judge.url, timeout=timeout) as response:
+                await response.read()
+                ok = response.status == 200
+        except Exception as e:
+            logger.debug(f"Judge {judge.url} health check failed: {e}")
+            ok = False
+        latency = time.monotonic() - start
+
+        if ok:
+            judge.latency = latency if judge.latency is None else \
+                judge.latency + LATENCY_EWMA_ALPHA * (latency - judge.latency)
+        if ok and latency <= JUDGE_MAX_LATENCY:
+            judge.health_failures = 0
+            if judge.ejections and time.time() - judge.ejected_until > JUDGE_EJECT_MAX:
+                # 恢复后稳定运行一段时间，重置剔除时长
+                judge.ejections = 0
+            return
+
+        judge.health_failures += 1
+        if judge.health_failures >= JUDGE_EJECT_AFTER and judge.healthy:
+            self._eject(judge)
+
+    async def discover_real_ip(self, session):
+        """
+        直连回显站点获取本机公网IP，用于识别透明代理
+
+        健康站点优先，依次尝试直到成功；池中没有回显站点或全部失败时返回 None
+        """
+        echo_judges = sorted(
+            (judge for judge in self.judges.values() if judge.echo), key=lambda judge: not judge.healthy
+        )
+        timeout = aiohttp.ClientTimeout(total=JUDGE_HEALTH_TIMEOUT)
+        for judge in echo_judges:
+            try:
+                async with session.get(judge.url, timeout=timeout) as response:
+                    payload = await response.json(content_type=None)
+                    real_ip = payload.get('origin')
+            except Exception as e:
+                logger.warning(f"Failed to discover real IP from judge {judge.url}: {e}")
+                continue
+            if real_ip:
+                logger.info(f"Real IP seen by judge {judge.url}: {real_ip}")
+                return real_ip
+        return None
+
+    async def maybe_check_health(self, session):
+        """距上次检查超过 JUDGE_HEALTH_INTERVAL 时直连检查所有站点"""
+        if time.time() - self.last_health_check < JUDGE_HEALTH_INTERVAL:
+            return
+        loop = asyncio.get_running_loop()
+        if self._health_loop is not loop:
+            self._health_loop = loop
+            self._health_lock = asyncio.Lock()
+        if self._health_lock.locked():
+            return
+        async with self._health_lock:
+            self.last_health_check = time.time()
+            await asyncio.gather(*(self._check_judge(session, judge) for judge in self.judges.values()))
+
+    def stats(self):
+        """各站点指标，键为 {序号}_{指标}"""
+        metrics = {"judges": len(self.judges), "healthy": sum(1 for judge in self.judges.values() if judge.healthy)}
+        for index, judge in enumerate(self.judges.values()):
+            metrics[f"{index}_url"] = judge.url
+            metrics.update({f"{index}_{name}": value for name, value in judge.stats().items()})
+        return metrics
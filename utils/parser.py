@@ -0,0 +1,152 @@
+"""
+代理列表解析器
+按块流式解析 ip:port 列表，结果以紧凑数组保存，不为每行创建对象
+"""
+import re
+import socket
+import sys
+from array import array
+from operator import itemgetter
+
+PROTOCOLS = ('http', 'https', 'socks4', 'socks5')
+
+# 一行一个代理，可带协议前缀，行首行尾允许空白；不匹配的行(注释、空行、域名等)直接跳过。
+# 八位组和端口的范围不在正则里检查(会让匹配慢一倍)，由整块转换时检查
+LINE_PATTERN = re.compile(
+    r'^[ \t]*(?:(https?|socks[45])://)?(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}):([1-9]\d{0,4})[ \t\r]*$',
+    re.MULTILINE
+)
+
+# 带前导零的八位组: inet_aton 会按八进制解析(08、09 直接报错)，含这种八位组的块改用十进制逐个转换。
+# 在以 '.' 连接的地址上查找，每个八位组前都有 '.'
+LEADING_ZERO = re.compile(r'\.0\d')
+
+_scheme, _ip, _port = itemgetter(0), itemgetter(1), itemgetter(2)
+
+
+def _in_range(match):
+    """八位组不超过255且端口不超过65535"""
+    return int(match[2]) < 65536 and all(int(octet) < 256 for octet in match[1].split('.'))
+
+
+def _ip_to_int(ip):
+    """点分十进制转换为32位整数，八位组按十进制解析，越界时抛出 ValueError"""
+    a, b, c, d = map(int, ip.split('.'))
+    if (a | b | c | d) > 255:
+        raise ValueError(ip)
+    return (a << 24) | (b << 16) | (c << 8) | d
+
+
+def format_ip(ip):
+    """把32位整数形式的IPv4地址转换为点分十进制"""
+    return f"{ip >> 24}.{(ip >> 16) & 0xFF}.{(ip >> 8) & 0xFF}.{ip & 0xFF}"
+
+
+class ProxyListParser:
+    """
+    流式代理列表解析器
+
+    feed() 接收任意切分的字节块，只解析完整的行，不完整的末行留到下一块；close() 处理最后一行。
+    结果保存在三个数组中: ips(32位整数)、ports、protocols(PROTOCOLS 或默认协议的序号)。
+
+    Args:
+        default_protocol: 行内没有协议前缀时使用的协议
+        honor_scheme: 是否采用行内的协议前缀，为 False 时所有代理都使用默认协议
+    """
+
+    def __init__(self, default_protocol='http', honor_scheme=False):
+        self.protocols = list(PROTOCOLS)
+        if default_protocol not in self.protocols:
+            self.protocols.append(default_protocol)
+        self.default_code = self.protocols.index(default_protocol)
+        self.scheme_codes = {}
+        if honor_scheme:
+            self.scheme_codes = {scheme: code for code, scheme in enumerate(PROTOCOLS)}
+            self.scheme_codes[''] = self.default_code
+        self.ips = array('I')
+        self.ports = array('H')
+        self.codes = array('B')
+        self._tail = b''
+
+    @staticmethod
+    def _convert(matches, decimal):
+        """整块转换地址和端口，越界时抛出 ValueError 或 OverflowError"""
+        if decimal:
+            ips = array('I', map(_ip_to_int, map(_ip, matches)))
+        else:
+            ips = array('I', b''.join(map(socket.inet_aton, map(_ip, matches))))
+            if sys.byteorder == 'little':
+                ips.byteswap()
+        return ips, array('H', map(int, map(_port, matches)))
+
+    def _parse(self, block):
+        """解析只包含完整行的块，整块转换为数组"""
+        matches = LINE_PATTERN.findall(block.decode('latin-1'))
+        if not matches:
+            return
+        decimal = LEADING_ZERO.search('.' + '.'.join(map(_ip, matches))) is not None
+        try:
+            ips, ports = self._convert(matches, decimal)
+        except (ValueError, OSError, OverflowError):
+            # 块内有越界的地址或端口，过滤后重新转换
+            matches = [match for match in matches if _in_range(match)]
+            ips, ports = self._convert(matches, decimal)
+
+        self.ips.extend(ips)
+        self.ports.extend(ports)
+        if self.scheme_codes:
+            self.codes.extend(map(self.scheme_codes.__getitem__, map(_scheme, matches)))
+        else:
+            self.codes.frombytes(bytes((self.default_code,)) * len(matches))
+
+    def feed(self, chunk):
+        """解析一块数据"""
+        data = self._tail + chunk if self._tail else chunk
+        cut = data.rfind(b'\n')
+        if cut < 0:
+            self._tail = data
+            return
+        self._tail = data[cut + 1:]
+        self._parse(data[:cut])
+
+    def close(self):
+        """解析最后一行，返回解析器本身"""
+        if self._tail:
+            self._parse(self._tail)
+            self._tail = b''
+        return self
+
+    def carry_tail(self, other):
+        """接过 other 还没解析的不完整末行，在本解析器中接着解析；用于分批产出时换用新的解析器"""
+        self._tail, other._tail = other._tail, b''
+
+    def extend(self, other):
+        """合并另一个使用相同协议表的解析器的结果"""
+        if other.protocols != self.protocols:
+            raise ValueError("Parsers use different protocol tables")
+        self.ips.extend(other.ips)
+        self.ports.extend(other.ports)
+        self.codes.extend(other.codes)
+
+    def __len__(self):
+        return len(self.ips)
+
+    def entries(self):
+        """依次返回 (ip整数, 端口, 协议)"""
+        protocols = self.protocols
+        for ip, port, code in zip(self.ips, self.ports, self.codes):
+            yield ip, port, protocols[code]
+
+    def addresses(self):
+        """依次返回 ("ip:port", 协议)"""
+        protocols = self.protocols
+        for ip, port, code in zip(self.ips, self.ports, self.codes):
+            yield f"{format_ip(ip)}:{port}", protocols[code]
+
+
+def parse_proxy_list(data, default_protocol='http', honor_scheme=False, chunk_size=1 << 16):
+    """解析完整的字节串，按 chunk_size 分块以限制单次正则匹配的内存"""
+    parser = ProxyListParser(default_protocol, honor_scheme)
+    for offset in range(0, len(data), chunk_size):
+        parser.feed(data[offset:offset + chunk_size])
+    return parser.close()
@@ -0,0 +1,176 @@
+"""
+代理探测工具
+在完整HTTP验证之前用裸TCP连接快速淘汰死代理
+"""
+import asyncio
+import socket
+import struct
+import time
+from typing import List, Tuple
+from urllib.parse import urlparse
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from setting import PRECHECK_TIMEOUT, VALIDATE_URLS
+
+# SOCKS4 预检的目标，取第一个验证地址
+_target = urlparse(VALIDATE_URLS[0])
+PROBE_TARGET_HOST = _target.hostname
+PROBE_TARGET_PORT = _target.port or (443 if _target.scheme == 'https' else 80)
+
+SOCKS5_GREETING = b'\x05\x01\x00'  # 版本5，1种认证方式: 无认证
+
+# 协议未知时的占位协议，由 detect_protocols 确定实际协议
+AUTO_PROTOCOL = 'auto'
+
+
+def socks4_connect_request(host=PROBE_TARGET_HOST, port=PROBE_TARGET_PORT):
+    """构造SOCKS4a CONNECT请求(由代理解析域名)"""
+    try:
+        return b'\x04\x01' + struct.pack('>H', port) + socket.inet_aton(host) + b'\x00'
+    except OSError:
+        return b'\x04\x01' + struct.pack('>H', port) + b'\x00\x00\x00\x01\x00' + host.encode() + b'\x00'
+
+
+async def _close(writer):
+    """关闭连接，忽略异常"""
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except Exception:
+        pass
+
+
+async def tcp_precheck(host: str, port: int, protocol: str = 'http',
+                       timeout: float = PRECHECK_TIMEOUT) -> Tuple[str, float]:
+    """
+    TCP预检
+
+    建立裸TCP连接；SOCKS5额外完成握手问候，SOCKS4发送CONNECT请求并检查应答格式。
+
+    Returns:
+        (结果分类, 耗时秒数)，结果分类为 'success' / 'refused' / 'timeout' / 'handshake_failed'
+    """
+    start = time.monotonic()
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+
+        if protocol == 'socks5':
+            writer.write(SOCKS5_GREETING)
+            await writer.drain()
+            reply = await asyncio.wait_for(reader.readexactly(2), timeout)
+            if reply[0] != 0x05 or reply[1] == 0xff:
+                return 'handshake_failed', time.monotonic() - start
+        elif protocol == 'socks4':
+            writer.write(socks4_connect_request())
+            await writer.drain()
+            reply = await asyncio.wait_for(reader.readexactly(8), timeout)
+            # 无论是否允许连接，格式正确的应答都说明对端是SOCKS4服务
+            if reply[0] != 0x00 or not 0x5a <= reply[1] <= 0x5d:
+                return 'handshake_failed', time.monotonic() - start
+
+        return 'success', time.monotonic() - start
+    except asyncio.TimeoutError:
+        return 'timeout', time.monotonic() - start
+    except ConnectionRefusedError:
+        return 'refused', time.monotonic() - start
+    except (OSError, asyncio.IncompleteReadError):
+        # 连接被重置或握手中途关闭
+        return 'handshake_failed', time.monotonic() - start
+    finally:
+        if writer:
+            await _close(writer)
+
+
+async def _socks5_greeting(host, port, timeout):
+    """单独发送SOCKS5问候，判断对端是否接受无认证的SOCKS5"""
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        writer.write(SOCKS5_GREETING)
+        await writer.drain()
+        reply = await asyncio.wait_for(reader.readexactly(2), timeout)
+        return reply[0] == 0x05 and reply[1] != 0xff
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+        return False
+    finally:
+        if writer:
+            await _close(writer)
+
+
+async def _http_request(host, port, timeout):
+    """单独发送一个完整的HTTP代理请求，判断对端是否为等待完整请求才应答的HTTP代理"""
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        writer.write(
+            f"HEAD http://{PROBE_TARGET_HOST}:{PROBE_TARGET_PORT}/ HTTP/1.1\r\n"
+            f"Host: {PROBE_TARGET_HOST}\r\nConnection: close\r\n\r\n".encode()
+        )
+        await writer.drain()
+        reply = await asyncio.wait_for(reader.read(16), timeout)
+        return reply.startswith(b'HTTP/')
+    except (OSError, asyncio.TimeoutError):
+        return False
+    finally:
+        if writer:
+            await _close(writer)
+
+
+async def detect_protocols(host: str, port: int,
+                           timeout: float = PRECHECK_TIMEOUT) -> Tuple[List[str], str, float]:
+    """
+    探测代理支持的协议
+
+    发送SOCKS4 CONNECT请求并紧跟一个空行，根据第一段应答区分:
+    SOCKS4应答(0x00 0x5a-0x5d)、HTTP应答(HTTP代理把它当作错误请求立即返回400)、
+    SOCKS5应答(版本号0x05)。对端直接关闭连接，或者是同时支持SOCKS5的SOCKS4服务时，
+    再用SOCKS5问候确认一次。连接建立后对端一直不应答时(有的HTTP代理要等到完整请求才回应)，
+    依次尝试SOCKS5问候和完整的HTTP请求。
+
+    Returns:
+        (协议列表, 结果分类, 耗时秒数)，结果分类含义同 tcp_precheck
+    """
+    start = time.monotonic()
+    writer = None
+    silent = False
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except asyncio.TimeoutError:
+        return [], 'timeout', time.monotonic() - start
+    except ConnectionRefusedError:
+        return [], 'refused', time.monotonic() - start
+    except OSError:
+        return [], 'handshake_failed', time.monotonic() - start
+    try:
+        writer.write(socks4_connect_request() + b'\r\n\r\n')
+        await writer.drain()
+        reply = await asyncio.wait_for(reader.read(64), timeout)
+    except asyncio.TimeoutError:
+        reply = b''
+        silent = True
+    except ConnectionRefusedError:
+        return [], 'refused', time.monotonic() - start
+    except OSError:
+        reply = b''
+    finally:
+        if writer:
+            await _close(writer)
+
+    if reply.startswith(b'HTTP/'):
+        protocols = ['http']
+    elif reply[:1] == b'\x05':
+        protocols = ['socks5']
+    elif len(reply) >= 2 and reply[0] == 0x00 and 0x5a <= reply[1] <= 0x5d:
+        protocols = ['socks4']
+        if await _socks5_greeting(host, port, timeout):
+            protocols.append('socks5')
+    elif await _socks5_greeting(host, port, timeout):
+        protocols = ['socks5']
+    elif silent and await _http_request(host, port, timeout):
+        protocols = ['http']
+    else:
+        return [], 'timeout' if silent else 'handshake_failed', time.monotonic() - start
+    return protocols, 'success', time.monotonic() - start
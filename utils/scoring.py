@@ -0,0 +1,80 @@
+"""
+评分与复检策略
+根据验证结果计算新分数和下次复检时间
+"""
+import random
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from setting import (
+    PROXY_SCORE_MAX, PROXY_SCORE_MIN, VALIDATE_SLO, RETEST_INTERVAL_HIGH,
+    RETEST_INTERVAL_MID, RETEST_INTERVAL_LOW, RETEST_NEW_PROXY_AGE,
+    SCORE_POLICY, SLOW_RESPONSE_THRESHOLD, RETEST_BACKOFF_AFTER, RETEST_BACKOFF_MAX
+)
+
+SUCCESS_OUTCOMES = ('success', 'slow_success')
+FAILURE_OUTCOMES = ('refused', 'timeout', 'handshake_failed', 'bad_status')
+# 与代理无关的失败，不计入分数和检查历史
+NEUTRAL_OUTCOMES = ('judge_fault',)
+
+
+def success_outcome(response_time):
+    """按响应时间区分成功和慢速成功"""
+    if response_time is not None and response_time > SLOW_RESPONSE_THRESHOLD:
+        return 'slow_success'
+    return 'success'
+
+
+def least_severe(outcomes):
+    """从多个验证结果中取扣分最少的一个(如多URL检查的结果合并)"""
+    return max(outcomes, key=lambda outcome: SCORE_POLICY.get(outcome, 0))
+
+
+def result_outcome(result):
+    """获取验证结果的分类，兼容只有 success 字段的结果"""
+    outcome = result.get('outcome')
+    if outcome:
+        return outcome
+    return 'success' if result.get('success') else 'timeout'
+
+
+def next_score(score, outcome):
+    """按评分策略计算验证后的新分数"""
+    score += SCORE_POLICY.get(outcome, 0)
+    return max(PROXY_SCORE_MIN, min(score, PROXY_SCORE_MAX))
+
+
+def retest_interval(score, age, fail_streak):
+    """
+    计算复检间隔(秒)
+
+    Args:
+        score: 当前分数
+        age: 代理入池时长(秒)
+        fail_streak: 连续失败次数
+
+    Returns:
+        复检间隔；连续失败未达 RETEST_BACKOFF_AFTER 次时不超过 VALIDATE_SLO，
+        之后按指数退避，不超过 RETEST_BACKOFF_MAX
+    """
+    if score >= 60:
+        interval = RETEST_INTERVAL_HIGH
+    elif score >= 30:
+        interval = RETEST_INTERVAL_MID
+    else:
+        interval = RETEST_INTERVAL_LOW
+
+    # 新入池的代理尽快确认可用性
+    if age < RETEST_NEW_PROXY_AGE:
+        interval /= 2
+
+    # 加入抖动，避免同一批代理总是同时到期
+    interval *= random.uniform(0.9, 1.1)
+
+    if fail_streak < RETEST_BACKOFF_AFTER:
+        # 偶发失败的代理逐步放缓
+        return min(interval * (1 + fail_streak), VALIDATE_SLO)
+
+    # 反复失败的代理指数退避，把验证能力留给还可能恢复的代理
+    return min(VALIDATE_SLO * 2 ** (fail_streak - RETEST_BACKOFF_AFTER + 1), RETEST_BACKOFF_MAX)
@@ -0,0 +1,134 @@
+"""
+验证请求分阶段计时
+通过 aiohttp TraceConfig 记录DNS、建连/代理握手和首字节时间
+"""
+import asyncio
+import aiohttp
+
+# dns: 解析目标或代理地址; connect: TCP建连(取自TCP预检); handshake: 连接建立中除DNS和TCP建连外的部分，
+# 即HTTP代理CONNECT隧道或SOCKS握手; ttfb: 发出请求到收到响应头; total: 整个请求
+PHASES = ('dns', 'connect', 'handshake', 'ttfb', 'total')
+
+# 单个代理各阶段耗时的指数滑动平均系数
+PHASE_EWMA_ALPHA = 0.3
+
+
+class RequestTimings:
+    """单次请求的阶段耗时(秒)，作为 trace_request_ctx 传给 aiohttp"""
+
+    def __init__(self, connect=None):
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        if connect is not None:
+            self.phases['connect'] = connect
+        self._marks = {}
+        self._loop = asyncio.get_running_loop()
+
+    def mark(self, name):
+        """记录时间点"""
+        self._marks[name] = self._loop.time()
+
+    def since(self, name):
+        """距时间点的耗时"""
+        return self._loop.time() - self._marks[name] if name in self._marks else 0.0
+
+    def finish(self):
+        """请求结束，返回各阶段耗时"""
+        self.phases['total'] = self.since('request')
+        return self.phases
+
+
+async def _on_request_start(session, ctx, params):
+    if ctx.trace_request_ctx is not None:
+        ctx.trace_request_ctx.mark('request')
+
+
+async def _on_dns_start(session, ctx, params):
+    if ctx.trace_request_ctx is not None:
+        ctx.trace_request_ctx.mark('dns')
+
+
+async def _on_dns_end(session, ctx, params):
+    timings = ctx.trace_request_ctx
+    if timings is not None:
+        timings.phases['dns'] += timings.since('dns')
+
+
+async def _on_connection_create_start(session, ctx, params):
+    if ctx.trace_request_ctx is not None:
+        ctx.trace_request_ctx.mark('connection')
+
+
+async def _on_connection_create_end(session, ctx, params):
+    timings = ctx.trace_request_ctx
+    if timings is not None:
+        elapsed = timings.since('connection') - timings.phases['dns'] - timings.phases['connect']
+        timings.phases['handshake'] = max(elapsed, 0.0)
+
+
+async def _on_request_end(session, ctx, params):
+    # 收到响应头时触发
+    if ctx.trace_request_ctx is not None:
+        ctx.trace_request_ctx.phases['ttfb'] = ctx.trace_request_ctx.since('request')
+
+
+def create_trace_config():
+    """创建记录阶段耗时的 TraceConfig，只对传入 RequestTimings 的请求生效"""
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(_on_request_start)
+    trace_config.on_dns_resolvehost_start.append(_on_dns_start)
+    trace_config.on_dns_resolvehost_end.append(_on_dns_end)
+    trace_config.on_connection_create_start.append(_on_connection_create_start)
+    trace_config.on_connection_create_end.append(_on_connection_create_end)
+    trace_config.on_request_end.append(_on_request_end)
+    return trace_config
+
+
+def encode_phases(phases):
+    """编码为逗号分隔的毫秒整数，用于存储"""
+    return ','.join(str(int(phases.get(phase, 0) * 1000)) for phase in PHASES)
+
+
+def decode_phases(value):
+    """解码存储的阶段耗时(秒)，无记录时返回None"""
+    if not value:
+        return None
+    return {phase: int(ms) / 1000 for phase, ms in zip(PHASES, value.split(','))}
+
+
+def blend_phases(previous, phases, alpha=PHASE_EWMA_ALPHA):
+    """把本次耗时并入代理的滑动平均"""
+    if previous is None:
+        return dict(phases)
+    return {phase: previous[phase] + alpha * (phases[phase] - previous[phase]) for phase in PHASES}
+
+
+class PhaseStats:
+    """按协议汇总阶段耗时"""
+
+    def __init__(self):
+        self.totals = {}
+
+    def add(self, protocol, phases):
+        """累计一次请求的阶段耗时"""
+        totals = self.totals.setdefault(protocol, dict.fromkeys(PHASES + ('count',), 0))
+        for phase in PHASES:
+            totals[phase] += phases[phase]
+        totals['count'] += 1
+
+    def merge(self, totals):
+        """合并其他进程汇总的结果"""
+        for protocol, other in totals.items():
+            mine = self.totals.setdefault(protocol, dict.fromkeys(PHASES + ('count',), 0))
+            for name, value in other.items():
+                mine[name] += value
+
+    def metrics(self):
+        """各协议各阶段平均耗时(毫秒)"""
+        metrics = {}
+        for protocol, totals in self.totals.items():
+            if not totals['count']:
+                continue
+            metrics[f"{protocol}_count"] = totals['count']
+            for phase in PHASES:
+                metrics[f"{protocol}_{phase}_ms"] = round(totals[phase] * 1000 / totals['count'], 1)
+        return metrics
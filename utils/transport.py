@@ -0,0 +1,160 @@
+"""
+验证传输层
+长期复用的 aiohttp 会话和判定站点DNS缓存
+"""
+import asyncio
+import errno
+import json
+import ssl
+from contextlib import asynccontextmanager
+import aiohttp
+from loguru import logger
+import sys
+import os
+
+try:
+    from aiohttp_socks import ProxyConnector, ProxyConnectionError, ProxyTimeoutError
+except ImportError:
+    ProxyConnector = None
+    ProxyConnectionError = ProxyTimeoutError = None
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from setting import VALIDATE_TIMEOUT, DNS_CACHE_TTL
+from utils.tracing import create_trace_config
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+}
+
+# CONNECT隧道检测校验证书: 截获TLS的代理拿不出判定站点的有效证书，无法通过检测；
+# 通过检测的代理看不到也改不了隧道内的请求，因此 https 池的代理可以记为 elite
+TUNNEL_SSL_CONTEXT = ssl.create_default_context()
+
+
+def proxy_url_for(proxy, protocol):
+    """构建代理URL"""
+    if protocol in ['socks4', 'socks5']:
+        return f"{protocol}://{proxy}"
+    return f"http://{proxy}"
+
+
+def request_ssl(protocol):
+    """请求的 ssl 参数: https 协议(CONNECT隧道检测)校验证书，其余沿用连接器设置(不校验)"""
+    return TUNNEL_SSL_CONTEXT if protocol == 'https' else True
+
+
+def classify_exception(e):
+    """
+    把验证异常归类为评分策略中的失败类型
+
+    Returns:
+        'timeout' / 'refused' / 'handshake_failed' / 'bad_status'
+    """
+    if isinstance(e, asyncio.TimeoutError):
+        return 'timeout'
+    if ProxyTimeoutError is not None and isinstance(e, ProxyTimeoutError):
+        return 'timeout'
+    if isinstance(e, ConnectionRefusedError):
+        return 'refused'
+    if ProxyConnectionError is not None and isinstance(e, ProxyConnectionError):
+        # 连不上SOCKS代理本身
+        return 'refused'
+    if isinstance(e, aiohttp.ClientConnectorError):
+        if e.os_error is not None and getattr(e.os_error, 'errno', None) == errno.ECONNREFUSED:
+            return 'refused'
+        if isinstance(e.os_error, asyncio.TimeoutError):
+            return 'timeout'
+        return 'handshake_failed'
+    if isinstance(e, (aiohttp.ContentTypeError, json.JSONDecodeError, UnicodeDecodeError)):
+        # 代理返回了响应，但内容不是判定站点的应答
+        return 'bad_status'
+    if isinstance(e, (aiohttp.ClientHttpProxyError, aiohttp.ServerDisconnectedError, ssl.SSLError)):
+        return 'handshake_failed'
+    # 其余协议层错误(SOCKS握手失败、连接被重置等)都按握手失败处理
+    return 'handshake_failed'
+
+
+class ValidationTransport:
+    """
+    验证传输层
+
+    HTTP代理共用一个会话，判定站点的DNS解析结果在连接器中缓存。
+    连接用完即关闭: 连接池按(目标, 代理)区分，一次验证访问的是两个不同的判定站点，
+    复检间隔又远长于空闲保留时间，空闲连接几乎不会被复用，只会占用并发窗口没有计入的文件描述符。
+    SOCKS代理需要专用连接器(依赖 aiohttp-socks)，在一次代理测试的多个URL检查之间共享。
+    共享会话在首次使用时绑定当前事件循环。
+    """
+
+    def __init__(self, timeout=VALIDATE_TIMEOUT):
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._loop = None
+        self._session = None
+        self._socks_warned = False
+        self._trace_config = create_trace_config()
+
+    def _new_session(self, connector):
+        """创建会话"""
+        return aiohttp.ClientSession(
+            connector=connector, timeout=self.timeout, headers=DEFAULT_HEADERS, trace_configs=[self._trace_config]
+        )
+
+    def _ensure_loop(self):
+        """事件循环变化时丢弃旧会话"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._session = None
+
+    @property
+    def session(self):
+        """HTTP代理和直连共用的会话"""
+        self._ensure_loop()
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                ssl=False,
+                limit=0,
+                use_dns_cache=True,
+                ttl_dns_cache=DNS_CACHE_TTL,
+                force_close=True
+            )
+            self._session = self._new_session(connector)
+        return self._session
+
+    @asynccontextmanager
+    async def open(self, proxy, protocol):
+        """
+        打开验证某个代理使用的会话
+
+        Yields:
+            (session, proxy参数)，SOCKS会话的proxy参数为None
+        """
+        if protocol not in ['socks4', 'socks5']:
+            yield self.session, proxy_url_for(proxy, protocol)
+            return
+
+        if ProxyConnector is None:
+            if not self._socks_warned:
+                logger.warning("aiohttp-socks not installed, SOCKS proxies cannot be validated")
+                self._socks_warned = True
+            yield self.session, proxy_url_for(proxy, protocol)
+            return
+
+        # 由代理解析目标域名，本地无需DNS
+        connector = ProxyConnector.from_url(
+            proxy_url_for(proxy, protocol), rdns=True, ssl=False, force_close=True
+        )
+        async with self._new_session(connector) as session:
+            yield session, None
+
+    async def close(self):
+        """关闭共享会话"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._loop = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()